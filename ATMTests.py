@@ -1,22 +1,101 @@
 from __future__ import annotations
 import unittest, sys, typing
+from typing import Tuple
 from Classes.ATM import ATM
 from Classes.ControllerResponse import ControllerResponse
-from Classes.SQLHelper import SQLHelper
-from threading import Event
+import Classes.ControllerResponse as responses
+from Classes.SQLHelper import SQLHelper, StaleDataError
+from Classes.ATMServer import ATMServer
+from Classes.InactivityScheduler import InactivityScheduler
+from Classes.ConnectionPool import ConnectionPool
+from Classes.WriteBehindQueue import WriteBehindQueue
+from Classes.Commands import parseCommand
+from Classes.BatchRunner import BatchRunner
+from Classes.AccountCache import AccountCache
+from Classes.Reconciler import Reconciler
+from Classes.Metrics import Metrics
+from Classes import BulkIO, Pins
+from Classes.LoginThrottle import LoginThrottle
+from Classes.Dispenser import Dispenser
+from Classes.Terminal import Terminal
+from Classes import Timestamps
+from Classes.Clock import VirtualClock
+from threading import Event, Thread, enumerate as listThreads
+import asyncio, contextlib, io, json, multiprocessing, os, shutil, tempfile
+
+# worker for the multi process stress test, posts deposits and withdrawals
+# through its own ATM session and returns the net (account, atm cash) amounts it posted
+def postingWorker(db: str, accountId: str, pin: str, postings: int) -> Tuple[int, int]:
+    atm = ATM(None, db)
+    atm.controller("authorize {} {}".format(accountId, pin))
+    accountNet = cashNet = 0
+    for i in range(postings):
+        if i % 3 == 2:
+            response = atm.controller("withdraw 20")
+            if response.message.startswith("Amount dispensed"):
+                accountNet -= 25 if "overdraft fee" in response.message else 20
+                cashNet -= 20
+        else:
+            atm.controller("deposit 20")
+            accountNet += 20
+            cashNet += 20
+    atm.controller("end")
+    atm.close()
+    return accountNet, cashNet
+
+# number of inactivity scheduler threads running in the process
+def schedulerThreads() -> int:
+    return sum(1 for thread in listThreads() if thread.name == "InactivityScheduler")
 
 class ATMTests(unittest.TestCase):
+    # copies the test db once and gives its first account SQLHelper.testPin,
+    # every test's db is copied from this one so the tracked file is never changed
+    @classmethod
+    def setUpClass(cls):
+        cls.templateDir = tempfile.mkdtemp()
+        cls.template = os.path.join(cls.templateDir, "atmdb_test.db")
+        shutil.copy("Data/atmdb_test.db", cls.template)
+        with SQLHelper(cls.template, writeBehind = False) as sql:
+            sql.setPinCmd(sql.getSingleAccountCmd()[0], SQLHelper.testPin)
+        cls.closePools(cls.template)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.templateDir)
+
+    # closes the writers and pools left on db
     @classmethod
+    def closePools(cls, db: str) -> None:
+        with ConnectionPool.poolsLock:
+            pools = [pool for pool in ConnectionPool.pools.values() if pool.dbFile == db]
+        for pool in pools:
+            writer = WriteBehindQueue.forPool(pool, create = False)
+            if writer is not None:
+                writer.close()
+            pool.close()
+
+    # every test runs against its own copy of the template
     def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpDir, "atmdb_test.db")
+        shutil.copy(self.template, self.db)
         # create atm object with 3 second logout timer and point towards test db
         # this is mostly to be used with tests that don't require auth
         # create sql object that points towards test db
-        self.atm = ATM(3, "Data/atmdb_test.db")
-        self.sql = SQLHelper("Data/atmdb_test.db")
+        self.atm = ATM(3, self.db)
+        self.sql = SQLHelper(self.db)
+
+    # closes the sessions, writers and pools left on the test's copy of the db, then removes it
+    def tearDown(self):
+        self.atm.close()
+        self.sql.close()
+        self.closePools(self.db)
+        shutil.rmtree(self.tmpDir)
 
     # authorizes the first available account
-    def AuthorizeAct(self, inactive: int = 3) -> ATM:
-        atm = ATM(inactive, "Data/atmdb_test.db")
+    # on clock when one is given, so inactivity can be tested without waiting
+    def AuthorizeAct(self, inactive: int = 3, clock: VirtualClock = None) -> ATM:
+        atm = ATM(inactive, self.db, clock = clock)
         data = self.sql.getSingleAccountCmd()
         accountId = data[0]
         pin = data[1]
@@ -305,7 +384,7 @@ class ATMTests(unittest.TestCase):
     # and response message is correct
     def test_InvalidLogout(self) -> None:
         print("Testing logging out when no account is logged in")
-        atm = ATM()
+        atm = ATM(db = self.db)
         response = atm.controller("logout")
         message = "No account is currently authorized."
         self.assertEqual(message, response.message)
@@ -316,9 +395,11 @@ class ATMTests(unittest.TestCase):
     # when inactive logout is set to 3 seconds
     def test_InactiveLogout(self) -> None:
         print("Testing scenario where user is inactive and is logged out")
-        atm = self.AuthorizeAct()
-        sleep = Event()
-        sleep.wait(4)
+        clock = VirtualClock()
+        atm = self.AuthorizeAct(clock = clock)
+        clock.advance(2.9)
+        self.assertTrue(atm.account.isAuthorized)
+        clock.advance(1.1)
         self.assertFalse(atm.account.isAuthorized)
 
     # tests inputs that should trigger error when given while user logged in
@@ -339,7 +420,7 @@ class ATMTests(unittest.TestCase):
     # asserts error flag is raised and 
     def test_BadInputNotLoggedIn(self) -> None:
         print("Testing a few scenarios where user is not logged in and gives bad input")
-        atm = ATM(3,"Data/atmdb_test.db")
+        atm = ATM(3, self.db)
         badInput = ["deposit 1 2 3 4", "withdraw 5634 095376", "26235742", "2438g346"]
         
         for bad in badInput:
@@ -353,16 +434,18 @@ class ATMTests(unittest.TestCase):
     # login again and then withdraw
     def test_InactiveLogoutThenLoginAndWitdraw(self) -> None:
         print("Testing a scenario when a user is logged out due to inactivity then is logged back and withdraws")
-        atm = self.AuthorizeAct()
-        sleep = Event()
-        sleep.wait(4)
-        atm = self.AuthorizeAct()
+        clock = VirtualClock()
+        atm = self.AuthorizeAct(clock = clock)
+        clock.advance(4)
+        self.assertFalse(atm.account.isAuthorized)
+        atm = self.AuthorizeAct(clock = clock)
         ogBal = atm.account.balance
 
         # make sure the account has enough money
         if ogBal < 20:
             diff = 20 - ogBal
             atm.account.updateAccountBalance(diff)
+            ogBal += diff
 
         # make sure atm has enough money
         if atm.atmBalance < 20:
@@ -377,7 +460,942 @@ class ATMTests(unittest.TestCase):
         atm.controller("end")
 
 
+    # tests that a deposit posts the atm balance, account balance
+    # and history row together
+    def test_PostingIsPersisted(self) -> None:
+        print("Testing that a deposit posts atm, account and history together")
+        atm = self.AuthorizeAct()
+        self.sql.clearAccountHistoryCmd(atm.account.accountId)
+        atm.controller("deposit 20")
+        actData = self.sql.accountSelectCmd(atm.account.accountId)
+        self.assertEqual(atm.account.balance, actData[3])
+        self.assertEqual(atm.atmBalance, self.sql.getATMBalanceCmd())
+        history = self.sql.getHistoryCmd(atm.account.accountId)
+        self.assertEqual(1, len(history))
+        self.assertEqual(atm.account.balance, history[0][3])
+        atm.controller("end")
+
+    # tests that an error inside a transaction rolls back every statement
+    def test_TransactionRollback(self) -> None:
+        print("Testing that a failed transaction is rolled back")
+        atmBal = self.sql.getATMBalanceCmd()
+        with self.assertRaises(Exception):
+            with self.sql.transaction():
+                self.sql.updateATMBalance(atmBal + 100)
+                raise Exception("Forced failure")
+        self.assertEqual(atmBal, self.sql.getATMBalanceCmd())
+
+
+    # tests that quotes in user input are passed as parameters
+    # rather than being spliced into the sql
+    def test_QuotedInput(self) -> None:
+        print("Testing that quotes in input are handled as plain values")
+        response = self.atm.controller("authorize 1'or'1'='1 1234")
+        self.assertEqual("Authorization failed.", response.message)
+        self.assertFalse(self.atm.account.isAuthorized)
+        response = self.atm.controller("withdraw 'abc'")
+        self.assertTrue(response.error)
+        self.atm.controller("end")
+
+
+    # tests paging through history with history more
+    # validates each page size and the end of history message
+    def test_HistoryPaging(self) -> None:
+        print("Testing paging through history")
+        atm = self.AuthorizeAct()
+        atm.historyPageSize = 2
+        self.sql.clearAccountHistoryCmd(atm.account.accountId)
+        for i in range(3):
+            atm.controller("deposit 20")
+
+        firstPage = atm.controller("history").message.splitlines()
+        self.assertEqual(3, len(firstPage))
+        self.assertEqual("Enter 'history more' to see more.", firstPage[-1])
+        secondPage = atm.controller("history more").message.splitlines()
+        self.assertEqual(1, len(secondPage))
+        # rows come back newest first so the last page holds the first deposit
+        self.assertAlmostEqual(atm.account.balance - 40, float(secondPage[0].split()[3]), 2)
+        self.assertEqual("No more history", atm.controller("history more").message)
+        self.assertTrue(atm.controller("history less").error)
+        atm.controller("end")
+
+
+    # tests two server sessions running at once against one shared terminal
+    # validates sessions are independent and share the cash balance
+    def test_ServerSessions(self) -> None:
+        print("Testing concurrent server sessions")
+        data = self.sql.getSingleAccountCmd()
+
+        async def readMessage(reader: asyncio.StreamReader) -> str:
+            return (await reader.readuntil(b"\n\n")).decode().rstrip("\n")
+
+        async def send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, command: str) -> str:
+            writer.write("{}\n".format(command).encode())
+            return await readMessage(reader)
+
+        async def run() -> None:
+            atmServer = ATMServer("127.0.0.1", 0, 3, self.db)
+            server = await atmServer.start()
+            port = server.sockets[0].getsockname()[1]
+            atmBal = atmServer.terminal.balance
+
+            first = await asyncio.open_connection("127.0.0.1", port)
+            second = await asyncio.open_connection("127.0.0.1", port)
+            await readMessage(first[0])
+            await readMessage(second[0])
+
+            message = await send(*first, "authorize {} {}".format(data[0], data[1]))
+            self.assertEqual("{} successfully authorized.".format(data[0]), message)
+            self.assertEqual("Authorization required.", await send(*second, "balance"))
+            # the pin is checked off the event loop, a wrong one still fails
+            self.assertEqual("Authorization failed.", await send(*second, "authorize {} x{}".format(data[0], data[1])))
+            await send(*second, "authorize {} {}".format(data[0], data[1]))
+            await send(*first, "deposit 20")
+            # the second session read the balance before the first deposit,
+            # relative updates mean neither deposit is lost
+            actBal = self.sql.accountSelectCmd(data[0])[3]
+            await send(*second, "deposit 20")
+            self.assertEqual(actBal + 20, self.sql.accountSelectCmd(data[0])[3])
+            self.assertEqual(atmBal + 40, atmServer.terminal.balance)
+            self.assertEqual(atmBal + 40, self.sql.getATMBalanceCmd())
+
+            self.assertEqual("Goodbye!", await send(*first, "end"))
+            self.assertEqual("Goodbye!", await send(*second, "end"))
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+    # tests the inactivity scheduler with many sessions
+    # rescheduled and cancelled sessions must not expire and no thread is started per session
+    def test_InactivitySchedulerDeadlines(self) -> None:
+        print("Testing inactivity scheduler deadlines")
+        clock = VirtualClock()
+        scheduler = InactivityScheduler(clock)
+        expired = list()
+        threads = schedulerThreads()
+
+        for key in range(200):
+            scheduler.schedule(key, 0.05, lambda key = key: expired.append(key))
+        # push half of the sessions further out and cancel a few
+        for key in range(100):
+            scheduler.schedule(key, 5, lambda key = key: expired.append(key))
+        for key in range(100, 110):
+            scheduler.cancel(key)
+
+        # no thread is started per session
+        self.assertLessEqual(schedulerThreads(), threads)
+        clock.advance(0.5)
+        self.assertEqual(list(range(110, 200)), sorted(expired))
+        self.assertEqual(100, scheduler.pending())
+        clock.advance(5)
+        self.assertEqual(190, len(expired))
+        self.assertEqual(0, scheduler.pending())
+        scheduler.close()
+
+    # tests the scheduler thread on the real clock with sub second deadlines
+    # validates one thread serves every session and wakes early for a new earliest deadline
+    def test_InactivitySchedulerThread(self) -> None:
+        print("Testing the inactivity scheduler thread on the real clock")
+        scheduler = InactivityScheduler()
+        expired = list()
+        done = Event()
+        threads = schedulerThreads()
+
+        def expire(key: int) -> None:
+            expired.append(key)
+            if len(expired) == 20:
+                done.set()
+
+        # the thread is asleep on a later deadline when the earlier ones arrive
+        scheduler.schedule("late", 30, lambda: expired.append("late"))
+        for key in range(25):
+            scheduler.schedule(key, 0.05, lambda key = key: expire(key))
+        for key in range(20, 25):
+            scheduler.cancel(key)
+
+        self.assertEqual(threads + 1, schedulerThreads())
+        self.assertTrue(done.wait(2))
+        self.assertEqual(list(range(20)), sorted(expired))
+        self.assertEqual(1, scheduler.pending())
+        scheduler.cancel("late")
+
+    # tests that commands push the inactivity deadline back
+    def test_InactiveDeadlineReset(self) -> None:
+        print("Testing that activity resets the inactivity deadline")
+        clock = VirtualClock()
+        atm = self.AuthorizeAct(1, clock)
+        clock.advance(0.6)
+        atm.controller("balance")
+        clock.advance(0.6)
+        self.assertTrue(atm.account.isAuthorized)
+        clock.advance(0.6)
+        self.assertFalse(atm.account.isAuthorized)
+
+
+    # tests connection pool thread affinity, bounds and counters
+    def test_ConnectionPool(self) -> None:
+        print("Testing connection pool leases")
+        with ConnectionPool(self.db, maxSize = 1, timeout = 0.1) as pool:
+            first = SQLHelper(self.db, pool = pool)
+            second = SQLHelper(self.db, pool = pool)
+            # helpers on the same thread share one connection
+            self.assertIs(first.conn, second.conn)
+
+            # the only connection is leased, another thread has to wait and gives up
+            errors = list()
+            def otherThread() -> None:
+                try:
+                    pool.acquire()
+                except Exception as e:
+                    errors.append(e)
+            thread = Thread(target = otherThread)
+            thread.start()
+            thread.join()
+            self.assertEqual(1, len(errors))
+
+            first.close()
+            second.close()
+            self.assertEqual({"opened": 1, "closed": 0, "open": 1, "inUse": 0, "idle": 1}, pool.stats())
+
+        self.assertEqual(1, pool.stats()["closed"])
+
+    # tests that logging in and out reuses the session's connection
+    def test_LoginLogoutReusesConnection(self) -> None:
+        print("Testing that login and logout don't open connections")
+        atm = self.AuthorizeAct()
+        opened = atm.sql.pool.stats()["opened"]
+        data = self.sql.getSingleAccountCmd()
+        for i in range(5):
+            atm.controller("logout")
+            atm.controller("authorize {} {}".format(data[0], data[1]))
+        self.assertIs(atm.sql.conn, atm.account.sql.conn)
+        self.assertEqual(opened, atm.sql.pool.stats()["opened"])
+        atm.controller("end")
+        atm.close()
+
+
+    # tests that the test profile works on an in memory copy
+    # validates the file on disk is left untouched
+    def test_TestProfileInMemory(self) -> None:
+        print("Testing the in memory test storage profile")
+        data = self.sql.getSingleAccountCmd()
+        fileBalance = self.sql.accountSelectCmd(data[0])[3]
+        atm = ATM(3, self.db, profile = "test")
+        atm.controller("authorize {} {}".format(data[0], data[1]))
+        memoryBalance = atm.account.balance
+        atm.controller("deposit 20")
+        self.assertEqual(memoryBalance + 20, atm.sql.accountSelectCmd(data[0])[3])
+        self.assertEqual(fileBalance, self.sql.accountSelectCmd(data[0])[3])
+        atm.controller("end")
+        atm.close()
+
+    # tests that profile pragmas are applied when connecting
+    def test_BalancedProfile(self) -> None:
+        print("Testing the balanced storage profile pragmas")
+        with SQLHelper(self.db, profile = "balanced") as sql:
+            self.assertEqual("wal", sql.cursor.execute("PRAGMA journal_mode;").fetchone()[0])
+            self.assertEqual(1, sql.cursor.execute("PRAGMA synchronous;").fetchone()[0])
+
+
+    # tests that a burst of bad commands is logged in a few group commits
+    def test_ErrorBurstGroupCommit(self) -> None:
+        print("Testing that error logging is group committed")
+        atm = ATM(3, self.db)
+        errorCount = "SELECT count(*) FROM errors;"
+        before = self.sql.cursor.execute(errorCount).fetchone()[0]
+        writer = WriteBehindQueue.forPool(atm.sql.pool)
+        batches = writer.batches
+
+        for i in range(50):
+            self.assertTrue(atm.controller("bad command {}".format(i)).error)
+        atm.controller("end")
+
+        # end flushes the queue
+        self.assertEqual(0, writer.pending())
+        self.assertEqual(before + 50, self.sql.cursor.execute(errorCount).fetchone()[0])
+        self.assertLess(writer.batches - batches, 50)
+
+    # tests a batch the writer can't write is dropped and reported
+    # validates the writer keeps going afterwards and flush doesn't hang
+    def test_WriteBehindFailures(self) -> None:
+        print("Testing that failed write behind batches are reported")
+        with SQLHelper(self.db) as sql:
+            writer = WriteBehindQueue.forPool(sql.pool)
+            log = io.StringIO()
+            with contextlib.redirect_stderr(log):
+                # the wrong number of parameters raises ProgrammingError, not OperationalError
+                writer.add("insertHistory", (1,))
+                self.assertEqual(1, writer.flush())
+            self.assertIn("dropped 1 rows", log.getvalue())
+            self.assertEqual(1, writer.stats()["failed"])
+
+            sql.updateHistoryCmd("44", 5, 5)
+            self.assertEqual(0, writer.flush())
+            self.assertTrue(writer.thread.is_alive())
+            self.assertEqual(1, sql.cursor.execute("SELECT count(*) FROM history WHERE account_id = 44;").fetchone()[0])
+            writer.close()
+
+    # tests that queued history rows are visible to the history command
+    def test_HistoryReadYourWrites(self) -> None:
+        print("Testing that queued history is visible to reads")
+        atm = self.AuthorizeAct()
+        self.sql.clearAccountHistoryCmd(atm.account.accountId)
+        atm.account.updateAccountBalance(20)
+        history = atm.controller("history").message.splitlines()
+        self.assertEqual(1, len(history))
+        atm.account.updateAccountBalance(-20)
+        atm.controller("end")
+
+
+    # tests the command grammar without going through the controller
+    # bad input comes back with an error instead of raising
+    def test_ParseCommand(self) -> None:
+        print("Testing command parsing")
+        parsed = parseCommand("  WITHDRAW 40 ")
+        self.assertIsNone(parsed.error)
+        self.assertEqual("withdraw", parsed.command.handler)
+        self.assertEqual((40,), parsed.args)
+        self.assertEqual((True,), parseCommand("history more").args)
+        self.assertEqual(("123", "0075"), parseCommand("authorize 123 0075").args)
+
+        for bad in ["", "withdraw", "withdraw 20 40", "deposit 2o", "history less", "balance 1", "hello"]:
+            self.assertIsNotNone(parseCommand(bad).error)
+
+
+    # tests that a failed nested transaction only undoes its own statements
+    def test_NestedTransactionRollback(self) -> None:
+        print("Testing that a failed nested transaction rolls back to its savepoint")
+        atmBal = self.sql.getATMBalanceCmd()
+        with self.sql.transaction():
+            self.sql.updateATMBalance(atmBal + 100)
+            with self.assertRaises(Exception):
+                with self.sql.transaction():
+                    self.sql.updateATMBalance(atmBal + 200)
+                    raise Exception("Forced failure")
+        self.assertEqual(atmBal + 100, self.sql.getATMBalanceCmd())
+        self.sql.updateATMBalance(atmBal)
+
+    # tests replaying a script in one transaction
+    # validates output, counters and that commands after end are ignored
+    def test_BatchScript(self) -> None:
+        print("Testing batch script replay")
+        data = self.sql.getSingleAccountCmd()
+        atm = ATM(None, self.db, profile = "test")
+        balance = atm.sql.accountSelectCmd(data[0])[3]
+        script = ["authorize {} {}".format(data[0], data[1]), "deposit 20", "", "deposit abc",
+                  "balance", "end", "deposit 20"]
+        out = io.StringIO()
+
+        stats = BatchRunner(atm, True).run(script, out)
+        self.assertEqual(5, stats["commands"])
+        self.assertEqual(1, stats["errors"])
+        self.assertEqual(balance + 20, atm.sql.accountSelectCmd(data[0])[3])
+        self.assertTrue(out.getvalue().endswith("Goodbye!\n\n"))
+        atm.close()
+
+
+    # tests that a withdrawal decided on a stale balance is re-evaluated
+    # validates the balance changed by another process isn't overwritten
+    def test_StaleBalanceReevaluated(self) -> None:
+        print("Testing that a withdrawal on a stale balance is retried against the db balance")
+        atm = self.AuthorizeAct()
+        accountId = atm.account.accountId
+        originalBal = atm.account.balance
+        if atm.atmBalance < 20:
+            atm.updateATMBalance(100)
+        atm.account.updateAccountBalance(30 - originalBal)
+        stale = atm.sql.cache.stats()["stale"]
+
+        # another process drops the balance to 10, bypassing this process' cache
+        self.sql.cursor.execute("UPDATE accounts SET balance = 10, version = version + 1 WHERE account_id = ?;",
+                                (accountId,))
+
+        # in memory the session still sees 30, the db decides on 10 and charges the overdraft fee
+        response = atm.controller("withdraw 20")
+        self.assertEqual(-15, self.sql.refreshAccountCmd(accountId)[3])
+        self.assertEqual(-15, atm.account.balance)
+        message = ("Amount dispensed: $20\nYou have been charged an overdraft fee of "
+                   "$5. Current balance: -15")
+        self.assertEqual(message, response.message)
+        self.assertGreater(atm.sql.cache.stats()["stale"], stale)
+        atm.account.updateAccountBalance(originalBal + 15)
+        atm.controller("end")
+
+    # tests account cache hits and lru eviction
+    def test_AccountCache(self) -> None:
+        print("Testing the account cache")
+        cache = AccountCache(None, maxSize = 2)
+        cache.put("a", (1,))
+        cache.put("b", (2,))
+        self.assertEqual((1,), cache.get("a"))
+        cache.put("c", (3,))
+        # b was least recently used
+        self.assertIsNone(cache.get("b"))
+        cache.update("a", {0: 5})
+        self.assertEqual((5,), cache.get("a"))
+        self.assertEqual({"size": 2, "hits": 2, "misses": 1, "evictions": 1, "stale": 0}, cache.stats())
+
+    # tests cached rows aren't served once another pool, as another process would, has changed them
+    # validates a re-login and a terminal load see the other pool's writes
+    def test_AccountCacheAcrossPools(self) -> None:
+        print("Testing the account cache against writes from another pool")
+        accountId, pin = self.sql.getSingleAccountCmd()
+        balance = self.sql.accountSelectCmd(accountId)[3]
+        cash = self.sql.getATMStateCmd()[0]
+        # a second pool on the same file has its own cache
+        other = SQLHelper(self.db, cachedStatements = 129)
+        self.assertIsNot(self.sql.pool, other.pool)
+        other.adjustBalanceCmd(accountId, 1000)
+        other.adjustATMBalanceCmd(1000)
+        other.close()
+
+        atm = ATM(None, self.db, terminal = Terminal(self.db))
+        atm.controller("authorize {} {}".format(accountId, pin))
+        self.assertEqual("Current balance: {}".format(balance + 1000), atm.controller("balance").message)
+        self.assertEqual(cash + 1000, atm.atmBalance)
+        self.assertEqual(2, self.sql.cache.stats()["stale"])
+        atm.close()
+        atm.terminal.close()
+
+
+    # tests sessions on two terminals dispensing from their own cash
+    # validates the fleet wide cash position
+    def test_FleetTerminals(self) -> None:
+        print("Testing multiple terminals and fleet cash")
+        data = self.sql.getSingleAccountCmd()
+        sql = SQLHelper(self.db, profile = "test")
+        before = sql.getFleetCashCmd()
+        terminalId = sql.addTerminalCmd(500)
+
+        atm = ATM(None, self.db, profile = "test", terminalId = terminalId)
+        atm.controller("authorize {} {}".format(data[0], data[1]))
+        atm.controller("deposit 40")
+        self.assertEqual(540, sql.getATMBalanceCmd(terminalId))
+
+        fleet = sql.getFleetCashCmd()
+        self.assertEqual(before["terminals"] + 1, fleet["terminals"])
+        self.assertEqual(before["total"] + 540, fleet["total"])
+        self.assertIn((terminalId, 540), sql.getLowCashTerminalsCmd(1000))
+        atm.controller("end")
+        atm.close()
+        sql.close()
+
+
+    # tests a balance adjustment and its history row are committed together, credits included
+    def test_PostingHistoryAtomic(self) -> None:
+        print("Testing balance changes are written with their history")
+        with SQLHelper(self.db) as sql:
+            accountId = sql.getSingleAccountCmd()[0]
+            sql.clearAccountHistoryCmd(accountId)
+            historyCount = "SELECT count(*) FROM history WHERE account_id = ?;"
+            balance = sql.adjustBalanceCmd(accountId, 20)[0]
+            # written with the balance, not left for the background writer
+            self.assertEqual(1, sql.cursor.execute(historyCount, (accountId,)).fetchone()[0])
+
+            with self.assertRaises(StaleDataError):
+                with sql.transaction():
+                    sql.adjustBalanceCmd(accountId, 40)
+                    raise StaleDataError("rolled back")
+            self.assertEqual(1, sql.cursor.execute(historyCount, (accountId,)).fetchone()[0])
+            self.assertEqual(balance, sql.accountSelectCmd(accountId)[3])
+
+    # tests several processes posting to one account at once
+    # validates the final balance equals the starting balance plus every posting
+    def test_ConcurrentPostingsStress(self) -> None:
+        print("Testing concurrent postings from several processes")
+        sql = SQLHelper(self.db)
+        data = sql.getSingleAccountCmd()
+        sql.updateATMBalance(1000000)
+        startBal = sql.accountSelectCmd(data[0])[3]
+        sql.close()
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(4) as pool:
+            nets = pool.starmap(postingWorker, [(self.db, data[0], data[1], 60)] * 4)
+
+        with SQLHelper(self.db, cache = False) as sql:
+            self.assertAlmostEqual(startBal + sum(net[0] for net in nets), sql.accountSelectCmd(data[0])[3], 2)
+            self.assertEqual(1000000 + sum(net[1] for net in nets), sql.getATMBalanceCmd())
+
+    # tests reconciliation of balances against history across worker processes
+    # validates postings reconcile cleanly and tampered rows are reported
+    def test_Reconcile(self) -> None:
+        print("Testing reconciliation of balances against history")
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            data = sql.getSingleAccountCmd()
+            sql.updateATMBalance(10000)
+            sql.clearAccountHistoryCmd(data[0])
+            for amount in (40, -20, 60):
+                sql.postTransactionCmd(data[0], amount, amount)
+            self.assertEqual([], Reconciler(self.db, 2).run())
+
+            historyId = sql.cursor.execute("SELECT max(id) FROM history;").fetchone()[0]
+            sql.cursor.execute("UPDATE history SET amount = amount + 5 WHERE id = ?;", (historyId,))
+            sql.cursor.execute("UPDATE accounts SET balance = balance + 1 WHERE account_id = ?;", (data[0],))
+            sql.cursor.execute("INSERT INTO history(account_id, amount, new_balance, ts) VALUES(42, 5, 5, 1577836800);")
+            sql.conn.commit()
+
+        reconciler = Reconciler(self.db, 2)
+        kinds = [(d.accountId, d.kind) for d in reconciler.run()]
+        self.assertEqual([(data[0], "chain"), (data[0], "balance"), ("42", "orphan")], kinds)
+        self.assertGreater(reconciler.stats()["rows"], 0)
+
+        # rows still queued by this process's writer are flushed before the workers read
+        with SQLHelper(self.db) as sql:
+            writer = WriteBehindQueue(sql.pool, flushInterval = 1.5)
+            WriteBehindQueue.writers[id(sql.pool)] = writer
+            sql.updateHistoryCmd("43", 5, 5)
+            self.assertIn(("43", "orphan"), [(d.accountId, d.kind) for d in Reconciler(self.db, 2).run()])
+            writer.close()
+
+
+    # tests constant responses are shared and can't be changed
+    # validates responses and accounts carry no per instance dict
+    def test_CompactResponses(self) -> None:
+        print("Testing shared and slotted responses")
+        self.assertIs(responses.authorizationRequired, self.atm.controller("balance"))
+        self.assertIs(responses.invalidCommand, self.atm.controller("hello"))
+        self.assertTrue(self.atm.controller("hello").error)
+        with self.assertRaises(AttributeError):
+            responses.invalidCommand.addResponseMsg("changed")
+        self.assertEqual("Invalid command detected.", responses.invalidCommand.message)
+
+        data = self.sql.getSingleAccountCmd()
+        account = self.atm.account
+        self.atm.controller("authorize {} {}".format(data[0], data[1]))
+        self.atm.controller("logout")
+        self.assertIs(account, self.atm.account)
+        self.assertFalse(account.isAuthorized)
+        self.assertFalse(hasattr(account, "__dict__"))
+        self.assertFalse(hasattr(ControllerResponse("message"), "__dict__"))
+
+
+    # tests command and statement timings are recorded only while enabled
+    # validates the stats command exports them as prometheus text and json
+    def test_Metrics(self) -> None:
+        print("Testing metrics and the stats command")
+        metrics = Metrics.shared()
+        metrics.reset()
+        self.atm.controller("balance")
+        self.assertEqual([], metrics.snapshot()["histograms"])
+
+        metrics.enable()
+        try:
+            atm = self.AuthorizeAct()
+            atm.controller("deposit 20")
+            atm.controller("hello")
+            snapshot = json.loads(atm.controller("stats json").message)
+            text = atm.controller("stats").message
+        finally:
+            metrics.disable()
+            metrics.reset()
+            atm.close()
+
+        counts = {(h["name"], tuple(sorted(h["labels"].items()))): h["count"] for h in snapshot["histograms"]}
+        self.assertEqual(1, counts[("atm_command_seconds", (("command", "deposit"), ("phase", "db")))])
+        self.assertEqual(1, counts[("atm_command_seconds", (("command", "invalid"), ("phase", "total")))])
+        self.assertGreaterEqual(counts[("atm_db_statement_seconds", (("statement", "adjustBalance"),))], 1)
+        # commits are db time, not format time
+        self.assertGreaterEqual(counts[("atm_db_statement_seconds", (("statement", "commit"),))], 1)
+        self.assertIn("atm_threads", [g["name"] for g in snapshot["gauges"]])
+        self.assertIn('atm_command_seconds_count{command="deposit",phase="total"} 1', text)
+        self.assertIn("# TYPE atm_db_statement_seconds histogram", text)
+        self.assertEqual("Invalid command detected.", self.atm.controller("stats xml").message)
+        # server metrics aren't handed to clients that haven't logged in
+        self.assertIs(responses.authorizationRequired, self.atm.controller("stats"))
+
+
+    # tests importing accounts from csv and jsonl then exporting their history
+    # validates a bad file imports nothing and exports can be filtered by account and date
+    def test_BulkImportExport(self) -> None:
+        print("Testing bulk account import and history export")
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            accounts = io.StringIO("account_id,pin,balance\n9000000001,0001,100\n9000000002,0002,12.5\n")
+            self.assertEqual(2, sql.importAccountsCmd(BulkIO.readAccounts(accounts, "csv"), chunkSize = 1))
+            accounts = io.StringIO('{"account_id": "9000000003", "pin": "0003"}\n\n')
+            self.assertEqual(1, sql.importAccountsCmd(BulkIO.readAccounts(accounts, "jsonl")))
+            self.assertEqual(12.5, sql.accountSelectCmd("9000000002")[3])
+            self.assertEqual(0, sql.accountSelectCmd("9000000003")[3])
+
+            # the duplicate rolls back the new account before it
+            accounts = io.StringIO("account_id,pin\n9000000004,0004\n9000000001,0001\n")
+            with self.assertRaises(Exception):
+                sql.importAccountsCmd(BulkIO.readAccounts(accounts, "csv"))
+            self.assertIsNone(sql.accountSelectCmd("9000000004"))
+            with self.assertRaises(Exception):
+                sql.importAccountsCmd(BulkIO.readAccounts(io.StringIO("account_id,pin\n9000000005,12\n"), "csv"))
+
+            sql.updateATMBalance(1000)
+            sql.postTransactionCmd("9000000001", 40, 40)
+            sql.postTransactionCmd("9000000002", 20, 20)
+            out = io.StringIO()
+            self.assertEqual(1, BulkIO.writeHistory(sql.exportHistoryCmd("9000000001"), out, "csv"))
+            lines = out.getvalue().splitlines()
+            self.assertEqual("id,account_id,date,time,amount,new_balance", lines[0])
+            fields = lines[1].split(",")
+            self.assertEqual(["9000000001", "40", "140"], [fields[1], fields[4], fields[5]])
+
+            out = io.StringIO()
+            BulkIO.writeHistory(sql.exportHistoryCmd(start = "2100-01-01"), out, "jsonl")
+            self.assertEqual("", out.getvalue())
+            out = io.StringIO()
+            BulkIO.writeHistory(sql.exportHistoryCmd(start = "2000-01-01"), out, "jsonl")
+            rows = [json.loads(line) for line in out.getvalue().splitlines()]
+            self.assertEqual(["9000000001", "9000000002"], [row["account_id"] for row in rows[-2:]])
+
+
+    # tests pins are stored as salted hashes
+    # validates imports store hashes and plaintext pins are upgraded on login and by hashPinsCmd
+    def test_PinHashing(self) -> None:
+        print("Testing hashed pins")
+        stored = Pins.hashPin("1234", 1000)
+        self.assertTrue(stored.startswith("pbkdf2_sha256$1000$"))
+        self.assertNotEqual(stored, Pins.hashPin("1234", 1000))
+        self.assertTrue(Pins.verifyPin("1234", stored))
+        self.assertFalse(Pins.verifyPin("1235", stored))
+        self.assertFalse(Pins.verifyPin("1234", "garbage"))
 
+        with SQLHelper(self.db) as sql:
+            sql.importAccountsCmd([("9100000001", "0001", 0), ("9100000002", "0002", 0), ("9100000003", "0003", 0)],
+                                  iterations = 1000)
+            for accountId, pin in [("9100000001", "0001"), ("9100000002", "0002"), ("9100000003", "0003")]:
+                pinHash, plaintext = sql.execute("pinLookup", (accountId,)).fetchone()
+                self.assertEqual("", plaintext)
+                self.assertTrue(Pins.verifyPin(pin, pinHash))
+
+            # pins from a db made before hashing are plaintext
+            with sql.transaction():
+                sql.conn.executemany("UPDATE accounts SET pin = ?, pin_hash = NULL WHERE account_id = ?;",
+                                     [("0001", "9100000001"), ("0002", "9100000002"), ("0003", "9100000003")])
+            atm = ATM(None, self.db, throttle = LoginThrottle())
+            self.assertEqual("Authorization failed.", atm.controller("authorize 9100000001 0002").message)
+            self.assertEqual("9100000001 successfully authorized.",
+                             atm.controller("authorize 9100000001 0001").message)
+            atm.close()
+
+            pinHash, pin = sql.execute("pinLookup", ("9100000001",)).fetchone()
+            self.assertEqual("", pin)
+            self.assertTrue(Pins.verifyPin("0001", pinHash))
+
+            self.assertGreaterEqual(sql.hashPinsCmd(iterations = 1000), 2)
+            self.assertEqual(0, sql.hashPinsCmd())
+            self.assertTrue(sql.verifyPinCmd("9100000002", "0002"))
+            self.assertFalse(sql.verifyPinCmd("9100000009", "0002"))
+
+            # unknown accounts still pay for a hash
+            verify, hashes = Pins.verifyPin, list()
+            Pins.verifyPin = lambda pin, stored: hashes.append(stored) or verify(pin, stored)
+            try:
+                self.assertFalse(sql.verifyPinCmd("9100000009", "0002"))
+            finally:
+                Pins.verifyPin = verify
+            self.assertEqual([Pins.dummyHash()], hashes)
+
+            # a non ascii pin against a plaintext pin is a failed attempt, not a bad command
+            with sql.transaction():
+                sql.conn.execute("UPDATE accounts SET pin = '0003', pin_hash = NULL WHERE account_id = '9100000003';")
+            throttle = LoginThrottle()
+            atm = ATM(None, self.db, throttle = throttle)
+            self.assertIs(responses.authorizationFailed, atm.controller("authorize 9100000003 \u00e90003"))
+            self.assertEqual(1, throttle.stats()["failures"])
+            atm.close()
+
+    # tests failed logins are throttled per session and per account
+    # validates throttled attempts are refused even with the right pin and clear once the window passes
+    def test_LoginThrottle(self) -> None:
+        print("Testing failed login throttling")
+        data = self.sql.getSingleAccountCmd()
+        clock = VirtualClock()
+        throttle = LoginThrottle(accountLimit = (3, 1.0), sessionLimit = (2, 1.0), clock = clock)
+        first = ATM(None, self.db, throttle = throttle)
+        second = ATM(None, self.db, throttle = throttle)
+
+        for attempt in range(2):
+            self.assertEqual("Authorization failed.", first.controller("authorize {} 0000".format(data[0])).message)
+        # the session is out of attempts, the account has one left
+        message = first.controller("authorize {} {}".format(data[0], data[1])).message
+        self.assertEqual("Too many failed attempts. Please try again later.", message)
+        self.assertEqual("Authorization failed.", second.controller("authorize {} 0000".format(data[0])).message)
+        message = second.controller("authorize {} {}".format(data[0], data[1])).message
+        self.assertEqual("Too many failed attempts. Please try again later.", message)
+        self.assertEqual(2, throttle.stats()["rejected"])
+
+        clock.advance(1.1)
+        message = second.controller("authorize {} {}".format(data[0], data[1])).message
+        self.assertEqual("{} successfully authorized.".format(data[0]), message)
+        first.close()
+        second.close()
+        self.assertEqual(0, throttle.stats()["tracked"])
+
+
+    # tests moving cold months of history into archive tables
+    # validates statements, history, export and reconciliation still see every row
+    def test_MonthlyArchive(self) -> None:
+        print("Testing monthly history archive and statements")
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            accountId, pin = sql.getSingleAccountCmd()
+            sql.clearAccountHistoryCmd(accountId)
+            balance = sql.accountSelectCmd(accountId)[3]
+            # two rows in each of three months, then the current balance posted now
+            for month in ("2020-01", "2020-02", "2020-03"):
+                for day in (1, 15):
+                    balance += 20
+                    ts = Timestamps.monthBounds(month)[0] + day * 86400
+                    sql.execute("insertHistory", (accountId, 20, balance, ts))
+            sql.execute("updateBalance", (balance, accountId))
+            sql.clearCache()
+
+            archived = sql.archiveHistoryCmd(keepMonths = 1, now = Timestamps.monthBounds("2020-03")[0])
+            self.assertEqual({"2020-01": 2, "2020-02": 2}, archived)
+            self.assertEqual({}, sql.archiveHistoryCmd(keepMonths = 1, now = Timestamps.monthBounds("2020-03")[0]))
+            hot = sql.cursor.execute("SELECT count(*) FROM history WHERE account_id = ?;", (accountId,)).fetchone()[0]
+            self.assertEqual(2, hot)
+
+            exported = list(sql.exportHistoryCmd(accountId))
+            self.assertEqual(6, len(exported))
+            self.assertEqual([row[5] for row in exported], sorted(row[5] for row in exported))
+            self.assertEqual(2, len(list(sql.exportHistoryCmd(accountId, "2020-02-01", "2020-02-28"))))
+
+        self.assertEqual([], Reconciler(self.db, 1).run())
+
+        atm = ATM(None, self.db)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        statement = atm.controller("statement 2020-01").message.splitlines()
+        self.assertEqual(["Statement for 2020-01", "2020-01-02"], [statement[0], statement[1].split()[0]])
+        self.assertEqual(3, len(statement))
+        self.assertEqual(3, len(atm.controller("statement 2020-03").message.splitlines()))
+        self.assertEqual("No history found for 2019-12", atm.controller("statement 2019-12").message)
+        self.assertTrue(atm.controller("statement 2020-13").error)
+        self.assertEqual(2, len(atm.controller("history").message.splitlines()))
+        atm.close()
+
+    # tests the cassette dispense planner and withdrawals from a terminal with cassettes
+    def test_CassetteDispense(self) -> None:
+        print("Testing cassette dispense planning")
+        dispenser = Dispenser({20: 10, 50: 2, 100: 1})
+        self.assertEqual({100: 1, 50: 1, 20: 1}, dispenser.plan(170))
+        # greedy would take a 50 and be left with 10
+        self.assertEqual({20: 3}, dispenser.plan(60))
+        self.assertIsNone(dispenser.plan(30))
+        self.assertEqual((150, {100: 1, 50: 1}), dispenser.largestPlan(160 - 5))
+        # with the 100 gone the same amount fails over to smaller notes
+        dispenser.dispense({100: 1})
+        self.assertEqual({50: 2, 20: 3}, dispenser.plan(160))
+        self.assertIsNone(Dispenser({20: 1}).plan(40))
+
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            accountId, pin = sql.getSingleAccountCmd()
+            sql.execute("updateBalance", (1000, accountId))
+            sql.clearCache()
+            terminalId = sql.addTerminalCmd()
+            self.assertEqual(300, sql.loadCassettesCmd(terminalId, {20: 5, 50: 4})[0])
+
+        atm = ATM(None, self.db, terminalId = terminalId)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        self.assertEqual("Amount dispensed: $50\nCurrent balance: 950", atm.controller("withdraw 50").message)
+        self.assertEqual({20: 5, 50: 3}, atm.sql.getCassettesCmd(terminalId))
+        self.assertTrue(atm.controller("withdraw 30").message.startswith(
+            "Unable to dispense full amount requested at this time. Amount dispensed: $20"))
+        self.assertEqual(230, atm.atmBalance)
+        self.assertEqual({20: 4, 50: 3}, atm.terminal.dispenser.notes())
+
+        # another process takes the 50s, the posting conflicts and is planned again from the db
+        with SQLHelper(self.db, writeBehind = False, cache = False) as other:
+            other.execute("loadCassette", (terminalId, 50, 0))
+            other.execute("adjustATMBalance", (-150, terminalId, None))
+        self.assertEqual("Unable to dispense full amount requested at this time. Amount dispensed: $80\n"
+                         "Current balance: 850", atm.controller("withdraw 100").message)
+        self.assertEqual({20: 0, 50: 0}, atm.sql.getCassettesCmd(terminalId))
+        self.assertEqual(0, atm.atmBalance)
+        self.assertEqual(responses.atmEmpty, atm.controller("withdraw 20"))
+        atm.close()
+
+    # tests multi leg batch postings and the transfer command
+    def test_BatchPostingsAndTransfer(self) -> None:
+        print("Testing batch postings and transfers")
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            accountId, pin = sql.getSingleAccountCmd()
+            sql.clearAccountHistoryCmd(accountId)
+            sql.updateBalanceCmd(accountId, 100 - sql.accountSelectCmd(accountId)[3], 100)
+            for other in ("90000001", "90000002"):
+                sql.execute("importAccount", (other, "1234", 0))
+            sql.clearCache()
+            before = sql.cursor.execute("SELECT count(*) FROM history;").fetchone()[0]
+
+            # payroll style credits, then a transfer touching the same account twice
+            posted = sql.postBatchCmd([[("90000001", 500)], [("90000002", 250)],
+                                       [("90000001", -120), ("90000002", 120)], [("90000001", -30), (accountId, 30)]])
+            self.assertEqual({"90000001": 350, "90000002": 370, str(accountId): 130},
+                             {a: state[0] for a, state in posted.items()})
+            rows = sql.cursor.execute("SELECT amount, new_balance FROM history WHERE account_id = 90000001 "
+                                      "ORDER BY id;").fetchall()
+            self.assertEqual([(500, 500), (-120, 380), (-30, 350)], rows)
+
+            # one overdrawn account rolls back the whole batch
+            with self.assertRaises(StaleDataError):
+                sql.postBatchCmd([[("90000002", 1000)], [("90000001", -351), ("90000002", 351)]])
+            with self.assertRaisesRegex(Exception, "No account exists for 404"):
+                sql.postBatchCmd([[("90000001", -10), ("404", 10)]])
+            self.assertEqual(350, sql.refreshAccountCmd("90000001")[3])
+            self.assertEqual(before + 6, sql.cursor.execute("SELECT count(*) FROM history;").fetchone()[0])
+            self.assertEqual({}, sql.postBatchCmd([]))
+
+        atm = ATM(None, self.db)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        self.assertEqual("Transferred $100 to 90000002.\nCurrent balance: 30",
+                         atm.controller("transfer 90000002 100").message)
+        self.assertEqual(470, atm.sql.accountSelectCmd("90000002")[3])
+        self.assertEqual(responses.insufficientFunds, atm.controller("transfer 90000002 40"))
+        self.assertEqual(responses.invalidTransfer, atm.controller("transfer 90000002 0"))
+        self.assertEqual(responses.transferFailed, atm.controller("transfer 404 10"))
+        self.assertEqual(responses.transferFailed, atm.controller("transfer {} 10".format(accountId)))
+        self.assertTrue(atm.controller("transfer 90000002").error)
+        atm.close()
+        ConnectionPool.get(self.db).close()
+        self.assertEqual([], Reconciler(self.db, 1).run())
+
+    # tests ledger mode, balances derived from snapshots and history, and balances as of a date
+    def test_LedgerSnapshots(self) -> None:
+        print("Testing the append only ledger")
+        with SQLHelper(self.db, writeBehind = False) as sql:
+            accountId, pin = sql.getSingleAccountCmd()
+            sql.clearAccountHistoryCmd(accountId)
+            sql.execute("updateBalance", (100, accountId))
+            # a deposit on each of the first three days of 2020
+            for day, balance in ((1, 120), (2, 140), (3, 160)):
+                sql.execute("insertHistory", (accountId, 20, balance, Timestamps.dayStart("2020-01-0{}".format(day))))
+            sql.execute("updateBalance", (160, accountId))
+            sql.clearCache()
+            self.assertEqual(140, sql.balanceAsOfCmd(accountId, Timestamps.dayEnd("2020-01-02")))
+            self.assertIsNone(sql.balanceAsOfCmd(accountId, Timestamps.dayStart("2019-12-31")))
+
+            sql.enableLedgerCmd(snapshotEvery = 3)
+            for amount in (10, 10, -5, 30):
+                balance, version = sql.adjustBalanceCmd(accountId, amount)
+            self.assertEqual(205, balance)
+            # postings only append, accounts.balance is left as it was
+            self.assertEqual(160, sql.execute("accountSelect", (accountId,)).fetchone()[3])
+            self.assertEqual((205, version), sql.refreshAccountCmd(accountId)[3:5])
+            snapshots = sql.cursor.execute("SELECT history_id, balance FROM balance_snapshots WHERE account_id = ? "
+                                           "ORDER BY history_id;", (str(accountId),)).fetchall()
+            self.assertEqual(2, len(snapshots))
+            self.assertEqual(175, snapshots[1][1])
+            self.assertEqual((205, version, 1), sql.execute("ledgerState", (accountId,)).fetchone())
+
+            with self.assertRaises(StaleDataError):
+                sql.updateBalanceCmd(accountId, 5, 210, version - 1)
+            with self.assertRaises(StaleDataError):
+                sql.adjustBalanceCmd(accountId, -300, 300)
+            self.assertEqual(version + 1, sql.updateBalanceCmd(accountId, 5, 210, version))
+            sql.execute("importAccount", ("90000003", "1234", 50))
+            self.assertEqual({"90000003": 90, str(accountId): 170},
+                             {a: state[0] for a, state in sql.postBatchCmd([[(accountId, -40), ("90000003", 40)]]).items()})
+            with self.assertRaises(StaleDataError):
+                sql.postBatchCmd([[("90000003", -91), (accountId, 91)]])
+            self.assertEqual(140, sql.balanceAsOfCmd(accountId, Timestamps.dayEnd("2020-01-02")))
+            self.assertEqual(170, sql.balanceAsOfCmd(accountId, Timestamps.now() + 1))
+
+            # archiving snapshots first so nothing after a snapshot leaves the hot table
+            sql.archiveHistoryCmd(keepMonths = 1)
+            self.assertEqual(170, sql.refreshAccountCmd(accountId)[3])
+            self.assertEqual(160, sql.balanceAsOfCmd(accountId, Timestamps.dayEnd("2020-01-03")))
+
+        self.assertEqual([], Reconciler(self.db, 1).run())
+        atm = ATM(None, self.db)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        self.assertEqual("Current balance: 190", atm.controller("deposit 20").message)
+        self.assertEqual("Balance as of 2020-01-01: 120", atm.controller("balance 2020-01-01").message)
+        self.assertEqual("No balance found for 2019-01-01", atm.controller("balance 2019-01-01").message)
+        self.assertTrue(atm.controller("balance 2020-02-30").error)
+        atm.close()
+
+    # tests sessions, timestamps and scripts on a virtual clock
+    def test_VirtualClock(self) -> None:
+        print("Testing the virtual clock")
+        clock = VirtualClock(Timestamps.dayStart("2021-03-01"))
+        threads = schedulerThreads()
+        scheduler = InactivityScheduler(clock)
+        expired = list()
+        for key in range(3):
+            scheduler.schedule(key, 10 * (key + 1), lambda key = key: expired.append(key))
+        # nothing runs on a thread, deadlines are delivered as the clock advances
+        self.assertLessEqual(schedulerThreads(), threads)
+        clock.advance(20)
+        self.assertEqual([0, 1], expired)
+        with self.assertRaises(Exception):
+            clock.advance(-1)
+
+        listeners = len(clock.listeners)
+        atm = ATM(None, self.db, clock = clock)
+        accountId, pin = atm.sql.getSingleAccountCmd()
+        atm.sql.clearAccountHistoryCmd(accountId)
+        script = io.StringIO("authorize {} {}\ndeposit 20\n@advance 86400\ndeposit 20\nbad input\n".format(accountId, pin))
+        stats = BatchRunner(atm).run(script, io.StringIO())
+        self.assertEqual((4, 1), (stats["commands"], stats["errors"]))
+        self.assertEqual([("2021-03-02", "00:00:20"), ("2021-03-01", "00:00:20")],
+                         [row[:2] for row in atm.sql.getHistoryCmd(accountId)])
+        error = atm.sql.cursor.execute("SELECT timestamp FROM errors ORDER BY id DESC LIMIT 1;").fetchone()[0]
+        self.assertEqual("2021-03-02 00:00:20", error)
+        atm.close()
+        # the session's scheduler stops following the clock once it's closed
+        self.assertEqual(listeners, len(clock.listeners))
+        scheduler.close()
+        self.assertEqual(listeners - 1, len(clock.listeners))
+
+
+    # tests daily withdrawal limits and that the daily totals can be rebuilt from history
+    def test_DailyWithdrawalLimit(self) -> None:
+        print("Testing daily withdrawal limits")
+        clock = VirtualClock(Timestamps.dayStart("2021-03-01") + 3600)
+        atm = ATM(None, self.db, clock = clock)
+        accountId, pin = atm.sql.getSingleAccountCmd()
+        otherId = atm.sql.cursor.execute("SELECT account_id FROM accounts WHERE account_id != ? LIMIT 1;",
+                                         (accountId,)).fetchone()[0]
+        atm.sql.clearAccountHistoryCmd(accountId)
+        atm.sql.cursor.execute("DELETE FROM daily_withdrawals;")
+        atm.updateATMBalance(10000)
+        atm.sql.setDailyLimitCmd(accountId, 100)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        atm.controller("deposit 500")
+
+        self.assertIn("Amount dispensed: $60", atm.controller("withdraw 60").message)
+        # a transfer counts towards the limit
+        self.assertIn("Transferred $20", atm.controller("transfer {} 20".format(otherId)).message)
+        self.assertEqual(80, atm.sql.dailyDebitsCmd(accountId))
+        self.assertEqual("This transfer would exceed your daily limit. You may transfer $20 more today.",
+                         atm.controller("transfer {} 40".format(otherId)).message)
+        self.assertEqual("This withdrawal would exceed your daily limit. You may withdraw $20 more today.",
+                         atm.controller("withdraw 40").message)
+        atm.controller("withdraw 20")
+        self.assertIs(responses.dailyLimitReached, atm.controller("withdraw 20"))
+        self.assertIs(responses.transferLimitReached, atm.controller("transfer {} 20".format(otherId)))
+        # the db refuses a debit past the limit even if the check was skipped
+        with self.assertRaises(StaleDataError):
+            atm.sql.adjustBalanceCmd(accountId, -20)
+
+        # the limit starts over on the next local day
+        clock.advance(86400)
+        self.assertIn("Amount dispensed: $100", atm.controller("withdraw 100").message)
+        incremental = atm.sql.cursor.execute(
+            "SELECT account_id, day, total FROM daily_withdrawals WHERE account_id = ? ORDER BY day;",
+            (accountId,)).fetchall()
+        self.assertEqual([(accountId, "2021-03-01", 100), (accountId, "2021-03-02", 100)], incremental)
+
+        # rebuilding from history gives the same totals
+        atm.sql.cursor.execute("DELETE FROM daily_withdrawals;")
+        self.assertGreater(atm.sql.rebuildDailyTotalsCmd(), 0)
+        rebuilt = atm.sql.cursor.execute(
+            "SELECT account_id, day, total FROM daily_withdrawals WHERE account_id = ? ORDER BY day;",
+            (accountId,)).fetchall()
+        self.assertEqual(incremental, rebuilt)
+
+        atm.sql.setDailyLimitCmd(accountId, None)
+        atm.controller("logout")
+        atm.controller("authorize {} {}".format(accountId, pin))
+        self.assertIn("Amount dispensed: $100", atm.controller("withdraw 100").message)
+        atm.close()
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
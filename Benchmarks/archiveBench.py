@@ -0,0 +1,56 @@
+from __future__ import annotations
+import argparse, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+from Classes import Timestamps
+from Benchmarks.seed import seedDatabase
+
+# hot path history cost before and after cold months are archived
+# a seeded db holds months of history for every account, the hot path inserts a row
+# and reads the first page of history, a statement reads one old month
+# run from the repo root: python Benchmarks/archiveBench.py --accounts 1000 --rows 2000
+
+def timeCalls(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def measure(sql: SQLHelper, accountIds, iterations: int) -> dict:
+    count = len(accountIds)
+    return {
+        "insert": timeCalls(lambda i: sql.execute("insertHistory", (accountIds[i % count], 20, 20, Timestamps.now())),
+                            iterations),
+        "history page": timeCalls(lambda i: sql.getHistoryPage(accountIds[i % count]), iterations),
+        "statement": timeCalls(lambda i: sql.getStatementCmd(accountIds[i % count], "2020-02"), iterations),
+        "hot rows": sql.cursor.execute("SELECT count(*) FROM history;").fetchone()[0],
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "history archive benchmark")
+    parser.add_argument("--accounts", type = int, default = 500)
+    parser.add_argument("--rows", type = int, default = 2000, help = "history rows per account, one an hour")
+    parser.add_argument("--iterations", type = int, default = 2000)
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "archive.db")
+    try:
+        accountIds = [accountId for accountId, pin in seedDatabase(db, args.accounts, args.rows)]
+        with SQLHelper(db, writeBehind = False, cache = False) as sql:
+            before = measure(sql, accountIds, args.iterations)
+            start = time.perf_counter()
+            archived = sql.archiveHistoryCmd(keepMonths = 1)
+            elapsed = time.perf_counter() - start
+            after = measure(sql, accountIds, args.iterations)
+
+        print("archived {} months, {} rows in {:.2f}s".format(len(archived), sum(archived.values()), elapsed))
+        print("{:<16}{:>14}{:>14}".format("us/call", "before", "after"))
+        for name in before:
+            print("{:<16}{:>14.1f}{:>14.1f}".format(name, before[name], after[name]))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import argparse, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.LoginThrottle import LoginThrottle
+from Classes.SQLHelper import SQLHelper
+from Classes import Pins
+
+# an attack shaped login workload, every session guesses pins for one account as fast as it can
+# run once with the throttle effectively off and once with the default limits,
+# cpu seconds per attempt and the number of pin hashes computed show what the throttle saves
+# run from the repo root: python Benchmarks/authBench.py --sessions 4 --attempts 200
+
+def attack(db: str, accountId: str, sessions: int, attempts: int, throttle: LoginThrottle) -> None:
+    atms = [ATM(None, db, throttle = throttle) for s in range(sessions)]
+    for i in range(attempts):
+        for atm in atms:
+            atm.controller("authorize {} {:04d}".format(accountId, i))
+    for atm in atms:
+        atm.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "brute force login benchmark")
+    parser.add_argument("--sessions", type = int, default = 4)
+    parser.add_argument("--attempts", type = int, default = 100, help = "guesses per session")
+    parser.add_argument("--pin-iterations", type = int, default = Pins.defaultIterations)
+    args = parser.parse_args()
+    Pins.defaultIterations = args.pin_iterations
+
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "auth.db")
+    shutil.copy("Data/atmdb_test.db", db)
+    try:
+        with SQLHelper(db) as sql:
+            accountId = sql.getSingleAccountCmd()[0]
+
+        # count the hashes computed by wrapping the verifier
+        verify = Pins.verifyPin
+        hashes = [0]
+
+        def countingVerify(pin: str, stored: str) -> bool:
+            hashes[0] += 1
+            return verify(pin, stored)
+
+        Pins.verifyPin = countingVerify
+
+        print("{:<12}{:>12}{:>12}{:>16}{:>12}".format("throttle", "attempts", "hashes", "cpu ms/attempt", "rejected"))
+        for label, throttle in (("off", LoginThrottle((10 ** 9, 1.0), (10 ** 9, 1.0))), ("default", LoginThrottle())):
+            hashes[0] = 0
+            start = time.process_time()
+            attack(db, accountId, args.sessions, args.attempts, throttle)
+            cpu = time.process_time() - start
+            total = args.sessions * args.attempts
+            print("{:<12}{:>12}{:>12}{:>16.2f}{:>12}".format(label, total, hashes[0], cpu / total * 1000,
+                                                            throttle.stats()["rejected"]))
+        Pins.verifyPin = verify
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import argparse, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes import BulkIO
+from Classes.SQLHelper import SQLHelper
+from Benchmarks.seed import seedDatabase
+
+# bulk account import and history export throughput in rows per minute, for each format
+# import reads a generated file into an empty db, export writes every history row of a seeded db
+# run from the repo root: python Benchmarks/bulkBench.py --rows 1000000
+
+def writeAccounts(path: str, rows: int, format: str) -> None:
+    with open(path, "w", buffering = 1 << 20) as out:
+        if format == "csv":
+            out.write("account_id,pin,balance\n")
+            for i in range(rows):
+                out.write("{},{:04d},{}\n".format(2000000000 + i, i % 10000, i % 5000))
+        else:
+            for i in range(rows):
+                out.write('{{"account_id": "{}", "pin": "{:04d}", "balance": {}}}\n'.format(2000000000 + i, i % 10000, i % 5000))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "bulk import and export benchmark")
+    parser.add_argument("--rows", type = int, default = 200000, help = "accounts imported and history rows exported")
+    parser.add_argument("--pin-iterations", type = int, default = 1000,
+                        help = "pbkdf2 rounds per imported pin, every pin is hashed on import")
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp()
+    try:
+        exportDb = os.path.join(tmpDir, "export.db")
+        seedDatabase(exportDb, 1000, args.rows // 1000)
+
+        print("{:<16}{:>12}{:>12}{:>16}".format("operation", "rows", "seconds", "rows/minute"))
+        for format in BulkIO.formats:
+            source = os.path.join(tmpDir, "accounts." + format)
+            writeAccounts(source, args.rows, format)
+            importDb = os.path.join(tmpDir, "import-{}.db".format(format))
+
+            start = time.perf_counter()
+            with SQLHelper(importDb, writeBehind = False, cache = False) as sql, open(source, newline = "") as lines:
+                count = sql.importAccountsCmd(BulkIO.readAccounts(lines, format), iterations = args.pin_iterations)
+            elapsed = time.perf_counter() - start
+            print("{:<16}{:>12}{:>12.2f}{:>16.0f}".format("import " + format, count, elapsed, count / elapsed * 60))
+
+            start = time.perf_counter()
+            with SQLHelper(exportDb, writeBehind = False, cache = False) as sql, \
+                    open(os.path.join(tmpDir, "history." + format), "w", newline = "") as out:
+                count = BulkIO.writeHistory(sql.exportHistoryCmd(), out, format)
+            elapsed = time.perf_counter() - start
+            print("{:<16}{:>12}{:>12.2f}{:>16.0f}".format("export " + format, count, elapsed, count / elapsed * 60))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.Dispenser import Dispenser
+
+# cost of planning a withdrawal from mixed cassettes, memoized against searching every time
+# withdrawals of random common amounts drain a terminal loaded with 20s, 50s and 100s
+# run from the repo root: python Benchmarks/dispenseBench.py --withdrawals 100000
+
+def drain(dispenser: Dispenser, amounts, memoized: bool) -> float:
+    start = time.perf_counter()
+    for amount in amounts:
+        if not memoized:
+            dispenser.memo.clear()
+        notes = dispenser.plan(amount)
+        if notes is not None:
+            dispenser.dispense(notes)
+    return (time.perf_counter() - start) / len(amounts) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "cassette dispense planner benchmark")
+    parser.add_argument("--withdrawals", type = int, default = 100000)
+    parser.add_argument("--notes", type = int, default = 20000, help = "notes loaded in each cassette")
+    parser.add_argument("--seed", type = int, default = 42)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    amounts = [rand.choice(Dispenser.commonAmounts) for i in range(args.withdrawals)]
+    notes = {20: args.notes, 50: args.notes, 100: args.notes}
+
+    print("{:<12}{:>12}".format("planning", "us/plan"))
+    for memoized in (False, True):
+        print("{:<12}{:>12.2f}".format("memoized" if memoized else "searched",
+                                       drain(Dispenser(notes), amounts, memoized)))
+
+if __name__ == "__main__":
+    main()
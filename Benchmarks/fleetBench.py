@@ -0,0 +1,87 @@
+from __future__ import annotations
+import argparse, multiprocessing, os, shutil, sqlite3, sys, tempfile, time
+from typing import Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.SQLHelper import SQLHelper
+
+# N simulated terminals, each its own process with its own account,
+# alternating withdrawals and deposits against one database
+# afterwards every terminal's cash must match what it dispensed and took in,
+# so a lost update on atm_balance shows up as a mismatch
+# run from the repo root: python Benchmarks/fleetBench.py --terminals 1 4 16
+
+startingCash = 100000
+
+# seeds a copy of the test db with one terminal and one account per simulated terminal
+def seed(db: str, terminals: int) -> None:
+    sql = SQLHelper(db)
+    sql.close()
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM atm_balance;")
+    conn.executemany("INSERT INTO atm_balance(Id, Balance) VALUES(?, ?);",
+                     [(t, startingCash) for t in range(1, terminals + 1)])
+    conn.executemany("INSERT OR IGNORE INTO accounts(account_id, pin, balance) VALUES(?, '0000', ?);",
+                     [("fleet{}".format(t), startingCash) for t in range(1, terminals + 1)])
+    conn.commit()
+    conn.close()
+
+# runs one terminal, returns (terminal id, net cash change, transactions, conflicts)
+def runTerminal(args: Tuple[str, str, int, int]) -> Tuple[int, int, int, int]:
+    db, profile, terminalId, transactions = args
+    atm = ATM(None, db, profile = profile, terminalId = terminalId)
+    atm.controller("authorize fleet{} 0000".format(terminalId))
+    net = 0
+    conflicts = 0
+
+    for i in range(transactions):
+        command = "withdraw 20" if i % 2 == 0 else "deposit 20"
+        response = atm.controller(command)
+        if response.message.startswith("Your balance changed"):
+            conflicts += 1
+        else:
+            net += -20 if i % 2 == 0 else 20
+
+    atm.controller("end")
+    atm.close()
+    return terminalId, net, transactions, conflicts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "multi terminal fleet benchmark")
+    parser.add_argument("--terminals", type = int, nargs = "+", default = [1, 4, 16])
+    parser.add_argument("--transactions", type = int, default = 500, help = "transactions per terminal")
+    parser.add_argument("--profile", default = "balanced")
+    args = parser.parse_args()
+
+    print("{:>10}{:>12}{:>12}{:>12}{:>12}".format("terminals", "tx", "tx/s", "conflicts", "lost"))
+    for terminals in args.terminals:
+        tmpDir = tempfile.mkdtemp()
+        db = os.path.join(tmpDir, "fleet.db")
+        shutil.copy("Data/atmdb_test.db", db)
+
+        try:
+            seed(db, terminals)
+            work = [(db, args.profile, t, args.transactions) for t in range(1, terminals + 1)]
+
+            start = time.perf_counter()
+            with multiprocessing.Pool(terminals) as pool:
+                results = pool.map(runTerminal, work)
+            elapsed = time.perf_counter() - start
+
+            # compare every terminal's cash with what it reported
+            sql = SQLHelper(db, cache = False)
+            lost = sum(1 for terminalId, net, tx, c in results
+                       if sql.getATMBalanceCmd(terminalId) != startingCash + net)
+            fleet = sql.getFleetCashCmd()
+            sql.close()
+
+            total = sum(result[2] for result in results)
+            print("{:>10}{:>12}{:>12.0f}{:>12}{:>12}".format(
+                terminals, total, total / elapsed, sum(result[3] for result in results), lost))
+            assert fleet["total"] == startingCash * terminals + sum(result[1] for result in results)
+        finally:
+            shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
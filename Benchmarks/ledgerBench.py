@@ -0,0 +1,63 @@
+from __future__ import annotations
+import argparse, os, random, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+from Classes.ConnectionPool import ConnectionPool
+from Classes import Timestamps
+from Benchmarks.seed import seedDatabase
+
+# postings/sec and balance reads with balances updated in place, against the append only ledger
+# at several snapshot intervals, each on a fresh copy of one seeded db
+# run from the repo root: python Benchmarks/ledgerBench.py --snapshot-every 10 100 1000
+
+def timeCalls(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "ledger mode benchmark")
+    parser.add_argument("--accounts", type = int, default = 1000)
+    parser.add_argument("--postings", type = int, default = 20000)
+    parser.add_argument("--snapshot-every", type = int, nargs = "+", default = [10, 100, 1000])
+    parser.add_argument("--profile", default = "balanced", choices = ["default", "strict", "balanced", "test"])
+    parser.add_argument("--seed", type = int, default = 42)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    tmpDir = tempfile.mkdtemp()
+    seeded = os.path.join(tmpDir, "seeded.db")
+    try:
+        accountIds = [accountId for accountId, pin in seedDatabase(seeded, args.accounts, 20, seed = args.seed)]
+        postings = [(rand.choice(accountIds), rand.choice((20, -20))) for i in range(args.postings)]
+        start = Timestamps.now()
+
+        print("{:<16}{:>14}{:>16}{:>16}".format("mode", "postings/sec", "balance us", "as of us"))
+        for snapshotEvery in [None] + args.snapshot_every:
+            db = os.path.join(tmpDir, "run.db")
+            shutil.copy(seeded, db)
+            with SQLHelper(db, profile = args.profile, writeBehind = False, cache = False) as sql:
+                if snapshotEvery is not None:
+                    sql.enableLedgerCmd(snapshotEvery)
+
+                began = time.perf_counter()
+                for accountId, amount in postings:
+                    sql.adjustBalanceCmd(accountId, amount)
+                rate = len(postings) / (time.perf_counter() - began)
+
+                count = len(accountIds)
+                balance = timeCalls(lambda i: sql.refreshAccountCmd(accountIds[i % count]), 5000)
+                asOf = timeCalls(lambda i: sql.balanceAsOfCmd(accountIds[i % count], start + 1), 5000)
+                sql.pool.close()
+            ConnectionPool.closeAll()
+            os.remove(db)
+
+            mode = "in place" if snapshotEvery is None else "ledger/{}".format(snapshotEvery)
+            print("{:<16}{:>14.0f}{:>16.1f}{:>16.1f}".format(mode, rate, balance, asOf))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import argparse, os, random, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+from Classes.ConnectionPool import ConnectionPool
+from Classes import Timestamps
+from Benchmarks.seed import seedDatabase
+
+# cost of checking what an account has withdrawn today from the maintained daily totals,
+# against summing the day's history rows, plus postings/sec with and without limits set
+# and the time to rebuild every total from history
+# run from the repo root: python Benchmarks/limitBench.py --postings 20000
+
+dayDebits = """SELECT coalesce(-sum(amount), 0) FROM history_all
+                   WHERE account_id = ? AND amount < 0 AND ts >= ? AND ts < ?;"""
+
+def timeCalls(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "daily withdrawal limit benchmark")
+    parser.add_argument("--accounts", type = int, default = 1000)
+    parser.add_argument("--history", type = int, default = 200, help = "history rows per account")
+    parser.add_argument("--postings", type = int, default = 20000)
+    parser.add_argument("--profile", default = "balanced", choices = ["default", "strict", "balanced", "test"])
+    parser.add_argument("--seed", type = int, default = 42)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    tmpDir = tempfile.mkdtemp()
+    seeded = os.path.join(tmpDir, "seeded.db")
+    try:
+        accountIds = [accountId for accountId, pin in seedDatabase(seeded, args.accounts, args.history, seed = args.seed)]
+        postings = [(rand.choice(accountIds), rand.choice((20, -20))) for i in range(args.postings)]
+        today = Timestamps.dayOf(Timestamps.now())
+        start, end = Timestamps.dayStart(today), Timestamps.dayEnd(today)
+
+        print("{:<12}{:>14}{:>16}{:>16}".format("limits", "postings/sec", "totals us", "history sum us"))
+        for limited in (False, True):
+            db = os.path.join(tmpDir, "run.db")
+            shutil.copy(seeded, db)
+            with SQLHelper(db, profile = args.profile, writeBehind = False, cache = False) as sql:
+                if limited:
+                    for accountId in accountIds:
+                        sql.setDailyLimitCmd(accountId, 10 ** 9)
+
+                began = time.perf_counter()
+                for accountId, amount in postings:
+                    sql.adjustBalanceCmd(accountId, amount)
+                rate = len(postings) / (time.perf_counter() - began)
+
+                count = len(accountIds)
+                totals = timeCalls(lambda i: sql.dailyDebitsCmd(accountIds[i % count]), 5000)
+                summed = timeCalls(lambda i: sql.cursor.execute(dayDebits, (accountIds[i % count], start, end)).fetchone(),
+                                   5000)
+
+                if limited:
+                    began = time.perf_counter()
+                    rows = sql.rebuildDailyTotalsCmd()
+                    rebuild = time.perf_counter() - began
+                sql.pool.close()
+            ConnectionPool.closeAll()
+            os.remove(db)
+
+            print("{:<12}{:>14.0f}{:>16.1f}{:>16.1f}".format("set" if limited else "none", rate, totals, summed))
+        print("rebuilt {} daily totals in {:.3f}s".format(rows, rebuild))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import argparse, asyncio, os, sys, time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Benchmarks.seed import seededAccounts
+
+# load generator for the ATM server (python main.py --serve)
+# opens N concurrent sessions, authorizes each one and replays a command mix,
+# then reports commands/sec and latency percentiles for each concurrency level
+# sessions log in as the first account of a db made by Benchmarks/seed.py, or --account and --pin
+# run from the repo root, with the server on a seeded db:
+#   python Benchmarks/seed.py bench.db 1000
+#   python main.py --serve --db bench.db
+#   python Benchmarks/loadClient.py --sessions 1 100 1000
+# note: 1000 sessions needs a file descriptor limit above 1000 (ulimit -n)
+
+# reads one framed response, terminated by a blank line
+async def readMessage(reader: asyncio.StreamReader) -> str:
+    data = await reader.readuntil(b"\n\n")
+    return data.decode()
+
+# runs one session and appends the latency of each command in seconds
+async def runSession(host: str, port: int, accountId: str, pin: str, commands: List[str],
+                     latencies: List[float]) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    await readMessage(reader)
+
+    for command in ["authorize {} {}".format(accountId, pin)] + commands:
+        start = time.perf_counter()
+        writer.write("{}\n".format(command).encode())
+        await readMessage(reader)
+        latencies.append(time.perf_counter() - start)
+
+    writer.write(b"end\n")
+    await readMessage(reader)
+    writer.close()
+
+# returns the value at percentile pct of sorted values
+def percentile(values: List[float], pct: float) -> float:
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def runLevel(args: argparse.Namespace, sessions: int, accountId: str, pin: str) -> None:
+    commands = [args.mix[i % len(args.mix)] for i in range(args.commands)]
+    latencies = list()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[runSession(args.host, args.port, accountId, pin, commands, latencies)
+                           for i in range(sessions)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("{:>8}{:>12}{:>14.0f}{:>12.2f}{:>12.2f}".format(
+        sessions, len(latencies), len(latencies) / elapsed,
+        percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "ATM server load generator")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8888)
+    accountId, pin = seededAccounts(1)[0]
+    parser.add_argument("--account", default = accountId, help = "account every session logs in as")
+    parser.add_argument("--pin", default = pin)
+    parser.add_argument("--sessions", type = int, nargs = "+", default = [1, 100, 1000])
+    parser.add_argument("--commands", type = int, default = 100, help = "commands per session")
+    parser.add_argument("--mix", nargs = "+", default = ["balance", "history"], help = "commands to cycle through")
+    args = parser.parse_args()
+
+    print("{:>8}{:>12}{:>14}{:>12}{:>12}".format("sessions", "commands", "commands/s", "p50 ms", "p99 ms"))
+    for sessions in args.sessions:
+        asyncio.run(runLevel(args, sessions, args.account, args.pin))
+
+if __name__ == "__main__":
+    main()
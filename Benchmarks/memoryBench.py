@@ -0,0 +1,70 @@
+from __future__ import annotations
+import os, sys, tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.SQLHelper import SQLHelper
+from Classes.Terminal import Terminal
+from Classes import Pins
+
+# memory held per live session and per command response
+# sessions share one terminal, as the server's do, and are logged in and out once
+# so the measurement includes the account they hold after logout
+# responses are kept alive so the bytes they hold, and how many distinct
+# response objects the commands created, can be counted
+# run from the repo root: python Benchmarks/memoryBench.py [sessions] [commands]
+
+db = "Data/atmdb_test.db"
+commandMix = ["balance", "withdraw 30", "deposit 0", "withdraw 20", "deposit 20", "history more",
+              "hello", "", "logout", "balance", "withdraw 20"]
+
+def main(sessions: int = 10000, commands: int = 100000) -> None:
+    # every session logs in, keep the pbkdf2 rounds low so the kdf doesn't swamp the measurement
+    Pins.defaultIterations = 1000
+    terminal = Terminal(db, profile = "test")
+    sql = SQLHelper(db, profile = "test")
+    accountId, pin = sql.getSingleAccountCmd()
+    # the test profile's db is in memory, so setting the pin leaves the file alone
+    sql.setPinCmd(accountId, pin)
+    live: List[ATM] = list()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(sessions):
+        atm = ATM(None, db, terminal = terminal)
+        atm.controller("authorize {} {}".format(accountId, pin))
+        atm.controller("logout")
+        live.append(atm)
+    after = tracemalloc.take_snapshot()
+    sessionBytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    atm = live[0]
+    atm.controller("authorize {} {}".format(accountId, pin))
+    responses = list()
+    before = tracemalloc.take_snapshot()
+    for i in range(commands):
+        command = commandMix[i % len(commandMix)]
+        responses.append(atm.controller(command))
+        # log back in after the logout in the mix
+        if command == "logout":
+            atm.controller("authorize {} {}".format(accountId, pin))
+    after = tracemalloc.take_snapshot()
+    responseBytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    tracemalloc.stop()
+
+    # the list itself holds one pointer per response
+    responseBytes -= sys.getsizeof(responses) - sys.getsizeof([])
+    distinct = len({id(response) for response in responses})
+
+    print("{:<32}{:>12.0f}".format("bytes per live session", sessionBytes / sessions))
+    print("{:<32}{:>12.1f}".format("bytes held per response", responseBytes / commands))
+    print("{:<32}{:>12.3f}".format("responses allocated per command", distinct / commands))
+
+    for session in live:
+        session.close()
+    sql.close()
+    terminal.close()
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.Metrics import Metrics
+from Classes.SQLHelper import SQLHelper
+
+# controller throughput with metrics disabled and enabled, on the in memory test profile
+# so the instrumentation isn't hidden behind disk time
+# run from the repo root: python Benchmarks/metricsBench.py [iterations]
+
+commandMix = ["balance", "deposit 20", "withdraw 20", "history", "hello", "balance now"]
+
+def run(atm: ATM, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        atm.controller(commandMix[i % len(commandMix)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main(iterations: int = 20000) -> None:
+    db = "Data/atmdb_test.db"
+    metrics = Metrics.shared()
+    sql = SQLHelper(db, profile = "test")
+    accountId, pin = sql.getSingleAccountCmd()
+    # the test profile's db is in memory, so setting the pin leaves the file alone
+    sql.setPinCmd(accountId, pin)
+    atm = ATM(None, db, profile = "test")
+    atm.controller("authorize {} {}".format(accountId, pin))
+
+    # warm up caches and statements before timing
+    run(atm, iterations // 10)
+    disabled = run(atm, iterations)
+    metrics.enable()
+    enabled = run(atm, iterations)
+    metrics.disable()
+
+    print("{:<24}{:>12}".format("metrics", "us/command"))
+    print("{:<24}{:>12.2f}".format("disabled", disabled))
+    print("{:<24}{:>12.2f}".format("enabled", enabled))
+    print("{:<24}{:>12.1f}%".format("overhead", (enabled - disabled) / disabled * 100))
+
+    atm.close()
+    sql.close()
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
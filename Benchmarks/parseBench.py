@@ -0,0 +1,40 @@
+from __future__ import annotations
+import os, sys, time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.Commands import parseCommand
+
+# parse throughput of the command registry for valid, invalid and mixed input,
+# plus end to end controller throughput for the same mixes (not logged in,
+# so valid commands stop at the auth check and invalid ones are logged)
+# run from the repo root: python Benchmarks/parseBench.py [iterations]
+
+validMix = ["authorize 2859459814 7386", "withdraw 40", "deposit 20", "balance", "history",
+            "history more", "logout", "WITHDRAW 100"]
+invalidMix = ["", "withdraw", "withdraw 20 40", "deposit abc", "history less", "balance now",
+              "hello", "26235742", "authorize 1", "2438g346"]
+
+def run(label: str, fn, commands: List[str], iterations: int) -> None:
+    count = len(commands)
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(commands[i % count])
+    elapsed = time.perf_counter() - start
+    print("{:<24}{:>14.0f}{:>12.2f}".format(label, iterations / elapsed, elapsed / iterations * 1e6))
+
+def main(iterations: int = 200000) -> None:
+    mixed = validMix + invalidMix
+    atm = ATM(None, "Data/atmdb_test.db", profile = "test")
+
+    print("{:<24}{:>14}{:>12}".format("workload", "commands/s", "us/command"))
+    run("parse valid", parseCommand, validMix, iterations)
+    run("parse invalid", parseCommand, invalidMix, iterations)
+    run("parse mixed", parseCommand, mixed, iterations)
+    run("controller invalid", atm.controller, invalidMix, iterations // 10)
+    run("controller mixed", atm.controller, [c for c in mixed if not c.lower().startswith("authorize")],
+        iterations // 10)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
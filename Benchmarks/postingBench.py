@@ -0,0 +1,56 @@
+from __future__ import annotations
+import argparse, os, random, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+from Benchmarks.seed import seedDatabase
+
+# postings/sec for transfers between random seeded accounts, posted through postBatchCmd
+# in batches of each size, against one adjustBalanceCmd transaction per leg as the baseline
+# run from the repo root: python Benchmarks/postingBench.py --batch-sizes 1 10 100 1000 10000
+
+def transfers(accountIds, count: int, rand: random.Random):
+    postings = list()
+    for i in range(count):
+        source, target = rand.sample(accountIds, 2)
+        postings.append([(source, -1), (target, 1)])
+    return postings
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "multi leg posting benchmark")
+    parser.add_argument("--accounts", type = int, default = 10000)
+    parser.add_argument("--postings", type = int, default = 20000, help = "transfers posted for each batch size")
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [1, 10, 100, 1000, 10000])
+    parser.add_argument("--profile", default = "default", choices = ["default", "strict", "balanced", "test"])
+    parser.add_argument("--seed", type = int, default = 42)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "postings.db")
+    try:
+        # every account starts with enough that no transfer overdraws it
+        accountIds = [accountId for accountId, pin in seedDatabase(db, args.accounts, 1, seed = args.seed)]
+        with SQLHelper(db, profile = args.profile, writeBehind = False) as sql:
+            sql.cursor.execute("UPDATE accounts SET balance = balance + ?;", (args.postings * 2,))
+
+            print("{:<16}{:>12}{:>14}".format("batch size", "postings", "postings/sec"))
+            postings = transfers(accountIds, args.postings, rand)
+            start = time.perf_counter()
+            for posting in postings:
+                with sql.transaction():
+                    for accountId, amount in posting:
+                        sql.adjustBalanceCmd(accountId, amount)
+            print("{:<16}{:>12}{:>14.0f}".format("per leg", len(postings), len(postings) / (time.perf_counter() - start)))
+
+            for size in args.batch_sizes:
+                postings = transfers(accountIds, args.postings, rand)
+                start = time.perf_counter()
+                for i in range(0, len(postings), size):
+                    sql.postBatchCmd(postings[i:i + size])
+                print("{:<16}{:>12}{:>14.0f}".format(size, len(postings), len(postings) / (time.perf_counter() - start)))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from __future__ import annotations
+import os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.ConnectionPool import ConnectionPool
+from Classes.StorageProfile import profiles
+
+# reports deposit transactions/sec for each storage profile
+# every profile runs against a fresh copy of the test database
+# run from the repo root: python Benchmarks/profileBench.py [transactions]
+
+def main(transactions: int = 2000) -> None:
+    print("{:<12}{:>14}".format("profile", "tx/s"))
+
+    for name in profiles:
+        tmpDir = tempfile.mkdtemp()
+        db = os.path.join(tmpDir, "bench.db")
+        shutil.copy("Data/atmdb_test.db", db)
+
+        try:
+            atm = ATM(None, db, profile = name)
+            accountId, pin = atm.sql.getSingleAccountCmd()
+            # the pin is set on the bench's own copy of the test db
+            atm.sql.setPinCmd(accountId, pin)
+            atm.controller("authorize {} {}".format(accountId, pin))
+
+            start = time.perf_counter()
+            for i in range(transactions):
+                atm.controller("deposit 20")
+            elapsed = time.perf_counter() - start
+
+            print("{:<12}{:>14.0f}".format(name, transactions / elapsed))
+            atm.close()
+        finally:
+            ConnectionPool.closeAll()
+            shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
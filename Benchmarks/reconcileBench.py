@@ -0,0 +1,38 @@
+from __future__ import annotations
+import argparse, os, shutil, sys, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.Reconciler import Reconciler
+from Benchmarks.seed import seedDatabase
+
+# reconciliation throughput against a synthetic history for several worker counts,
+# scaling should stay close to linear until the disk or the core count runs out
+# run from the repo root: python Benchmarks/reconcileBench.py --workers 1 2 4
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "parallel reconciliation benchmark")
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--accounts", type = int, default = 2000)
+    parser.add_argument("--rows", type = int, default = 100, help = "history rows per account")
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "reconcile.db")
+    try:
+        seedDatabase(db, args.accounts, args.rows)
+
+        print("{:>10}{:>12}{:>12}{:>12}{:>12}".format("workers", "rows", "seconds", "rows/s", "speedup"))
+        baseline = None
+        for workers in args.workers:
+            reconciler = Reconciler(db, workers)
+            discrepancies = reconciler.run()
+            stats = reconciler.stats()
+            baseline = baseline or stats["seconds"]
+            print("{:>10}{:>12}{:>12.2f}{:>12.0f}{:>12.2f}".format(
+                workers, stats["rows"], stats["seconds"], stats["rowsPerSecond"], baseline / stats["seconds"]))
+            assert not discrepancies
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os, random, sqlite3, sys
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+
+# synthetic databases for the benchmarks, the same arguments always give the same db
+# every account's history is a consistent running balance ending at accounts.balance,
+# so seeded dbs also reconcile cleanly
+# run from the repo root: python Benchmarks/seed.py out.db [accounts] [history rows per account]
+
+firstAccountId = 1000000000
+
+# account ids and pins of a seeded db, in the same order as they were created
+def seededAccounts(accounts: int, seed: int = 42) -> List[Tuple[str, str]]:
+    rand = random.Random(seed)
+    return [(str(firstAccountId + a), "{:04d}".format(rand.randrange(10000))) for a in range(accounts)]
+
+# history starts at 2020-01-01 00:00 utc
+firstTimestamp = 1577836800
+
+# one account's history, deposits and withdrawals in multiples of 20 spacing seconds apart
+def historyFor(accountId: str, rows: int, rand: random.Random,
+               spacing: int = 3600) -> Iterator[Tuple[str, int, int, int]]:
+    balance = 0
+    for i in range(rows):
+        amount = rand.choice((20, 40, 100, -20, -40)) if balance >= 40 else rand.choice((20, 40, 100))
+        balance += amount
+        yield (accountId, amount, balance, firstTimestamp + i * spacing)
+
+# creates db with the schema, atm cash, accounts and their history
+# the first account gets deepHistory rows, the others historyRows each
+# rows are generated as they're inserted so memory stays flat for any size
+def seedDatabase(db: str, accounts: int, historyRows: int = 20, deepHistory: int = 0,
+                 atmBalance: int = 10000000, seed: int = 42) -> List[Tuple[str, str]]:
+    SQLHelper(db, writeBehind = False, cache = False).close()
+    rand = random.Random(seed)
+    credentials = seededAccounts(accounts, seed)
+
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE atm_balance SET Balance = ?;", (atmBalance,))
+    for index, (accountId, pin) in enumerate(credentials):
+        rows = deepHistory if index == 0 and deepHistory else historyRows
+        # the closing balance is whatever the last generated row ends on
+        closing = [1000]
+
+        def generate() -> Iterator[Tuple[str, int, int, int]]:
+            for row in historyFor(accountId, rows, rand):
+                closing[0] = row[2]
+                yield row
+
+        conn.executemany("INSERT INTO history(account_id, amount, new_balance, ts) VALUES(?, ?, ?, ?);", generate())
+        balance = closing[0]
+        conn.execute("INSERT INTO accounts(account_id, pin, balance) VALUES(?, ?, ?);", (accountId, pin, balance))
+    conn.commit()
+    conn.close()
+    return credentials
+
+if __name__ == "__main__":
+    seedDatabase(sys.argv[1], *[int(arg) for arg in sys.argv[2:4]])
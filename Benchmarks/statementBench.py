@@ -0,0 +1,54 @@
+from __future__ import annotations
+import os, shutil, sys, tempfile, time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.SQLHelper import SQLHelper
+
+# compares the per call cost of string formatted sql (parsed and planned on every call)
+# against the registered parameterized statements (prepared once per connection)
+# run from the repo root: python Benchmarks/statementBench.py [iterations]
+
+# runs fn iterations times and returns microseconds per call
+def timeCalls(fn: Callable[[int], None], iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main(iterations: int = 20000) -> None:
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "bench.db")
+    shutil.copy("Data/atmdb_test.db", db)
+
+    try:
+        sql = SQLHelper(db)
+        cursor = sql.cursor
+        # cycle through more account ids than the statement cache holds
+        # so formatted sql can't be served from the cache by accident
+        accountIds = [sql.getSingleAccountCmd()[0]] + [str(1000000000 + n) for n in range(999)]
+        ids = len(accountIds)
+
+        # statement cache disabled, closest to the old behaviour of a new sql string per call
+        uncached = SQLHelper(db, cachedStatements = 0)
+
+        results = [
+            ("accounts formatted", lambda i: cursor.execute(
+                "SELECT * FROM accounts WHERE account_id = '{}';".format(accountIds[i % ids])).fetchone()),
+            ("accounts uncached", lambda i: uncached.accountSelectCmd(accountIds[i % ids])),
+            ("accounts prepared", lambda i: sql.accountSelectCmd(accountIds[i % ids])),
+            ("history formatted", lambda i: cursor.execute(
+                """SELECT date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'), amount, new_balance
+                    FROM history WHERE account_id = '{}' ORDER BY ts desc, id desc;""".format(accountIds[i % ids])).fetchall()),
+            ("history uncached", lambda i: uncached.getHistoryCmd(accountIds[i % ids])),
+            ("history prepared", lambda i: sql.getHistoryCmd(accountIds[i % ids])),
+        ]
+
+        print("{:<22}{:>12}".format("statement", "us/call"))
+        for name, fn in results:
+            print("{:<22}{:>12.2f}".format(name, timeCalls(fn, iterations)))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
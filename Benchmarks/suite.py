@@ -0,0 +1,194 @@
+from __future__ import annotations
+import argparse, json, os, platform, random, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Classes.ATM import ATM
+from Classes.ConnectionPool import ConnectionPool
+from Classes import Pins
+from Benchmarks.seed import seedDatabase
+
+# benchmark suite for the command pipeline, every workload runs through ATM.controller
+# against a freshly seeded synthetic db, with no inactivity timer so nothing sleeps
+# results are written as json so runs on different commits can be compared:
+#   python Benchmarks/suite.py --output before.json
+#   python Benchmarks/suite.py --output after.json --compare before.json
+# run from the repo root
+
+invalidInputs = ["", "withdraw", "withdraw 20 40", "deposit abc", "history less", "balance now",
+                 "hello", "26235742", "authorize 1", "2438g346"]
+
+class Workload:
+    # name, what it exercises, and a function that runs one operation
+    # setup runs once before timing, each operation may issue several commands
+    def __init__(self, name: str, description: str, setup: Callable[[ATM], None],
+                 operation: Callable[[ATM, int], None]) -> Workload:
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.operation = operation
+
+def buildWorkloads(credentials: List[Tuple[str, str]], seed: int) -> Dict[str, Workload]:
+    rand = random.Random(seed)
+    # accounts for the authorize storm, picked up front so picking isn't timed
+    logins = ["authorize {} {}".format(*rand.choice(credentials)) for i in range(4096)]
+    deep = "authorize {} {}".format(*credentials[0])
+    other = "authorize {} {}".format(*credentials[-1])
+
+    def login(command: str) -> Callable[[ATM], None]:
+        return lambda atm: atm.controller(command)
+
+    def authorizeStorm(atm: ATM, i: int) -> None:
+        atm.controller(logins[i % len(logins)])
+        atm.controller("logout")
+
+    def postingMix(atm: ATM, i: int) -> None:
+        atm.controller("withdraw 20" if i % 2 else "deposit 20")
+
+    def deepHistory(atm: ATM, i: int) -> None:
+        # first page, then page on until the history runs out or 10 pages are read
+        response = atm.controller("history")
+        for page in range(9):
+            if "history more" not in response.message:
+                break
+            response = atm.controller("history more")
+
+    def invalidFlood(atm: ATM, i: int) -> None:
+        atm.controller(invalidInputs[i % len(invalidInputs)])
+
+    def balanceRead(atm: ATM, i: int) -> None:
+        atm.controller("balance")
+
+    return {workload.name: workload for workload in [
+        Workload("authorizeStorm", "authorize a random account then logout", lambda atm: None, authorizeStorm),
+        Workload("postingMix", "alternating withdraw 20 and deposit 20", login(other), postingMix),
+        Workload("deepHistory", "history plus up to 9 pages of history more", login(deep), deepHistory),
+        Workload("invalidFlood", "bad input while logged out, every one is logged", lambda atm: None, invalidFlood),
+        Workload("balanceRead", "balance of the logged in account", login(other), balanceRead),
+    ]}
+
+# times every operation on its own, returns the latencies in seconds
+def runWorkload(atm: ATM, workload: Workload, iterations: int) -> List[float]:
+    workload.setup(atm)
+    latencies = list()
+    for i in range(iterations):
+        start = time.perf_counter()
+        workload.operation(atm, i)
+        latencies.append(time.perf_counter() - start)
+    atm.controller("logout")
+    return latencies
+
+def percentile(sortedValues: List[float], fraction: float) -> float:
+    return sortedValues[min(int(len(sortedValues) * fraction), len(sortedValues) - 1)]
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "operations": len(latencies),
+        "opsPerSecond": len(latencies) / elapsed,
+        "meanUs": statistics.fmean(latencies) * 1e6,
+        "medianUs": percentile(ordered, 0.5) * 1e6,
+        "p95Us": percentile(ordered, 0.95) * 1e6,
+        "p99Us": percentile(ordered, 0.99) * 1e6,
+        "maxUs": ordered[-1] * 1e6,
+    }
+
+# commit and environment the results were measured on
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                                check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+# prints the change in median latency against an earlier results file
+# returns the workloads that got slower by more than threshold
+def compare(results: Dict[str, object], baselineFile: str, threshold: float) -> List[str]:
+    with open(baselineFile) as f:
+        baseline = json.load(f)
+
+    regressions = list()
+    print("\n{:<16}{:>14}{:>14}{:>10}".format("vs " + str(baseline["environment"]["commit"]), "base us", "now us", "change"))
+    for name, result in results["workloads"].items():
+        before = baseline["workloads"].get(name)
+        if before is None:
+            continue
+        change = result["medianUs"] / before["medianUs"] - 1
+        print("{:<16}{:>14.1f}{:>14.1f}{:>+9.1f}%".format(name, before["medianUs"], result["medianUs"], change * 100))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "ATM command pipeline benchmark suite")
+    parser.add_argument("--accounts", type = int, default = 1000)
+    parser.add_argument("--history", type = int, default = 20, help = "history rows per account")
+    parser.add_argument("--deep-history", type = int, default = 5000, help = "history rows for the deepHistory account")
+    parser.add_argument("--iterations", type = int, default = 2000, help = "operations per workload per repeat")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per workload, the fastest is kept")
+    parser.add_argument("--profile", default = "default", choices = ["default", "strict", "balanced", "test"])
+    parser.add_argument("--workloads", nargs = "+", help = "only run these workloads")
+    parser.add_argument("--seed", type = int, default = 42)
+    parser.add_argument("--pin-iterations", type = int, default = 1000,
+                        help = "pbkdf2 rounds for pin hashes, kept low so the kdf doesn't swamp the pipeline")
+    parser.add_argument("--output", help = "write results as json to this file")
+    parser.add_argument("--compare", help = "results file to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.10,
+                        help = "slowdown in median latency counted as a regression")
+    args = parser.parse_args()
+
+    Pins.defaultIterations = args.pin_iterations
+    tmpDir = tempfile.mkdtemp()
+    db = os.path.join(tmpDir, "bench.db")
+    try:
+        start = time.perf_counter()
+        credentials = seedDatabase(db, args.accounts, args.history, args.deep_history, seed = args.seed)
+        seedSeconds = time.perf_counter() - start
+
+        workloads = buildWorkloads(credentials, args.seed)
+        names = args.workloads or list(workloads)
+        results = {
+            "environment": environment(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "seedSeconds": seedSeconds,
+            "workloads": dict(),
+        }
+
+        print("{:<16}{:>12}{:>12}{:>12}{:>12}".format("workload", "ops/s", "median us", "p95 us", "p99 us"))
+        for name in names:
+            best = None
+            for run in range(args.repeat):
+                atm = ATM(None, db, profile = args.profile)
+                start = time.perf_counter()
+                latencies = runWorkload(atm, workloads[name], args.iterations)
+                summary = summarize(latencies, time.perf_counter() - start)
+                atm.close()
+                if best is None or summary["medianUs"] < best["medianUs"]:
+                    best = summary
+
+            results["workloads"][name] = best
+            print("{:<16}{:>12.0f}{:>12.1f}{:>12.1f}{:>12.1f}".format(
+                name, best["opsPerSecond"], best["medianUs"], best["p95Us"], best["p99Us"]))
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent = 2)
+
+        regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    finally:
+        ConnectionPool.closeAll()
+        shutil.rmtree(tmpDir)
+
+    if regressions:
+        print("regressed: {}".format(", ".join(regressions)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
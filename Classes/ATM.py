@@ -1,33 +1,84 @@
 from __future__ import annotations
-from typing import List
+from typing import Callable, Dict, Tuple
 from Classes.ControllerResponse import ControllerResponse
+import Classes.ControllerResponse as responses
+from Classes.Commands import parseCommand
 from Classes.Account import Account
-from Classes.SQLHelper import SQLHelper
-from threading import Timer, Event
+from Classes.SQLHelper import StaleDataError
+from Classes.Terminal import Terminal
+from Classes.InactivityScheduler import InactivityScheduler
+from Classes.Metrics import Metrics
+from Classes.LoginThrottle import LoginThrottle
+from Classes.Clock import Clock
+from Classes import Timestamps
+from threading import RLock
+import time
 
 class ATM:
     # constructor, inactive logout time by default is 2 minutes
     # db by default is atmdb
-    def __init__(self, inactiveTime: int = 120, db: str = "Data/atmdb.db") -> ATM:
-        # commands that require and account to be authorized before running
-        self.preauthCmds = ["withdraw", "deposit", "balance", "history"]
-        self.sql = SQLHelper(db)
-        self.atmBalance = self.sql.getATMBalanceCmd()
+    # history is returned historyPageSize rows at a time
+    # sessions that share a terminal share its cash balance and db connection,
+    # a private terminal is created when none is given
+    # inactiveTime of None disables the inactivity logout
+    # inactivity deadlines are tracked by the shared scheduler unless one is given,
+    # executor hands expiry back to the session's thread or event loop (e.g. loop.call_soon_threadsafe),
+    # without one the logout runs on the scheduler thread under the session lock
+    # profile picks the storage profile (default, strict, balanced, test) for a private terminal
+    # terminalId picks which atm_balance row a private terminal dispenses from
+    # failed authorizations are counted by the shared throttle unless one is given
+    # clock is what deadlines and timestamps are read from, the real clock unless one is given,
+    # sessions on a virtual clock get their own scheduler and throttle on it unless given them
+    def __init__(self, inactiveTime: int = 120, db: str = "Data/atmdb.db", historyPageSize: int = 20,
+                 terminal: Terminal = None, scheduler: InactivityScheduler = None,
+                 executor: Callable[[Callable[[], None]], None] = None, profile: str = "default",
+                 terminalId: int = 1, throttle: LoginThrottle = None, clock: Clock = None) -> ATM:
+        self.clock = clock if clock is not None else Clock.shared()
+        # only close the terminal if this session created it
+        self.ownsTerminal = terminal is None
+        self.terminal = terminal if terminal is not None else Terminal(db, terminalId, profile = profile, clock = self.clock)
+        self.sql = self.terminal.sql
         self.inactiveTime = inactiveTime
-        # timer that after inactiveTime runs inactiveLogout method
-        self.timer = Timer(self.inactiveTime, self.inactiveLogout)
-        self.activeTimer = False
+        # a scheduler made for this session's virtual clock is closed with the session
+        self.ownsScheduler = scheduler is None and self.clock.virtual
+        if scheduler is None:
+            scheduler = InactivityScheduler(self.clock) if self.clock.virtual else InactivityScheduler.shared()
+        self.scheduler = scheduler
+        self.executor = executor
+        # monotonic time the session expires at, None when no deadline is pending
+        self.inactiveDeadline = None
+        # serializes commands with inactivity expiry
+        self.lock = RLock()
         self.db = db
-        self.account = Account(self.db)
+        self.account = Account(self.db, self.sql, self.clock)
+        self.historyPageSize = historyPageSize
+        # keyset cursor for the next page of history, None when there isn't one
+        self.historyCursor = None
+        self.metrics = Metrics.shared()
+        if throttle is None:
+            throttle = LoginThrottle(clock = self.clock) if self.clock.virtual else LoginThrottle.shared()
+        self.throttle = throttle
+        # a pin check already run off the session's thread, (account id, pin, Pins.checkPin result)
+        self.checkedPin = None
+
+    # cash balance of the terminal this session runs on
+    @property
+    def atmBalance(self) -> int:
+        return self.terminal.balance
+
+    @atmBalance.setter
+    def atmBalance(self, amount: int) -> None:
+        self.terminal.balance = amount
 
     # updates atm balance in memory and in db
     # to specified amount
     def updateATMBalance(self, amount: int):
-        self.sql.updateATMBalance(amount)
-        self.atmBalance = amount
+        self.terminal.updateBalance(amount)
 
     # updates atm and account balances
-    def updateBalances(self, amount: int, withdrawal: bool, overdraft: bool = False) -> None:
+    # notes are the cassette notes a withdrawal is dispensed in, None for a terminal without cassettes
+    def updateBalances(self, amount: int, withdrawal: bool, overdraft: bool = False,
+                       notes: Dict[int, int] = None) -> None:
         actAmt = amount
         atmAmt = amount
 
@@ -40,287 +91,331 @@ class ATM:
             actAmt *= -1
             atmAmt *= -1
         
-        # run methods to update atm and account balances
-        newAtmBal = self.atmBalance + atmAmt
-        self.updateATMBalance(newAtmBal)
-        self.account.updateAccountBalance(actAmt)
-
-    # uses accountSelectCmd from sqlhelper to get account using account id
-    # checks that the provided pin matches the pin on file
-    # if pin matches account is authorized, otherwise account is not authorized
+        # the withdraw/overdraft decision was made on the balances in memory,
+        # the posting only goes through if the db balances still lead to the same decision
+        minBalance = maxBalance = minATMBalance = None
+        if withdrawal:
+            minATMBalance = amount
+            if overdraft:
+                minBalance, maxBalance = 0, amount
+            else:
+                minBalance = amount
+
+        # post atm and account balance changes in a single transaction
+        # then update the in memory copies from what was committed
+        posted = self.sql.postTransactionCmd(self.account.accountId, actAmt, atmAmt, self.terminal.terminalId,
+                                             minBalance, maxBalance, minATMBalance, notes)
+        self.account.balance, self.account.version, self.atmBalance, self.terminal.version = posted
+        if notes:
+            self.terminal.dispenser.dispense(notes)
+
+    # reloads account and atm balances after a posting conflicted
+    def refreshBalances(self, error: StaleDataError = None) -> None:
+        self.account.refresh()
+        self.terminal.refresh()
+
+    # checks the pin against its salted hash with verifyPinCmd, which reads only the pin columns
+    # if pin matches account is authorized and its row loaded, otherwise account is not authorized
+    # accounts and sessions with too many recent failures are turned away before the db is touched
     def authorize(self, accountId: str, pin: str) -> ControllerResponse:
-        response = ControllerResponse()
-
         # check if an account is already authorized, if one is then return
         if self.account.isAuthorized:
-            message = "An account is already authorized. Logout before authorizing another account."
-            response.addResponseMsg(message)
-            return response
+            return responses.alreadyAuthorized
 
-        # validate that account sql object is valid
-        # it's possible that it could have been cleared
-        # due to inactivity
-        if self.account.sql is None:
-            self.account.sql = SQLHelper(self.db)
+        if self.throttle.blocked(accountId, self):
+            return responses.authorizationThrottled
 
-        # search for account data
-        actData = self.sql.accountSelectCmd(accountId)
+        # unknown accounts and wrong pins fail the same way
+        checked = self.checkedPin[2] if self.checkedPin is not None and self.checkedPin[:2] == (accountId, pin) else None
+        self.checkedPin = None
+        if not self.sql.verifyPinCmd(accountId, pin, checked):
+            self.throttle.fail(accountId, self)
+            return responses.authorizationFailed
 
-        # if no account exists with the provided account id then return
-        # failed authorization
+        actData = self.sql.accountSelectCmd(accountId)
         if not actData:
-            message = "Authorization failed."
-            response.addResponseMsg(message)
-            return response
-
-        # get pin number
-        actPin = actData[2]
-
-        # if the pin on file matches the provided pin then authorize account
-        if actPin == pin:
-            balance = actData[3]
-            self.account.addAccountDetails(accountId, balance, True)
-            message = "{} successfully authorized.".format(accountId)
-        # otherwise fail authorization
-        else:
-            message = "Authorization failed."
+            return responses.authorizationFailed
 
-        response.addResponseMsg(message)
-        return response
+        self.throttle.succeed(accountId, self)
+        self.account.addAccountDetails(accountId, actData[3], True, actData[4], actData[6])
+        return ControllerResponse("{} successfully authorized.".format(accountId))
+
+    # the pin columns authorize will check a pin for accountId against, None if it would turn
+    # the login away first, so a server can run the kdf off its event loop and set checkedPin
+    def pinRecord(self, accountId: str) -> Tuple[str, str]:
+        if self.account.isAuthorized or self.throttle.blocked(accountId, self, record = False):
+            return None
+        return self.sql.pinRecordCmd(accountId)
 
     # validate that account is authorized the withdraw amount
     # validate that atm and account have enough money
+    # a terminal with cassettes dispenses the notes its dispenser plans, any amount they can make is valid
     def withdraw(self, amount: int) -> ControllerResponse:
-        response = ControllerResponse()
-
-        # if the amount is not greater than 0 and not an increment of 20 update response message
+        dispenser = self.terminal.dispenser
+        # if the amount is not greater than 0 and not an increment of 20
         # exit immediately
-        if amount <= 0 or amount % 20 != 0:
-            message = "Withdrawal amount must be greater than 0 and in increments of 20."
-            response.addResponseMsg(message)
-            return response
-        # if the account is overdrawn update the response message
-        # and exit immediately
+        if amount <= 0 or (dispenser is None and amount % 20 != 0):
+            return responses.invalidWithdrawal
+        # if the account is overdrawn exit immediately
         elif self.account.balance < 0:
-            message = "Your account is overdrawn! You may not make withdrawals at this time."
-            response.addResponseMsg(message)
-            return response
-        # if the atm has no money update response message and return
+            return responses.overdrawn
+        # if the atm has no money return
         elif self.atmBalance == 0:
-            message = "Unable to process your withdrawal at this time."
-            response.addResponseMsg(message)
-            return response
+            return responses.atmEmpty
         
         message = ""
+        notes = None
 
+        # if the cassettes can't make the amount, dispense the most they can make below it
+        # prepend unable to dispense full amount message to return message
+        if dispenser is not None:
+            notes = dispenser.plan(amount)
+            if notes is None:
+                dispensable, notes = dispenser.largestPlan(amount)
+                if notes is None:
+                    return responses.atmEmpty
+                message = "Unable to dispense full amount requested at this time. "
+                amount = dispensable
         # if there isn't enough in the atm, update amount requested to atm balance
         # prepend unable to dispense full amount message to return message
-        if amount > self.atmBalance:
+        elif amount > self.atmBalance:
             message = "Unable to dispense full amount requested at this time. "
             amount = self.atmBalance
 
+        # the overdraft fee counts towards the daily limit too
+        refused = self.checkDailyLimit(amount if amount <= self.account.balance else amount + 5, False)
+        if refused is not None:
+            return refused
+
         # if there is enough in the account
         # update account and atm balance
         if amount <= self.account.balance:
-            self.updateBalances(amount, True)
+            self.updateBalances(amount, True, notes = notes)
             message += "Amount dispensed: ${}\nCurrent balance: {}".format(amount, round(self.account.balance,2))
         # if there is money in the account but not enough
         # add an extra 5 to withdrawal amount
         # update account and atm balance
         elif 0 <= self.account.balance < amount:
-            self.updateBalances(amount, True, True)
+            self.updateBalances(amount, True, True, notes)
             message += ("Amount dispensed: ${}\nYou have been charged an overdraft fee of "
                         "$5. Current balance: {}").format(amount, round(self.account.balance,2))
 
-        # update response message
-        response.addResponseMsg(message)
-        return response
+        return ControllerResponse(message)
 
 
     # deposits provided amount into bank account
     def deposit(self, amount: int) -> ControllerResponse:
-        if amount > 0:
-            self.updateBalances(amount, False)
-            message = "Current balance: {}".format(round(self.account.balance,2))
-        else:
-            message = "Deposit amount must be greater than 0."
-        
-        # update response and return
-        response = ControllerResponse()
-        response.addResponseMsg(message)
-        return response
+        if amount <= 0:
+            return responses.invalidDeposit
+
+        self.updateBalances(amount, False)
+        return ControllerResponse("Current balance: {}".format(round(self.account.balance,2)))
+
+    # moves amount from the authorized account to another one as a single two leg posting
+    # transfers can't overdraw the account, so there's no overdraft fee
+    def transfer(self, toAccountId: str, amount: int) -> ControllerResponse:
+        if amount <= 0:
+            return responses.invalidTransfer
+        elif amount > self.account.balance:
+            return responses.insufficientFunds
+        elif toAccountId == self.account.accountId or not self.sql.accountSelectCmd(toAccountId):
+            return responses.transferFailed
+        refused = self.checkDailyLimit(amount, True)
+        if refused is not None:
+            return refused
+
+        # the balance check was made on the balance in memory, the posting only goes through
+        # if the db balance still covers it
+        posted = self.sql.postBatchCmd([[(self.account.accountId, -amount), (toAccountId, amount)]])
+        self.account.balance, self.account.version = posted[str(self.account.accountId)]
+        return ControllerResponse("Transferred ${} to {}.\nCurrent balance: {}".format(
+            amount, toAccountId, round(self.account.balance,2)))
+
+    # refuses a debit that would take the account past its daily limit, None when it's allowed
+    # the day's total is one primary key lookup, the posting itself is guarded in the db
+    # transfer picks the wording, withdrawals and transfers count towards the same limit
+    def checkDailyLimit(self, debit: int, transfer: bool) -> ControllerResponse:
+        if self.account.dailyLimit is None:
+            return None
+        remaining = self.account.dailyLimit - self.sql.dailyDebitsCmd(self.account.accountId)
+        if remaining <= 0:
+            return responses.transferLimitReached if transfer else responses.dailyLimitReached
+        if debit > remaining:
+            return ControllerResponse("This {} would exceed your daily limit. You may {} ${} more today.".format(
+                *(("transfer", "transfer") if transfer else ("withdrawal", "withdraw")), remaining))
+        return None
 
     # Finds balance of authorized account
-    def getBalance(self) -> ControllerResponse:
-        response = ControllerResponse()
-        response.addResponseMsg("Current balance: {}".format(round(self.account.balance,2)))
-        return response
-
-    # get history from db then format into string
-    def getHistory(self) -> ControllerResponse:
-        message = ""
-        sqlData = self.sql.getHistoryCmd(self.account.accountId)
+    # with a yyyy-mm-dd date, the balance at the end of that day
+    def getBalance(self, date: str = None) -> ControllerResponse:
+        if date is None:
+            return ControllerResponse("Current balance: {}".format(round(self.account.balance,2)))
+
+        balance = self.sql.balanceAsOfCmd(self.account.accountId, Timestamps.dayEnd(date))
+        if balance is None:
+            return ControllerResponse("No balance found for {}".format(date))
+        return ControllerResponse("Balance as of {}: {}".format(date, round(balance,2)))
+
+    # get a page of history from db then format into string
+    # history starts from the newest row, history more continues from the last page
+    def getHistory(self, more: bool = False) -> ControllerResponse:
+        if more and self.historyCursor is None:
+            sqlData = []
+        else:
+            after = self.historyCursor if more else None
+            sqlData, self.historyCursor = self.sql.getHistoryPage(self.account.accountId, after, self.historyPageSize)
 
-        # if no history found update message
+        # if no history found return the shared message
         # otherwise grab history
         if len(sqlData) == 0:
-            message = "No history found"
-        else:
-            for row in sqlData:
-                message += "{} {} {} {}\n".format(row[0], row[1], round(row[2],2), round(row[3],2))
-        
-        response = ControllerResponse()
-        response.addResponseMsg(message)
-        return response
+            return responses.noMoreHistory if more else responses.noHistory
+
+        lines = ["{} {} {} {}\n".format(row[0], row[1], round(row[2],2), round(row[3],2)) for row in sqlData]
+        if self.historyCursor is not None:
+            lines.append("Enter 'history more' to see more.\n")
+        return ControllerResponse("".join(lines))
+
 
+    # the account's history for a yyyy-mm month, oldest first
+    # only the month's partition is read, archived or not
+    def getStatement(self, month: str) -> ControllerResponse:
+        sqlData = self.sql.getStatementCmd(self.account.accountId, month)
+        if len(sqlData) == 0:
+            return ControllerResponse("No history found for {}".format(month))
+
+        lines = ["Statement for {}\n".format(month)]
+        lines.extend("{} {} {} {}\n".format(row[0], row[1], round(row[2],2), round(row[3],2)) for row in sqlData)
+        return ControllerResponse("".join(lines))
 
     # if an account is logged in then log out and update response message
     # if no account is logged in then just update response message
+    # the session's account object is cleared and reused for the next login
     def logout(self) -> ControllerResponse:
-        if self.account.isAuthorized:
-            message = "Account {} logged out.".format(self.account.accountId)
-            self.account = Account(self.db)
-        else:
-            message = "No account is currently authorized."
-        
-        response = ControllerResponse()
-        response.addResponseMsg(message)
-        return response
+        if not self.account.isAuthorized:
+            return responses.notAuthorized
 
-    # method that is called by timer when time is up
-    # logs out user and sets active timer flag to false
-    def inactiveLogout(self) -> None:
+        message = "Account {} logged out.".format(self.account.accountId)
         self.account.clearAccountDetails()
-        self.activeTimer = False
-        self.timer = Timer(self.inactiveTime, self.inactiveLogout)
+        self.historyCursor = None
+        return ControllerResponse(message)
 
-    # starts the inactive timer if one isn't running and account is authorized
+    # logs out user and clears the pending deadline
+    def inactiveLogout(self) -> None:
+        self.account.clearAccountDetails()
+        self.historyCursor = None
+        self.inactiveDeadline = None
+
+    # called by the scheduler when the deadline is due
+    # a command may have started after the deadline was popped, so only
+    # log out if the deadline it was scheduled for is still the current one
+    def inactiveExpired(self) -> None:
+        with self.lock:
+            if self.inactiveDeadline is not None and self.clock.monotonic() >= self.inactiveDeadline:
+                self.inactiveLogout()
+
+    # schedules the inactivity deadline if account is authorized
     def startInactiveTimer(self) -> None:
-        if self.account.isAuthorized and not self.activeTimer:
-            self.timer.start()
-            self.activeTimer = True
+        if self.inactiveTime is not None and self.account.isAuthorized:
+            self.inactiveDeadline = self.scheduler.schedule(self, self.inactiveTime, self.inactiveExpired, self.executor)
 
-    # stops the inactive timer if one is running
+    # drops the pending inactivity deadline, if there is one
     def stopInactiveTimer(self) -> None:
-        # if a timer is running, cancel timer, reset flag
-        # and create new timer object
-        if self.activeTimer:
-            self.timer.cancel()
-            self.activeTimer = False
-            self.timer = Timer(self.inactiveTime, self.inactiveLogout)
+        if self.inactiveDeadline is not None:
+            self.scheduler.cancel(self)
+            self.inactiveDeadline = None
+
+    # stops the inactivity deadline and releases the session's connection
+    def close(self) -> None:
+        self.stopInactiveTimer()
+        self.throttle.forget(self)
+        if self.ownsScheduler:
+            self.scheduler.close()
+        if self.ownsTerminal:
+            self.terminal.close()
 
     # end program
+    # flushes queued history and error rows before ending
     def endProgram(self) -> ControllerResponse:
-        response = ControllerResponse()
-        response.setEndFlag()
-        response.addResponseMsg("Goodbye!")
-        return response
+        self.sql.flush()
+        return responses.goodbye
+
+    # admin command, returns the process metrics as prometheus text or json
+    def getStats(self, format: str = "prometheus") -> ControllerResponse:
+        if format == "json":
+            return ControllerResponse(self.metrics.toJson())
+        return ControllerResponse(self.metrics.toPrometheus().rstrip("\n"))
 
     # logs error to db
-    def logError(self, error: Exception) -> None:
+    # error is an exception or the reason input was rejected
+    def logError(self, error: object) -> None:
         errorMsg = str(error)
-        # escape single quotes
-        errorMsg = errorMsg.replace("'","''")
         self.sql.logErrorCmd(self.account.accountId, errorMsg)
 
-    # validates user input
-    # checks length and data types
-    def validateInput(self, usrInput: str) -> List[object]:
-        # strip and split user input
-        cmdParts = usrInput.strip().split()
-
-        # no command should have over 3 arguments, raise exception
-        if len(cmdParts) > 3:
-            raise Exception("Too many arguments detected in command: {}".format(usrInput))
-
-        firstPart = cmdParts[0].lower()
-        # commands that should only have 2 parts
-        twoPartCmds = ["withdraw", "deposit"]
-        onePartCmds = ["balance", "history", "logout", "end"]
-
-        # if the command has three parts it should be authorize
-        if len(cmdParts) == 3 and firstPart != "authorize":
-            raise Exception("Too many arguments detected in command: {}".format(usrInput))
-        # if it has two pasts it should just be withdraw or deposit
-        elif len(cmdParts) == 2 and firstPart not in twoPartCmds:
-             raise Exception("Too many arguments detected in command: {}".format(usrInput))
-        # if in one part commands, should only be one command
-        elif firstPart in onePartCmds and len(cmdParts) != 1:
-             raise Exception("Too many arguments detected in command: {}".format(usrInput))
-
-        validCmds = list()
-        validCmds.append(firstPart)
-
-        # is this is an authorize command then list should have strings
-        if firstPart == "authorize":
-            for i in range(1, len(cmdParts)):
-                argVal = cmdParts[i].strip()
-                validCmds.append(argVal)
-
-        # otherwise first command should be strings
-        # all others should be ints if len > 1
-        elif len(cmdParts) > 1:
-            for i in range(1, len(cmdParts)):
-                argVal = int(cmdParts[i].strip())
-                validCmds.append(argVal)
-        
-        return validCmds
-        
+    # returns the generic response for bad input
+    def invalidCommand(self) -> ControllerResponse:
+        return responses.invalidCommand
+
+    # runs a command under the session lock so it can't interleave
+    # with an inactivity logout
+    def controller(self, userInput: str) -> ControllerResponse:
+        with self.lock:
+            return self.routeCommand(userInput)
 
     # controls logic flow of class
-    # routes to different methods based on valid user input
+    # parses user input against the command registry and runs its handler
     # starts and stops inactivity timer
-    def controller(self, userInput: str) -> ControllerResponse:
+    # with metrics enabled each phase of the command is timed
+    def routeCommand(self, userInput: str) -> ControllerResponse:
+        timed = self.metrics.enabled
+        # perf_counter time the handler started, None if the command was rejected
+        authorizedAt = None
+        if timed:
+            self.metrics.takeDbTime()
+            start = time.perf_counter()
+
         self.stopInactiveTimer()
+        parsed = parseCommand(userInput)
+        if timed:
+            parsedAt = time.perf_counter()
+
+        # bad input is logged and gets a generic response
+        if parsed.error is not None:
+            self.logError(parsed.error)
+            response = self.invalidCommand()
+        # commands that need an authorized account
+        elif parsed.command.requiresAuth and not self.account.isAuthorized:
+            response = responses.authorizationRequired
+        else:
+            # minimal error handling for simplicity
+            # if the handler fails log and return generic response
+            # if another session or process moved the balances on since they were read
+            # nothing was written, the balances are reloaded and the command run again
+            handler = getattr(self, parsed.command.handler)
+            if timed:
+                authorizedAt = time.perf_counter()
+                # statements run by the auth check and error logging aren't the handler's
+                self.metrics.takeDbTime()
+            try:
+                response = self.sql.retryOnConflict(lambda: handler(*parsed.args), onConflict = self.refreshBalances)
+            # still conflicting after retrying, ask for the command again
+            except StaleDataError as e:
+                self.logError(e)
+                self.refreshBalances()
+                response = responses.balanceChanged
+            except Exception as e:
+                self.logError(e)
+                response = self.invalidCommand()
 
-        # minimal error handling for simplicity
-        # one try block, if error occurs log and return generic response
-        try:
-            # raise exception
-            if len(userInput.strip()) == 0:
-                raise Exception("No input detected.")
-            # parse commands if valid, exception raised if not valid
-            cmds = self.validateInput(userInput)
-            initArg = cmds[0]
-            
-            # if the command is in the list of commands that need authorization
-            # validate that the account is authorized
-            if initArg in self.preauthCmds:
-                # if the account is authorized then route and run command
-                if self.account.isAuthorized:
-                    if initArg == "withdraw":
-                        response = self.withdraw(cmds[1])
-                    elif initArg == "deposit":
-                        response = self.deposit(cmds[1])
-                    elif initArg == "balance":
-                        response = self.getBalance()
-                    elif initArg == "history":
-                        response = self.getHistory()
-                # if the account isn't authorized, update response
-                else:
-                    response = ControllerResponse()
-                    response.addResponseMsg("Authorization required.")
-            # if command doesn't need preauth then run them
-            elif initArg == "authorize":
-                response = self.authorize(cmds[1], cmds[2])
-            elif initArg == "logout":
-                response = self.logout()
-            elif initArg == "end":
-                response = self.endProgram()
-            # otherwise command isn't recognized, throw error
-            else:
-                raise Exception("Invalid command detected: {}".format(userInput))
-
-        # if there is an error, log to db and update controller message
-        except Exception as e:
-            self.logError(e)
-            message = "Invalid command detected."
-            response = ControllerResponse()
-            response.addResponseMsg(message)
-            response.updateErrorFlag(True)
-        
         # start inactive timer unless if program is ending
         if not response.end:
             self.startInactiveTimer()
 
-        return response
\ No newline at end of file
+        if timed:
+            if authorizedAt is None:
+                # rejected before a handler ran, whatever it cost was the check
+                authorizedAt = time.perf_counter()
+                self.metrics.takeDbTime()
+            verb = parsed.command.verb if parsed.command is not None else "invalid"
+            self.metrics.recordCommand(verb, start, parsedAt, authorizedAt, time.perf_counter())
+
+        return response
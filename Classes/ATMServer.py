@@ -0,0 +1,88 @@
+from __future__ import annotations
+import asyncio
+from Classes.ATM import ATM
+from Classes.Terminal import Terminal
+from Classes.Commands import parseCommand
+from Classes import Pins
+
+class ATMServer:
+    # serves the ATM line protocol to many connections from one process
+    # every connection is its own ATM session (account, inactivity deadline)
+    # all sessions share one terminal, so one cash balance and one db writer
+    # everything runs on the event loop thread, so db access is never concurrent,
+    # except the pin kdf at login which runs in the loop's executor so a login doesn't stall every session
+    def __init__(self, host: str = "127.0.0.1", port: int = 8888, inactiveTime: int = 120,
+                 db: str = "Data/atmdb.db", profile: str = "default", terminalId: int = 1) -> ATMServer:
+        self.host = host
+        self.port = port
+        self.inactiveTime = inactiveTime
+        self.db = db
+        self.terminal = Terminal(db, terminalId, profile = profile)
+        self.sessions = 0
+
+    # writes a response using the same framing as the interactive loop
+    # a message is always terminated by a single blank line
+    def writeMessage(self, writer: asyncio.StreamWriter, message: str) -> None:
+        writer.write("{}\n\n".format(message.rstrip("\n")).encode())
+
+    # runs one session until the client sends end or disconnects
+    # inactivity expiry is handed back to the event loop so it never runs
+    # concurrently with the session's commands
+    async def handleSession(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        atm = ATM(self.inactiveTime, self.db, terminal = self.terminal, executor = loop.call_soon_threadsafe)
+        self.sessions += 1
+        self.writeMessage(writer, "Welcome to ATM-Bot 2000. Please enter a command!")
+
+        try:
+            end = False
+            while not end:
+                await writer.drain()
+                line = await reader.readline()
+
+                # client went away
+                if not line:
+                    break
+
+                text = line.decode(errors = "replace")
+                await self.checkPin(atm, text)
+                response = atm.controller(text)
+
+                # write message if it exists
+                if response.message:
+                    self.writeMessage(writer, response.message)
+
+                end = response.end
+
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            atm.close()
+            self.sessions -= 1
+            writer.close()
+
+    # runs the pin check for an authorize command in the executor, the db reads stay on the loop
+    # authorize then picks up the result instead of hashing on the loop
+    async def checkPin(self, atm: ATM, text: str) -> None:
+        parsed = parseCommand(text)
+        if parsed.error is not None or parsed.command.handler != "authorize":
+            return
+        accountId, pin = parsed.args
+        record = atm.pinRecord(accountId)
+        if record is not None:
+            checked = await asyncio.get_running_loop().run_in_executor(None, Pins.checkPin, pin, *record)
+            atm.checkedPin = (accountId, pin, checked)
+
+    # starts listening, returns the asyncio server
+    async def start(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handleSession, self.host, self.port, backlog = 1024)
+
+    # listens until cancelled
+    async def serveForever(self) -> None:
+        server = await self.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.terminal.close()
@@ -1,35 +1,53 @@
 from __future__ import annotations
 from Classes.SQLHelper import SQLHelper
+from Classes.Clock import Clock
 import typing
 
 class Account:
-    def __init__(self, db: str = "Data/atmdb.db") -> Account:
+    # slots instead of a per instance dict, every session holds one
+    __slots__ = ("accountId", "balance", "version", "isAuthorized", "dailyLimit", "sql")
+
+    # sql is the connection to post through, a new one is opened on clock when none is given
+    def __init__(self, db: str = "Data/atmdb.db", sql: SQLHelper = None, clock: Clock = None) -> Account:
         self.accountId = None
         self.balance = None
+        # row version the balance was read at, writes fail if the db has moved on
+        self.version = None
         self.isAuthorized = False
-        self.sql = SQLHelper(db)
+        # most the account may be debited in a day, None for no limit
+        self.dailyLimit = None
+        self.sql = sql if sql is not None else SQLHelper(db, clock = clock)
 
     # updates account details
-    def addAccountDetails(self, accountId: str, balance: int, isAuthorized: bool = True) -> None:
+    def addAccountDetails(self, accountId: str, balance: int, isAuthorized: bool = True, version: int = None,
+                          dailyLimit: int = None) -> None:
         self.accountId = accountId
         self.balance = balance
+        self.version = version
         self.isAuthorized = isAuthorized
+        self.dailyLimit = dailyLimit
 
     # update account balance in db and in memory
     # if withdrawal, change amount to negative
-    # amount is added to current amount (doesn't just set the amount)
+    # amount is added to the balance in the db (doesn't just set the amount)
+    # so changes made by other sessions are never overwritten
     # also update account history in db
     def updateAccountBalance(self, amount: int) -> None:
-        newBalance = self.balance + amount
-        self.sql.updateBalanceCmd(self.accountId, amount, newBalance)
-        self.balance = newBalance
+        self.balance, self.version = self.sql.adjustBalanceCmd(self.accountId, amount)
+
+    # reloads the balance from the db after another session changed it
+    def refresh(self) -> None:
+        actData = self.sql.refreshAccountCmd(self.accountId)
+        self.balance = actData[3]
+        self.version = actData[4]
+        self.dailyLimit = actData[6]
 
     # Clears all account details
-    # This method is mainly to be used for inactive logout
-    # As we can't create a new sqllite object in a different thread
+    # used on logout and inactive logout, the object is reused for the next login
     def clearAccountDetails(self) -> None:
         self.accountId = None
         self.balance = None
+        self.version = None
         self.isAuthorized = False
-        self.sql = None
+        self.dailyLimit = None
 
@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, Hashable, Tuple
+from collections import OrderedDict
+from threading import Lock
+
+if TYPE_CHECKING:
+    from Classes.ConnectionPool import ConnectionPool
+
+class AccountCache:
+    # LRU cache of account rows and atm balances shared by every helper on a pool
+    # entries carry the row version they were read at, writes are checked against
+    # that version in the db so a row changed by another process is detected
+    # rather than overwritten, and the stale entry is dropped
+    # reads check the version too before a cached row is used, see SQLHelper.checkedCache
+    caches: Dict[int, AccountCache] = dict()
+    cachesLock = Lock()
+
+    def __init__(self, pool: ConnectionPool, maxSize: int = 10000) -> AccountCache:
+        self.pool = pool
+        self.maxSize = maxSize
+        # ("account", account id) or ("atm", atm id) -> row
+        self.entries: OrderedDict[Hashable, Tuple[object, ...]] = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    # returns the cache shared by every helper on a pool
+    @classmethod
+    def forPool(cls, pool: ConnectionPool) -> AccountCache:
+        with cls.cachesLock:
+            cache = cls.caches.get(id(pool))
+            if cache is None or cache.pool is not pool:
+                cache = AccountCache(pool)
+                cls.caches[id(pool)] = cache
+            return cache
+
+    # returns the cached row, or None on a miss
+    def get(self, key: Hashable) -> Tuple[object, ...]:
+        with self.lock:
+            row = self.entries.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return row
+
+    # stores a row, evicting the least recently used entry when full
+    def put(self, key: Hashable, row: Tuple[object, ...]) -> None:
+        with self.lock:
+            self.entries[key] = row
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxSize:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    # write through, replaces the given columns of a cached row
+    # rows that aren't cached are left uncached
+    def update(self, key: Hashable, columns: Dict[int, object]) -> None:
+        with self.lock:
+            row = self.entries.get(key)
+            if row is not None:
+                self.entries[key] = tuple(columns.get(i, value) for i, value in enumerate(row))
+
+    # drops one entry
+    def invalidate(self, key: Hashable, stale: bool = False) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+            if stale:
+                self.stale += 1
+
+    # drops every entry, used when a transaction that wrote through rolls back
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    # cache counters for monitoring
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale": self.stale,
+            }
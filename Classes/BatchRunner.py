@@ -0,0 +1,79 @@
+from __future__ import annotations
+from typing import Dict, Iterable, TextIO
+from Classes.ATM import ATM
+import time
+
+class BatchRunner:
+    # replays commands through one ATM session without a terminal
+    # responses are buffered and written in chunks of flushEvery commands
+    # with singleTransaction the whole script commits (or rolls back) as one db transaction
+    # when the session runs on a virtual clock, "@advance <seconds>" lines move the clock forward
+    # so a script can replay days of activity without waiting
+    def __init__(self, atm: ATM, singleTransaction: bool = False, flushEvery: int = 1000) -> BatchRunner:
+        self.atm = atm
+        self.singleTransaction = singleTransaction
+        self.flushEvery = flushEvery
+        self.commands = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    # runs every command from lines until the input ends or end is given
+    def run(self, lines: Iterable[str], out: TextIO) -> Dict[str, float]:
+        start = time.perf_counter()
+
+        if self.singleTransaction:
+            with self.atm.sql.transaction():
+                self.runCommands(lines, out)
+        else:
+            self.runCommands(lines, out)
+
+        self.elapsed = time.perf_counter() - start
+        return self.stats()
+
+    def runCommands(self, lines: Iterable[str], out: TextIO) -> None:
+        buffer = list()
+
+        for line in lines:
+            # blank lines are skipped rather than counted as bad input
+            if not line.strip():
+                continue
+            if self.advanceClock(line):
+                continue
+
+            response = self.atm.controller(line)
+            self.commands += 1
+            if response.error:
+                self.errors += 1
+            if response.message:
+                buffer.append("{}\n\n".format(response.message))
+
+            if len(buffer) >= self.flushEvery:
+                out.write("".join(buffer))
+                buffer.clear()
+
+            if response.end:
+                break
+
+        out.write("".join(buffer))
+        out.flush()
+
+    # handles an @advance line, returns False for anything else
+    def advanceClock(self, line: str) -> bool:
+        parts = line.split()
+        if not self.atm.clock.virtual or len(parts) != 2 or parts[0] != "@advance":
+            return False
+        try:
+            seconds = float(parts[1])
+        except ValueError:
+            return False
+        self.atm.clock.advance(seconds)
+        return True
+
+    # totals for the last run
+    def stats(self) -> Dict[str, float]:
+        return {
+            "commands": self.commands,
+            "errors": self.errors,
+            "seconds": self.elapsed,
+            "commandsPerSecond": self.commands / self.elapsed if self.elapsed else 0.0,
+        }
@@ -0,0 +1,79 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, TextIO, Tuple
+import csv, json, re
+
+# streaming csv and jsonl readers and writers for bulk account import and history export
+# everything works a line at a time, nothing is held for the whole file
+
+formats = ("csv", "jsonl")
+accountFields = ("account_id", "pin", "balance")
+historyFields = ("id", "account_id", "date", "time", "amount", "new_balance")
+pinPattern = re.compile(r"[0-9]{4}")
+
+# picks the format from a file name, .jsonl or .json is jsonl and anything else csv
+def formatFor(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+
+# balances are whole numbers unless written with a decimal point
+def parseBalance(value: object) -> object:
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip()
+    return float(text) if "." in text else int(text)
+
+# checks one account and returns it as (account id, pin, balance)
+# line is the line number reported if it's invalid
+def accountRow(accountId: object, pin: object, balance: object, line: int) -> Tuple[str, str, object]:
+    accountId = str(accountId).strip() if accountId is not None else ""
+    pin = str(pin).strip() if pin is not None else ""
+    if not accountId:
+        raise Exception("Missing account_id on line {}.".format(line))
+    if not pinPattern.fullmatch(pin):
+        raise Exception("Pin must be 4 digits on line {}.".format(line))
+    try:
+        balance = parseBalance(balance if balance not in (None, "") else 0)
+    except ValueError:
+        raise Exception("Invalid balance on line {}.".format(line))
+    return accountId, pin, balance
+
+# yields (account id, pin, balance) from a csv with an account_id,pin,balance header,
+# or from jsonl objects with those keys, balance defaults to 0
+def readAccounts(lines: Iterable[str], format: str = "csv") -> Iterator[Tuple[str, str, object]]:
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        missing = [field for field in accountFields[:2] if field not in (reader.fieldnames or ())]
+        if missing:
+            raise Exception("Account csv is missing columns: {}.".format(", ".join(missing)))
+        for record in reader:
+            yield accountRow(record["account_id"], record["pin"], record.get("balance"), reader.line_num)
+    elif format == "jsonl":
+        for line, text in enumerate(lines, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                raise Exception("Invalid json on line {}.".format(line))
+            yield accountRow(record.get("account_id"), record.get("pin"), record.get("balance"), line)
+    else:
+        raise Exception("Unknown format {}. Expected one of: {}.".format(format, ", ".join(formats)))
+
+# writes history rows of (id, account id, date, time, amount, new balance) as they arrive
+# returns the number of rows written
+def writeHistory(rows: Iterable[Tuple[object, ...]], out: TextIO, format: str = "csv") -> int:
+    count = 0
+    if format == "csv":
+        writer = csv.writer(out, lineterminator = "\n")
+        writer.writerow(historyFields)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif format == "jsonl":
+        for historyId, accountId, date, time, amount, newBalance in rows:
+            out.write(json.dumps({"id": historyId, "account_id": str(accountId), "date": date, "time": time,
+                                  "amount": amount, "new_balance": newBalance}))
+            out.write("\n")
+            count += 1
+    else:
+        raise Exception("Unknown format {}. Expected one of: {}.".format(format, ", ".join(formats)))
+    return count
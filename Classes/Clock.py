@@ -0,0 +1,72 @@
+from __future__ import annotations
+from typing import Callable, List
+from threading import Lock
+import time
+
+class Clock:
+    # where sessions, the inactivity scheduler and the db helper read the time from
+    # time() is unix seconds for timestamps, monotonic() is for deadlines and windows
+    sharedClock = None
+    sharedLock = Lock()
+    # virtual clocks only move when they're advanced, nothing should wait on them in real time
+    virtual = False
+
+    # returns the real clock used when none is given
+    @classmethod
+    def shared(cls) -> Clock:
+        with cls.sharedLock:
+            if cls.sharedClock is None:
+                cls.sharedClock = Clock()
+            return cls.sharedClock
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+class VirtualClock(Clock):
+    # a clock that is advanced by hand, for tests and for replaying days of activity without waiting
+    # listeners are called after every advance, on the advancing thread, so schedulers
+    # can deliver whatever fell due
+    virtual = True
+
+    # start is the unix time the clock reads initially
+    def __init__(self, start: float = 0.0) -> VirtualClock:
+        self.now = float(start)
+        self.elapsed = 0.0
+        self.lock = Lock()
+        self.listeners: List[Callable[[], None]] = []
+
+    def time(self) -> float:
+        with self.lock:
+            return self.now
+
+    def monotonic(self) -> float:
+        with self.lock:
+            return self.elapsed
+
+    # moves the clock forward and lets every listener catch up
+    def advance(self, seconds: float) -> None:
+        if seconds < 0:
+            raise Exception("A clock can't go back {} seconds.".format(-seconds))
+        with self.lock:
+            self.now += seconds
+            self.elapsed += seconds
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener()
+
+    # moves the clock forward to a unix time
+    def advanceTo(self, ts: float) -> None:
+        self.advance(max(0.0, ts - self.time()))
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        with self.lock:
+            self.listeners.append(listener)
+
+    # stops calling listener, a no-op if it isn't subscribed
+    def unsubscribe(self, listener: Callable[[], None]) -> None:
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import Callable, Dict, NamedTuple, Tuple
+import re, time
+
+# command grammar for the ATM, built once at import
+# parsing never raises, bad input comes back as a ParsedCommand with an error
+
+intPattern = re.compile(r"[+-]?[0-9]+")
+monthPattern = re.compile(r"[0-9]{4}-(0[1-9]|1[0-2])")
+
+# argument parsers return the parsed value, or None when the text isn't valid
+def parseText(text: str) -> object:
+    return text
+
+def parseInt(text: str) -> object:
+    return int(text) if intPattern.fullmatch(text) else None
+
+def parseMore(text: str) -> object:
+    return True if text.lower() == "more" else None
+
+def parseMonth(text: str) -> object:
+    return text if monthPattern.fullmatch(text) else None
+
+def parseDate(text: str) -> object:
+    try:
+        return time.strftime("%Y-%m-%d", time.strptime(text, "%Y-%m-%d"))
+    except ValueError:
+        return None
+
+def parseFormat(text: str) -> object:
+    return text.lower() if text.lower() in ("prometheus", "json") else None
+
+class Command(NamedTuple):
+    verb: str
+    # one parser per argument, the first minArgs arguments are required
+    parsers: Tuple[Callable[[str], object], ...]
+    minArgs: int
+    requiresAuth: bool
+    # name of the ATM method that runs the command
+    handler: str
+
+class ParsedCommand(NamedTuple):
+    command: Command
+    args: Tuple[object, ...]
+    # reason the input was rejected, None when it's valid
+    error: str
+
+commands: Dict[str, Command] = {command.verb: command for command in [
+    Command("authorize", (parseText, parseText), 2, False, "authorize"),
+    Command("withdraw", (parseInt,), 1, True, "withdraw"),
+    Command("deposit", (parseInt,), 1, True, "deposit"),
+    Command("transfer", (parseText, parseInt), 2, True, "transfer"),
+    Command("balance", (parseDate,), 0, True, "getBalance"),
+    Command("history", (parseMore,), 0, True, "getHistory"),
+    Command("statement", (parseMonth,), 1, True, "getStatement"),
+    Command("logout", (), 0, False, "logout"),
+    Command("end", (), 0, False, "endProgram"),
+    Command("stats", (parseFormat,), 0, True, "getStats"),
+]}
+
+# splits and validates user input against the registry
+def parseCommand(usrInput: str) -> ParsedCommand:
+    cmdParts = usrInput.split()
+
+    if not cmdParts:
+        return ParsedCommand(None, (), "No input detected.")
+
+    command = commands.get(cmdParts[0].lower())
+    if command is None:
+        return ParsedCommand(None, (), "Invalid command detected: {}".format(usrInput))
+
+    argParts = cmdParts[1:]
+    if not command.minArgs <= len(argParts) <= len(command.parsers):
+        return ParsedCommand(command, (), "Wrong number of arguments detected in command: {}".format(usrInput))
+
+    args = tuple(parser(part) for parser, part in zip(command.parsers, argParts))
+    if None in args:
+        return ParsedCommand(command, (), "Invalid argument detected in command: {}".format(usrInput))
+
+    return ParsedCommand(command, args, None)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from typing import Dict, Iterator, List, Tuple
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+from Classes.StorageProfile import StorageProfile
+import sqlite3
+
+class ConnectionPool:
+    # bounded pool of sqlite connections for one database file
+    # a thread that already holds a connection gets the same one back, so every
+    # SQLHelper on a thread shares one connection (and its open transaction)
+    # connections go back to the idle list once the thread releases all its leases
+    # profile names the StorageProfile applied to each new connection
+    pools: Dict[Tuple[str, int, str], ConnectionPool] = dict()
+    poolsLock = Lock()
+
+    def __init__(self, dbFile: str, maxSize: int = 8, cachedStatements: int = 128,
+                 timeout: float = 5.0, profile: str = "default") -> ConnectionPool:
+        self.dbFile = dbFile
+        self.profile = StorageProfile.get(profile)
+        self.maxSize = maxSize
+        self.cachedStatements = cachedStatements
+        # seconds to wait for a free connection before giving up
+        self.timeout = timeout
+        self.condition = Condition()
+        self.idle: List[sqlite3.Connection] = list()
+        # thread id -> [connection, lease count]
+        self.leases: Dict[int, List[object]] = dict()
+        self.size = 0
+        self.opened = 0
+        self.closed = 0
+        # set once the schema migrations have been checked for this file
+        self.migrated = False
+        # (enabled, snapshot every) ledger settings, read from the db by the first helper
+        self.ledger = None
+        self.isClosed = False
+
+    # returns the shared pool for a database file, creating it on first use
+    @classmethod
+    def get(cls, dbFile: str, cachedStatements: int = 128, profile: str = "default", **kwargs) -> ConnectionPool:
+        key = (dbFile, cachedStatements, profile)
+        with cls.poolsLock:
+            pool = cls.pools.get(key)
+            if pool is None or pool.isClosed:
+                pool = ConnectionPool(dbFile, cachedStatements = cachedStatements, profile = profile, **kwargs)
+                cls.pools[key] = pool
+            return pool
+
+    # closes every shared pool
+    @classmethod
+    def closeAll(cls) -> None:
+        with cls.poolsLock:
+            pools = list(cls.pools.values())
+            cls.pools.clear()
+        for pool in pools:
+            pool.close()
+
+    # opens a new connection with the storage profile applied
+    # autocommit so transactions are explicit
+    # connections may move between threads while idle, never while leased
+    def open(self) -> sqlite3.Connection:
+        conn = self.profile.connect(self.dbFile, seed = self.opened == 0, isolation_level = None,
+                                    check_same_thread = False, cached_statements = self.cachedStatements,
+                                    timeout = self.timeout)
+        self.opened += 1
+        return conn
+
+    # leases a connection to the calling thread
+    # waits up to timeout for one to be released when the pool is full
+    def acquire(self) -> sqlite3.Connection:
+        threadId = get_ident()
+
+        with self.condition:
+            if self.isClosed:
+                raise Exception("Connection pool for {} is closed.".format(self.dbFile))
+
+            lease = self.leases.get(threadId)
+            if lease is not None:
+                lease[1] += 1
+                return lease[0]
+
+            if not self.idle and self.size >= self.maxSize:
+                if not self.condition.wait_for(lambda: self.idle or self.size < self.maxSize, self.timeout):
+                    raise Exception("No connection available for {} after {} seconds.".format(self.dbFile, self.timeout))
+
+            if self.idle:
+                conn = self.idle.pop()
+            else:
+                conn = self.open()
+                self.size += 1
+
+            self.leases[threadId] = [conn, 1]
+            return conn
+
+    # releases one lease held by the calling thread
+    # the connection returns to the idle list when the last lease goes
+    def release(self, conn: sqlite3.Connection) -> None:
+        threadId = get_ident()
+
+        with self.condition:
+            lease = self.leases.get(threadId)
+            if lease is None or lease[0] is not conn:
+                return
+
+            lease[1] -= 1
+            if lease[1] > 0:
+                return
+
+            del self.leases[threadId]
+            # never hand an open transaction to another thread
+            if conn.in_transaction:
+                conn.rollback()
+
+            if self.isClosed:
+                self.closeConnection(conn)
+            else:
+                self.idle.append(conn)
+            self.condition.notify()
+
+    # leases a connection for the duration of the block
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def closeConnection(self, conn: sqlite3.Connection) -> None:
+        conn.close()
+        self.size -= 1
+        self.closed += 1
+
+    # closes idle connections now and leased ones as they are released
+    def close(self) -> None:
+        with self.condition:
+            self.isClosed = True
+            for conn in self.idle:
+                self.closeConnection(conn)
+            self.idle.clear()
+            self.condition.notify_all()
+
+    # connection counts for monitoring
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {
+                "opened": self.opened,
+                "closed": self.closed,
+                "open": self.size,
+                "inUse": len(self.leases),
+                "idle": len(self.idle),
+            }
+
+    def __enter__(self) -> ConnectionPool:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -2,10 +2,13 @@ from __future__ import annotations
 import typing
 
 class ControllerResponse:
-    def __init__(self) -> ControllerResponse:
-        self.message = None
-        self.error = False
-        self.end = False
+    # slots instead of a per instance dict, one of these is made for most commands
+    __slots__ = ("message", "error", "end")
+
+    def __init__(self, message: str = None, error: bool = False, end: bool = False) -> ControllerResponse:
+        self.message = message
+        self.error = error
+        self.end = end
 
     # update controller response message and error flag
     def addResponseMsg(self, message: str) -> None:
@@ -17,4 +20,38 @@ class ControllerResponse:
 
     # sets controller end flag
     def setEndFlag(self) -> None:
-        self.end = True
\ No newline at end of file
+        self.end = True
+
+class ConstantResponse(ControllerResponse):
+    # a response whose message never changes, one instance is shared by every session
+    # so it can't be modified once created
+    __slots__ = ()
+
+    def __init__(self, message: str, error: bool = False, end: bool = False) -> ConstantResponse:
+        object.__setattr__(self, "message", message)
+        object.__setattr__(self, "error", error)
+        object.__setattr__(self, "end", end)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError("shared responses can't be modified")
+
+# shared responses for messages with nothing formatted into them
+authorizationRequired = ConstantResponse("Authorization required.")
+invalidCommand = ConstantResponse("Invalid command detected.", True)
+authorizationFailed = ConstantResponse("Authorization failed.")
+authorizationThrottled = ConstantResponse("Too many failed attempts. Please try again later.")
+alreadyAuthorized = ConstantResponse("An account is already authorized. Logout before authorizing another account.")
+invalidWithdrawal = ConstantResponse("Withdrawal amount must be greater than 0 and in increments of 20.")
+overdrawn = ConstantResponse("Your account is overdrawn! You may not make withdrawals at this time.")
+atmEmpty = ConstantResponse("Unable to process your withdrawal at this time.")
+dailyLimitReached = ConstantResponse("You have reached your daily withdrawal limit.")
+transferLimitReached = ConstantResponse("You have reached your daily limit. No more transfers can be made today.")
+invalidDeposit = ConstantResponse("Deposit amount must be greater than 0.")
+invalidTransfer = ConstantResponse("Transfer amount must be greater than 0.")
+insufficientFunds = ConstantResponse("Insufficient funds for this transfer.")
+transferFailed = ConstantResponse("Unable to transfer to that account.")
+noHistory = ConstantResponse("No history found")
+noMoreHistory = ConstantResponse("No more history")
+notAuthorized = ConstantResponse("No account is currently authorized.")
+balanceChanged = ConstantResponse("Your balance changed during this transaction. Please try again.")
+goodbye = ConstantResponse("Goodbye!", end = True)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import Dict, Tuple
+from math import gcd
+from functools import reduce
+from threading import Lock
+
+class Dispenser:
+    # notes loaded in a terminal's cassettes and the plans for dispensing from them
+    # a plan is the count of notes taken from each cassette, largest notes first so the fewest notes
+    # are handed out, and a cassette that runs low is made up from the smaller ones
+    # plans are memoized per amount: a plan stays good while every cassette still holds the notes
+    # it takes, and an amount that can't be made stays that way until notes are loaded,
+    # so dispensing never has to invalidate anything and loading clears the memo
+    # commonAmounts are planned up front whenever the cassettes are loaded
+    commonAmounts = range(20, 1020, 20)
+
+    def __init__(self, notes: Dict[int, int] = None, memoSize: int = 4096) -> Dispenser:
+        self.memoSize = memoSize
+        self.lock = Lock()
+        self.load(notes or dict())
+
+    # replaces the loaded notes, {denomination: count}
+    def load(self, notes: Dict[int, int]) -> None:
+        with self.lock:
+            self.denominations = tuple(sorted(notes, reverse = True))
+            self.counts = [notes[d] for d in self.denominations]
+            # every amount that can be made is a multiple of step
+            self.step = reduce(gcd, self.denominations, 0)
+            # amount -> counts aligned with denominations, or None if it can't be made
+            self.memo: Dict[int, Tuple[int, ...]] = dict()
+            for amount in self.commonAmounts:
+                self.lookup(amount)
+
+    # True when no cassettes are loaded
+    @property
+    def empty(self) -> bool:
+        return not self.denominations
+
+    # cash held across every cassette
+    @property
+    def total(self) -> int:
+        return sum(d * count for d, count in zip(self.denominations, self.counts))
+
+    # {denomination: count} still loaded
+    def notes(self) -> Dict[int, int]:
+        with self.lock:
+            return dict(zip(self.denominations, self.counts))
+
+    # counts of each denomination making amount exactly, trying the most large notes first
+    # None if the loaded notes can't make it
+    def search(self, amount: int, index: int = 0) -> Tuple[int, ...]:
+        if amount == 0:
+            return (0,) * (len(self.denominations) - index)
+        if index == len(self.denominations):
+            return None
+        d = self.denominations[index]
+        # the smallest notes either make up the rest or they don't
+        if index == len(self.denominations) - 1:
+            return (amount // d,) if amount % d == 0 and amount // d <= self.counts[index] else None
+        for count in range(min(self.counts[index], amount // d), -1, -1):
+            rest = self.search(amount - count * d, index + 1)
+            if rest is not None:
+                return (count,) + rest
+        return None
+
+    # memoized search, callers hold the lock
+    def lookup(self, amount: int) -> Tuple[int, ...]:
+        if amount <= 0 or self.step == 0 or amount % self.step != 0:
+            return None
+        if amount in self.memo:
+            plan = self.memo[amount]
+            if plan is None or all(count <= left for count, left in zip(plan, self.counts)):
+                return plan
+
+        plan = self.search(amount)
+        if len(self.memo) >= self.memoSize:
+            self.memo.clear()
+        self.memo[amount] = plan
+        return plan
+
+    # {denomination: count} making amount exactly, None if it can't be dispensed
+    def plan(self, amount: int) -> Dict[int, int]:
+        with self.lock:
+            plan = self.lookup(amount)
+            return None if plan is None else self.asNotes(plan)
+
+    # the largest amount up to amount that can be dispensed and its notes, (0, None) if nothing can
+    def largestPlan(self, amount: int) -> Tuple[int, Dict[int, int]]:
+        with self.lock:
+            if self.step == 0:
+                return 0, None
+            start = min(amount, self.total)
+            for candidate in range(start - start % self.step, 0, -self.step):
+                plan = self.lookup(candidate)
+                if plan is not None:
+                    return candidate, self.asNotes(plan)
+            return 0, None
+
+    def asNotes(self, plan: Tuple[int, ...]) -> Dict[int, int]:
+        return {d: count for d, count in zip(self.denominations, plan) if count}
+
+    # takes dispensed notes out of the cassettes, the memo stays valid
+    def dispense(self, notes: Dict[int, int]) -> None:
+        with self.lock:
+            for i, d in enumerate(self.denominations):
+                self.counts[i] -= notes.get(d, 0)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from typing import Callable, Dict, Hashable, List, Tuple
+from threading import Condition, Thread, Lock
+from Classes.Clock import Clock
+import heapq, itertools
+
+class InactivityScheduler:
+    # tracks inactivity deadlines for any number of sessions with one thread
+    # deadlines sit in a heap, rescheduling pushes a new entry in O(log n)
+    # and leaves the old one behind to be skipped when it reaches the top
+    # deadlines are on clock, with a virtual clock nothing waits in real time, due deadlines
+    # are delivered on the thread that advances the clock and no scheduler thread is started
+    sharedScheduler = None
+    sharedLock = Lock()
+
+    def __init__(self, clock: Clock = None) -> InactivityScheduler:
+        # entries are (deadline, seq, key, callback, executor)
+        self.heap: List[Tuple[float, int, Hashable, Callable, Callable]] = []
+        # seq of the live entry for each key, anything else in the heap is stale
+        self.live: Dict[Hashable, int] = dict()
+        self.counter = itertools.count()
+        self.condition = Condition()
+        self.thread = None
+        self.clock = clock if clock is not None else Clock.shared()
+        if self.clock.virtual:
+            self.clock.subscribe(self.runDue)
+
+    # returns the scheduler shared by every session in the process
+    @classmethod
+    def shared(cls) -> InactivityScheduler:
+        with cls.sharedLock:
+            if cls.sharedScheduler is None:
+                cls.sharedScheduler = InactivityScheduler()
+            return cls.sharedScheduler
+
+    # (re)schedules callback to run delay seconds from now for key
+    # when due, executor(callback) is called so the callback can be handed back
+    # to the session's own thread or event loop, without one it runs on the scheduler thread
+    # returns the deadline on the scheduler's monotonic clock
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], None],
+                 executor: Callable[[Callable[[], None]], None] = None) -> float:
+        deadline = self.clock.monotonic() + delay
+
+        with self.condition:
+            seq = next(self.counter)
+            self.live[key] = seq
+            heapq.heappush(self.heap, (deadline, seq, key, callback, executor))
+            self.compact()
+
+            # a virtual clock delivers due deadlines itself as it advances
+            if self.clock.virtual:
+                return deadline
+
+            if self.thread is None:
+                self.thread = Thread(target = self.run, name = "InactivityScheduler", daemon = True)
+                self.thread.start()
+            # only wake the thread if this is now the earliest deadline
+            elif self.heap[0][1] == seq:
+                self.condition.notify()
+
+        return deadline
+
+    # stops following a virtual clock, pending deadlines are never delivered afterwards
+    def close(self) -> None:
+        if self.clock.virtual:
+            self.clock.unsubscribe(self.runDue)
+
+    # drops the deadline for key, if there is one
+    def cancel(self, key: Hashable) -> None:
+        with self.condition:
+            self.live.pop(key, None)
+
+    # number of sessions with a pending deadline
+    def pending(self) -> int:
+        with self.condition:
+            return len(self.live)
+
+    # rebuilds the heap once stale entries outnumber live ones
+    # keeps memory proportional to the number of sessions
+    def compact(self) -> None:
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.live):
+            self.heap = [entry for entry in self.heap if self.live.get(entry[2]) == entry[1]]
+            heapq.heapify(self.heap)
+
+    # pops the earliest deadline if it's due, None otherwise, callers hold the condition
+    def popDue(self) -> Tuple[float, int, Hashable, Callable, Callable]:
+        # skip entries that were rescheduled or cancelled
+        while self.heap and self.live.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+        if not self.heap or self.heap[0][0] > self.clock.monotonic():
+            return None
+        entry = heapq.heappop(self.heap)
+        del self.live[entry[2]]
+        return entry
+
+    # scheduler thread, waits for the earliest deadline and delivers it
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                entry = self.popDue()
+                while entry is None:
+                    if self.heap:
+                        self.condition.wait(self.heap[0][0] - self.clock.monotonic())
+                    else:
+                        self.condition.wait()
+                    entry = self.popDue()
+            self.deliver(entry)
+
+    # delivers every deadline that's due, called by a virtual clock each time it advances
+    def runDue(self) -> None:
+        while True:
+            with self.condition:
+                entry = self.popDue()
+            if entry is None:
+                return
+            self.deliver(entry)
+
+    # runs the callback outside the lock so it can reschedule
+    def deliver(self, entry: Tuple[float, int, Hashable, Callable, Callable]) -> None:
+        deadline, seq, key, callback, executor = entry
+        try:
+            if executor is None:
+                callback()
+            else:
+                executor(callback)
+        except Exception:
+            pass
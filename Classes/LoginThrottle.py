@@ -0,0 +1,82 @@
+from __future__ import annotations
+from typing import Deque, Dict, Hashable, Tuple
+from collections import deque
+from threading import Lock
+from Classes.Clock import Clock
+
+class LoginThrottle:
+    # sliding window counts of failed authorizations, per account and per session
+    # a key with limit failures inside its window is blocked until the oldest one ages out
+    # checked before the pin lookup, so throttled attempts cost neither a query nor a hash
+    sharedThrottle = None
+    sharedLock = Lock()
+
+    # limits are (failures, window seconds), windows are measured on clock
+    def __init__(self, accountLimit: Tuple[int, float] = (10, 300.0),
+                 sessionLimit: Tuple[int, float] = (5, 60.0), clock: Clock = None) -> LoginThrottle:
+        self.clock = clock if clock is not None else Clock.shared()
+        self.limits = {"account": accountLimit, "session": sessionLimit}
+        # (kind, key) -> monotonic times of failures still inside the window
+        self.failures: Dict[Tuple[str, Hashable], Deque[float]] = dict()
+        self.lock = Lock()
+        self.recorded = 0
+        self.rejected = 0
+
+    # returns the throttle shared by every session in the process
+    @classmethod
+    def shared(cls) -> LoginThrottle:
+        with cls.sharedLock:
+            if cls.sharedThrottle is None:
+                cls.sharedThrottle = LoginThrottle()
+            return cls.sharedThrottle
+
+    # drops failures that have left the window, returns how many are left
+    def count(self, kind: str, key: Hashable, now: float) -> int:
+        times = self.failures.get((kind, key))
+        if times is None:
+            return 0
+        window = self.limits[kind][1]
+        while times and times[0] <= now - window:
+            times.popleft()
+        if not times:
+            del self.failures[(kind, key)]
+            return 0
+        return len(times)
+
+    # True if the account or the session has used up its failures
+    # record is False for a look ahead that shouldn't count as a rejected attempt
+    def blocked(self, accountId: str, session: Hashable, record: bool = True) -> bool:
+        now = self.clock.monotonic()
+        with self.lock:
+            if (self.count("account", accountId, now) >= self.limits["account"][0]
+                    or self.count("session", session, now) >= self.limits["session"][0]):
+                if record:
+                    self.rejected += 1
+                return True
+            return False
+
+    def fail(self, accountId: str, session: Hashable) -> None:
+        now = self.clock.monotonic()
+        with self.lock:
+            for kind, key in (("account", accountId), ("session", session)):
+                self.failures.setdefault((kind, key), deque()).append(now)
+            self.recorded += 1
+            # keys nobody retries would otherwise stay forever, sweep them now and then
+            if self.recorded % 1024 == 0:
+                for kind, key in list(self.failures):
+                    self.count(kind, key, now)
+
+    # a correct pin clears the failures counted against the account and the session
+    def succeed(self, accountId: str, session: Hashable) -> None:
+        with self.lock:
+            self.failures.pop(("account", accountId), None)
+            self.failures.pop(("session", session), None)
+
+    # forgets a session once it's closed
+    def forget(self, session: Hashable) -> None:
+        with self.lock:
+            self.failures.pop(("session", session), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"tracked": len(self.failures), "failures": self.recorded, "rejected": self.rejected}
@@ -0,0 +1,174 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+from threading import Lock, active_count, local
+from Classes.InactivityScheduler import InactivityScheduler
+from Classes.ConnectionPool import ConnectionPool
+import bisect, json
+
+# metric labels, kept as a tuple of (name, value) pairs so they can be dict keys
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    # latency histogram with fixed upper bounds in seconds, from 10us to 5s
+    __slots__ = ("counts", "count", "sum")
+    bounds: Tuple[float, ...] = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                                 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self) -> Histogram:
+        # one count per bound plus one for anything slower than the last
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # cumulative (upper bound, count) pairs, the last bound is +Inf
+    def buckets(self) -> List[Tuple[float, int]]:
+        total = 0
+        buckets = list()
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+class Metrics:
+    # process wide instrumentation for the controller and SQLHelper
+    # disabled by default, callers check enabled before taking any timings
+    # so a disabled registry costs one attribute lookup per command and per statement
+    # command phases are parse, auth (the auth check, or rejecting bad input),
+    # db (statements run by the handler) and format (the rest of the handler)
+    sharedMetrics = None
+    sharedLock = Lock()
+
+    def __init__(self, enabled: bool = False) -> Metrics:
+        self.enabled = enabled
+        self.lock = Lock()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = dict()
+        # seconds spent in statements on each thread since it last took them
+        self.local = local()
+
+    # returns the registry shared by every session in the process
+    @classmethod
+    def shared(cls) -> Metrics:
+        with cls.sharedLock:
+            if cls.sharedMetrics is None:
+                cls.sharedMetrics = Metrics()
+            return cls.sharedMetrics
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    # stops recording, what was recorded is kept until reset
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+
+    def observe(self, name: str, labels: Labels, seconds: float) -> None:
+        with self.lock:
+            self.histogram(name, labels).observe(seconds)
+
+    # returns the histogram for name and labels, the lock must be held
+    def histogram(self, name: str, labels: Labels) -> Histogram:
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram()
+        return histogram
+
+    # records one statement run through SQLHelper and adds it to the thread's db time
+    def recordStatement(self, name: str, seconds: float) -> None:
+        self.local.dbSeconds = getattr(self.local, "dbSeconds", 0.0) + seconds
+        self.observe("atm_db_statement_seconds", (("statement", name),), seconds)
+
+    # returns the thread's db time and starts it again from 0
+    def takeDbTime(self) -> float:
+        seconds = getattr(self.local, "dbSeconds", 0.0)
+        self.local.dbSeconds = 0.0
+        return seconds
+
+    # records one command from the perf_counter times each phase ended at
+    def recordCommand(self, verb: str, start: float, parsed: float, authorized: float, end: float) -> None:
+        db = self.takeDbTime()
+        handler = end - authorized
+        with self.lock:
+            for phase, seconds in (("parse", parsed - start), ("auth", authorized - parsed), ("db", db),
+                                   ("format", max(handler - db, 0.0)), ("total", end - start)):
+                self.histogram("atm_command_seconds", (("command", verb), ("phase", phase))).observe(seconds)
+
+    # point in time values read when a snapshot is taken
+    def gauges(self) -> List[Tuple[str, Labels, float]]:
+        gauges = [("atm_threads", (), active_count())]
+
+        scheduler = InactivityScheduler.sharedScheduler
+        if scheduler is not None:
+            gauges.append(("atm_scheduler_threads", (), int(scheduler.thread is not None and scheduler.thread.is_alive())))
+            gauges.append(("atm_scheduler_pending", (), scheduler.pending()))
+
+        with ConnectionPool.poolsLock:
+            pools = list(ConnectionPool.pools.values())
+        for pool in pools:
+            stats = pool.stats()
+            labels = (("db", pool.dbFile), ("profile", pool.profile.name))
+            gauges.append(("atm_pool_connections_open", labels, stats["open"]))
+            gauges.append(("atm_pool_connections_in_use", labels, stats["inUse"]))
+        return gauges
+
+    # every histogram and gauge as plain data, suitable for json
+    def snapshot(self) -> Dict[str, object]:
+        with self.lock:
+            histograms = [{
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "buckets": [[bound, count] for bound, count in histogram.buckets()[:-1]],
+            } for (name, labels), histogram in sorted(self.histograms.items())]
+
+        return {
+            "enabled": self.enabled,
+            "histograms": histograms,
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for name, labels, value in self.gauges()],
+        }
+
+    def toJson(self) -> str:
+        return json.dumps(self.snapshot(), indent = 2)
+
+    # prometheus text exposition format
+    def toPrometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = list()
+        typed = set()
+
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"]
+            if name not in typed:
+                lines.append("# TYPE {} histogram".format(name))
+                typed.add(name)
+            labels = histogram["labels"]
+            for bound, count in histogram["buckets"]:
+                lines.append("{}_bucket{} {}".format(name, formatLabels(labels, le = repr(bound)), count))
+            lines.append("{}_bucket{} {}".format(name, formatLabels(labels, le = "+Inf"), histogram["count"]))
+            lines.append("{}_sum{} {}".format(name, formatLabels(labels), repr(histogram["sum"])))
+            lines.append("{}_count{} {}".format(name, formatLabels(labels), histogram["count"]))
+
+        for gauge in snapshot["gauges"]:
+            if gauge["name"] not in typed:
+                lines.append("# TYPE {} gauge".format(gauge["name"]))
+                typed.add(gauge["name"])
+            lines.append("{}{} {}".format(gauge["name"], formatLabels(gauge["labels"]), gauge["value"]))
+
+        return "\n".join(lines) + "\n"
+
+# {name="value",...}, or nothing when there are no labels
+def formatLabels(labels: Dict[str, str], **extra: str) -> str:
+    pairs = list(labels.items()) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for name, value in pairs) + "}"
@@ -0,0 +1,51 @@
+from __future__ import annotations
+from typing import Dict, Tuple
+import hashlib, hmac, os
+
+# salted pin hashes, stored as pbkdf2_sha256$iterations$salt$hash with salt and hash in hex
+# the cost is stored with each hash, so raising defaultIterations only affects pins hashed afterwards
+
+scheme = "pbkdf2_sha256"
+# pbkdf2 rounds for new hashes, each verification costs the same
+defaultIterations = 100000
+saltBytes = 16
+# a hash per cost that no pin is checked against for real, {iterations: hash}
+dummyHashes: Dict[int, str] = dict()
+
+def hashPin(pin: str, iterations: int = None) -> str:
+    iterations = iterations or defaultIterations
+    salt = os.urandom(saltBytes)
+    digest = hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, iterations)
+    return "{}${}${}${}".format(scheme, iterations, salt.hex(), digest.hex())
+
+# checks pin against a stored hash in constant time, malformed hashes never match
+def verifyPin(pin: str, stored: str) -> bool:
+    try:
+        name, iterations, salt, digest = stored.split("$")
+        if name != scheme:
+            return False
+        expected = hashlib.pbkdf2_hmac("sha256", pin.encode(), bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(expected.hex(), digest)
+
+# a hash at the default cost to check pins against when an account has none,
+# so a login costs the same whether or not the account exists
+def dummyHash() -> str:
+    iterations = defaultIterations
+    if iterations not in dummyHashes:
+        dummyHashes[iterations] = hashPin(os.urandom(saltBytes).hex(), iterations)
+    return dummyHashes[iterations]
+
+# checks pin against an account's stored pin columns, (pin_hash, pin)
+# a plaintext pin is compared as bytes in constant time and a wrong one still pays for a hash,
+# every check costs one kdf run
+# returns whether pin matched, and a new hash for a matching plaintext pin, which the caller stores
+# this is the expensive part of a login and touches no db, so it can run on another thread
+def checkPin(pin: str, pinHash: str, plaintext: str) -> Tuple[bool, str]:
+    if pinHash is not None:
+        return verifyPin(pin, pinHash), None
+    if not plaintext or not hmac.compare_digest(plaintext.encode(), pin.encode()):
+        verifyPin(pin, dummyHash())
+        return False, None
+    return True, hashPin(pin)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+from typing import Dict, List, NamedTuple, Tuple
+from Classes.SQLHelper import SQLHelper
+from Classes.WriteBehindQueue import WriteBehindQueue
+import multiprocessing, time
+
+# balances are compared to the cent
+tolerance = 0.005
+
+class Discrepancy(NamedTuple):
+    accountId: str
+    # "chain" a history row's new_balance doesn't follow from the row before it
+    # "balance" the account balance isn't the last history row's new_balance
+    # "orphan" history rows for an account that doesn't exist
+    kind: str
+    # history row id, or the number of rows for an orphan
+    historyId: int
+    expected: float
+    actual: float
+
+    def __str__(self) -> str:
+        if self.kind == "orphan":
+            return "account {}: {} history rows with no account".format(self.accountId, self.historyId)
+        if self.kind == "chain":
+            return "account {}: history row {} new balance {} expected {}".format(
+                self.accountId, self.historyId, self.actual, self.expected)
+        return "account {}: balance {} expected {} from history row {}".format(
+            self.accountId, self.actual, self.expected, self.historyId)
+
+# checks one partition of accounts, (low, high] by account_id with None for an open end
+# runs in a worker process with its own connection, accounts and each account's
+# history are streamed inside one snapshot so concurrent postings can't cause false reports
+# returns (discrepancies, accounts checked, history rows checked)
+def reconcilePartition(db: str, profile: str, low: str, high: str) -> Tuple[List[Discrepancy], int, int]:
+    discrepancies = list()
+    accounts = 0
+    rows = 0
+
+    with SQLHelper(db, profile = profile, writeBehind = False, cache = False) as sql:
+        with sql.snapshot():
+            # in ledger mode the balance is derived from snapshots and history
+            statement = "ledgerReconcileAccounts" if sql.ledger else "reconcileAccounts"
+            for accountId, balance in sql.stream(statement, (low, high)):
+                accounts += 1
+                last = None
+                lastId = None
+
+                for historyId, amount, newBalance in sql.execute("reconcileHistory", (accountId,)):
+                    rows += 1
+                    # the first row has nothing before it, any opening balance is accepted
+                    if last is not None and abs(last + amount - newBalance) > tolerance:
+                        discrepancies.append(Discrepancy(accountId, "chain", historyId, last + amount, newBalance))
+                    last = newBalance
+                    lastId = historyId
+
+                # accounts with no history keep their opening balance
+                if last is not None and abs(last - balance) > tolerance:
+                    discrepancies.append(Discrepancy(accountId, "balance", lastId, last, balance))
+
+    return discrepancies, accounts, rows
+
+class Reconciler:
+    # verifies accounts.balance against history in parallel
+    # accounts are split into partitions by account_id range, each checked in a
+    # worker process, nothing is loaded a table at a time so memory stays flat
+    # more partitions than workers keeps every worker busy when partitions are uneven
+    def __init__(self, db: str, workers: int = None, partitionsPerWorker: int = 4,
+                 profile: str = "default") -> Reconciler:
+        self.db = db
+        self.workers = workers or multiprocessing.cpu_count()
+        self.partitions = self.workers * partitionsPerWorker
+        self.profile = profile
+        self.accounts = 0
+        self.rows = 0
+        self.elapsed = 0.0
+
+    # upper account_id of each partition, the last one is left open
+    def bounds(self, sql: SQLHelper) -> List[Tuple[str, str]]:
+        highs = [row[0] for row in sql.stream("reconcileBounds", (self.partitions,))]
+        lows = [None] + highs[:-1]
+        highs[-1:] = [None]
+        return list(zip(lows, highs)) or [(None, None)]
+
+    # runs every partition and returns the discrepancies found, ordered by account
+    def run(self) -> List[Discrepancy]:
+        start = time.perf_counter()
+        self.accounts = 0
+        self.rows = 0
+
+        with SQLHelper(self.db, profile = self.profile, writeBehind = False, cache = False) as sql:
+            # rows queued by the writer in this process must be on disk before workers read,
+            # this helper doesn't write behind so its own flush would skip the pool's queue
+            writer = WriteBehindQueue.forPool(sql.pool, create = False)
+            if writer is not None:
+                writer.flush()
+            work = [(self.db, self.profile, low, high) for low, high in self.bounds(sql)]
+            discrepancies = [Discrepancy(str(accountId), "orphan", count, 0, 0)
+                             for accountId, count in sql.stream("orphanHistory")]
+
+        # spawned workers don't inherit this process's pools or writer thread
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(min(self.workers, len(work))) as pool:
+            for found, accounts, rows in pool.starmap(reconcilePartition, work):
+                discrepancies.extend(found)
+                self.accounts += accounts
+                self.rows += rows
+
+        self.elapsed = time.perf_counter() - start
+        return sorted(discrepancies, key = lambda discrepancy: (discrepancy.accountId, discrepancy.historyId))
+
+    # totals for the last run
+    def stats(self) -> Dict[str, float]:
+        return {
+            "accounts": self.accounts,
+            "rows": self.rows,
+            "seconds": self.elapsed,
+            "rowsPerSecond": self.rows / self.elapsed if self.elapsed else 0.0,
+        }
@@ -1,88 +1,1015 @@
 from __future__ import annotations
-from typing import List, Tuple
-import sqlite3
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Tuple
+from contextlib import contextmanager
+import itertools, json, sqlite3, time
 from datetime import datetime
+from Classes.ConnectionPool import ConnectionPool
+from Classes.WriteBehindQueue import WriteBehindQueue
+from Classes.AccountCache import AccountCache
+from Classes.Metrics import Metrics
+from Classes.Clock import Clock
+from Classes import Pins, Timestamps
+
+# raised when a versioned write finds the row was changed since it was read,
+# or a guarded relative update finds the balance outside the range it was decided on
+class StaleDataError(Exception):
+    pass
 
 class SQLHelper:
-    def __init__(self, dbFile: str) -> None:
-        self.cursor = self.connect(dbFile)
-    
-    # connect to provided data base, return db cursor
-    # to execute commands
-    def connect(self, dbFile: str) -> cursor:
-        conn = sqlite3.connect(dbFile, isolation_level = None)
+    # named, parameterized statements used by the helper
+    # the sql text never changes between calls, so sqlite3's per connection
+    # statement cache prepares each one once and reuses it afterwards
+    statements: Dict[str, str] = {
+        "accountSelect": "SELECT * FROM accounts WHERE account_id = ?;",
+        "updateBalance": "UPDATE accounts SET balance = ?, version = version + 1 WHERE account_id = ? RETURNING version;",
+        "updateBalanceVersioned": """UPDATE accounts SET balance = ?, version = version + 1
+                                        WHERE account_id = ? AND version = ? RETURNING version;""",
+        "getHistory": """SELECT date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'),
+                                amount, new_balance FROM history WHERE account_id = ?
+                            ORDER BY ts desc, id desc;""",
+        "getHistoryFirstPage": """SELECT date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'),
+                                        amount, new_balance, id, ts FROM history
+                                    WHERE account_id = ?
+                                    ORDER BY ts desc, id desc LIMIT ?;""",
+        "getHistoryNextPage": """SELECT date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'),
+                                        amount, new_balance, id, ts FROM history
+                                    WHERE account_id = ? AND (ts, id) < (?, ?)
+                                    ORDER BY ts desc, id desc LIMIT ?;""",
+        "insertHistory": "INSERT INTO history(account_id, amount, new_balance, ts) VALUES(?, ?, ?, ?);",
+        "updateATMBalance": "UPDATE atm_balance SET balance = ?, version = version + 1 WHERE Id = ? RETURNING version;",
+        "updateATMBalanceVersioned": """UPDATE atm_balance SET balance = ?, version = version + 1
+                                            WHERE Id = ? AND version = ? RETURNING version;""",
+        "adjustBalance": """UPDATE accounts SET balance = balance + ?, version = version + 1
+                                WHERE account_id = ? AND balance >= coalesce(?, balance)
+                                AND balance < coalesce(?, balance + 1) RETURNING balance, version;""",
+        "adjustATMBalance": """UPDATE atm_balance SET Balance = Balance + ?, version = version + 1
+                                    WHERE Id = ? AND Balance >= coalesce(?, Balance) RETURNING Balance, version;""",
+        "postNet": """UPDATE accounts SET balance = balance + ?1, version = version + 1
+                            WHERE account_id = ?2 AND (NOT ?3 OR balance + ?1 >= 0);""",
+        "batchAccounts": """SELECT account_id, balance, version FROM accounts
+                                WHERE account_id IN (SELECT value FROM json_each(?));""",
+        "ledgerSettings": "SELECT enabled, snapshot_every FROM ledger_state;",
+        "enableLedger": "UPDATE ledger_state SET enabled = 1, snapshot_every = ?;",
+        "ledgerState": "SELECT balance, version, pending FROM ledger_balances WHERE account_id = ?;",
+        "ledgerReconcileAccounts": """SELECT account_id, balance FROM ledger_balances
+                                        WHERE (?1 IS NULL OR account_id > ?1) AND (?2 IS NULL OR account_id <= ?2)
+                                        ORDER BY account_id;""",
+        "appendHistory": "INSERT INTO history(account_id, amount, new_balance, ts) VALUES(?, ?, ?, ?) RETURNING id;",
+        "batchVersions": """SELECT account_id, max(id) FROM history
+                                WHERE account_id IN (SELECT value FROM json_each(?)) GROUP BY account_id;""",
+        "takeSnapshot": "INSERT OR IGNORE INTO balance_snapshots(account_id, history_id, balance, ts) VALUES(?, ?, ?, ?);",
+        "snapshotAccounts": """INSERT OR IGNORE INTO balance_snapshots(account_id, history_id, balance, ts)
+                                    SELECT a.account_id, coalesce(last.id, 0), a.balance, coalesce(last.ts, 0)
+                                    FROM accounts a LEFT JOIN (SELECT account_id, max(id) AS id, ts FROM history_all
+                                                               GROUP BY account_id) last
+                                        ON last.account_id = a.account_id;""",
+        "snapshotLedger": """INSERT OR IGNORE INTO balance_snapshots(account_id, history_id, balance, ts)
+                                SELECT account_id, version, balance, ts FROM ledger_balances WHERE pending > 0;""",
+        "balanceAsOf": """SELECT new_balance FROM history_all WHERE account_id = ? AND ts < ?
+                            ORDER BY ts desc, id desc LIMIT 1;""",
+        "ledgerBalanceAsOf": """WITH snap AS (SELECT history_id, balance FROM balance_snapshots
+                                                WHERE account_id = ?1 AND ts < ?2 ORDER BY history_id desc LIMIT 1)
+                                SELECT (SELECT balance FROM snap) + coalesce((SELECT sum(amount) FROM history_all
+                                    WHERE account_id = ?1 AND id > (SELECT history_id FROM snap) AND ts < ?2), 0);""",
+        "dailyDebits": "SELECT total FROM daily_withdrawals WHERE account_id = ? AND day = ?;",
+        "addDailyDebit": """INSERT INTO daily_withdrawals(account_id, day, total)
+                                SELECT ?1, ?2, ?3 FROM accounts WHERE account_id = ?1 AND ?3 <= coalesce(daily_limit, ?3)
+                                ON CONFLICT(account_id, day) DO UPDATE SET total = total + excluded.total
+                                    WHERE total + excluded.total <= coalesce(
+                                        (SELECT daily_limit FROM accounts WHERE account_id = excluded.account_id),
+                                        total + excluded.total);""",
+        "setDailyLimit": "UPDATE accounts SET daily_limit = ? WHERE account_id = ?;",
+        "clearDailyTotals": "DELETE FROM daily_withdrawals WHERE day >= ?;",
+        "rebuildDailyTotals": """INSERT INTO daily_withdrawals(account_id, day, total)
+                                    SELECT CAST(account_id AS text), date(ts, 'unixepoch', 'localtime') AS day, -sum(amount)
+                                    FROM history_all WHERE amount < 0 AND ts >= ?
+                                    GROUP BY account_id, day;""",
+        "getATMBalance": "SELECT balance, version FROM atm_balance WHERE Id = ?;",
+        "accountVersion": "SELECT version FROM accounts WHERE account_id = ?;",
+        "atmVersion": "SELECT version FROM atm_balance WHERE Id = ?;",
+        "addTerminal": "INSERT INTO atm_balance(Balance) VALUES(?) RETURNING Id;",
+        "getFleetCash": "SELECT count(*), coalesce(sum(Balance), 0), min(Balance), max(Balance) FROM atm_balance;",
+        "getLowCashTerminals": "SELECT Id, Balance FROM atm_balance WHERE Balance < ? ORDER BY Balance;",
+        "getCassettes": "SELECT denomination, count FROM atm_cassettes WHERE terminal_id = ?;",
+        "loadCassette": """INSERT INTO atm_cassettes(terminal_id, denomination, count) VALUES(?, ?, ?)
+                                ON CONFLICT(terminal_id, denomination) DO UPDATE SET count = excluded.count;""",
+        "clearCassettes": "DELETE FROM atm_cassettes WHERE terminal_id = ?;",
+        "dispenseNotes": """UPDATE atm_cassettes SET count = count - ?1
+                                WHERE terminal_id = ?2 AND denomination = ?3 AND count >= ?1 RETURNING count;""",
+        "logError": "INSERT INTO errors(timestamp, error) VALUES(?, ?);",
+        "logAccountError": "INSERT INTO errors(account_id, timestamp, error) VALUES(?, ?, ?);",
+        "getSingleAccount": "SELECT account_id FROM accounts ORDER BY id LIMIT 1;",
+        "pinLookup": "SELECT pin_hash, pin FROM accounts WHERE account_id = ?;",
+        "setPinHash": "UPDATE accounts SET pin_hash = ?, pin = '' WHERE account_id = ?;",
+        "plaintextPins": "SELECT account_id, pin FROM accounts WHERE pin_hash IS NULL AND pin <> '' LIMIT ?;",
+        "clearAccountHistory": "DELETE FROM history WHERE account_id = ?;",
+        "reconcileBounds": """SELECT max(account_id) FROM (
+                                    SELECT account_id, ntile(?) OVER (ORDER BY account_id) AS part FROM accounts)
+                                GROUP BY part ORDER BY part;""",
+        "reconcileAccounts": """SELECT account_id, balance FROM accounts
+                                    WHERE (?1 IS NULL OR account_id > ?1) AND (?2 IS NULL OR account_id <= ?2)
+                                    ORDER BY account_id;""",
+        "reconcileHistory": "SELECT id, amount, new_balance FROM history_all WHERE account_id = ? ORDER BY ts, id;",
+        "importAccount": "INSERT INTO accounts(account_id, pin, pin_hash, balance) VALUES(?, '', ?, ?);",
+        "orphanHistory": """SELECT account_id, count(*) FROM history_all
+                                WHERE account_id NOT IN (SELECT account_id FROM accounts) GROUP BY account_id;""",
+        "archivedMonths": "SELECT month, table_name FROM history_archive ORDER BY month;",
+        "archivedMonth": "SELECT table_name FROM history_archive WHERE month = ?;",
+        "oldestHotHistory": "SELECT min(ts) FROM history WHERE ts < ?;",
+        "recordArchive": """INSERT INTO history_archive(month, table_name, rows) VALUES(?, ?, ?)
+                                ON CONFLICT(month) DO UPDATE SET rows = rows + excluded.rows;""",
+        # templates run against one partition, {table} is history or a month's archive table
+        "exportPartition": """SELECT id, account_id, date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'),
+                                    amount, new_balance FROM {table}
+                                WHERE ts >= ?1 AND ts < ?2 ORDER BY ts, id;""",
+        "exportAccountPartition": """SELECT id, account_id, date(ts, 'unixepoch', 'localtime'),
+                                            time(ts, 'unixepoch', 'localtime'), amount, new_balance FROM {table}
+                                        WHERE account_id = ?1 AND ts >= ?2 AND ts < ?3 ORDER BY ts, id;""",
+        "statementPartition": """SELECT date(ts, 'unixepoch', 'localtime'), time(ts, 'unixepoch', 'localtime'),
+                                        amount, new_balance, ts, id FROM {table}
+                                    WHERE account_id = ? AND ts >= ? AND ts < ?;""",
+        "createArchive": """CREATE TABLE IF NOT EXISTS {table} (
+                                id integer PRIMARY KEY,
+                                account_id integer NOT NULL,
+                                amount integer NOT NULL,
+                                new_balance integer NOT NULL,
+                                ts integer NOT NULL
+                            );""",
+        "indexArchive": "CREATE INDEX IF NOT EXISTS {table}_account_ts ON {table}(account_id, ts);",
+        "copyToArchive": """INSERT INTO {table}(id, account_id, amount, new_balance, ts)
+                                SELECT id, account_id, amount, new_balance, ts FROM history WHERE ts >= ? AND ts < ?;""",
+        "deleteArchived": "DELETE FROM history WHERE ts >= ? AND ts < ?;",
+        # transaction control, run through execute so BEGIN's wait for the lock and COMMIT's sync are timed
+        "begin": "BEGIN IMMEDIATE;",
+        "beginRead": "BEGIN DEFERRED;",
+        "commit": "COMMIT;",
+        "rollback": "ROLLBACK;",
+        "savepoint": "SAVEPOINT nested;",
+        "rollbackSavepoint": "ROLLBACK TO nested;",
+        "releaseSavepoint": "RELEASE nested;",
+    }
+
+    # schema migrations, applied in order on connect
+    # PRAGMA user_version records how many have already been applied to a db
+    migrations: List[List[str]] = [
+        # 1: base schema, a no-op on existing databases
+        [
+            """CREATE TABLE IF NOT EXISTS accounts (
+                    id integer PRIMARY KEY AUTOINCREMENT,
+                    account_id text UNIQUE NOT NULL,
+                    pin text NOT NULL,
+                    balance integer DEFAULT 0
+                );""",
+            """CREATE TABLE IF NOT EXISTS history (
+                    id integer PRIMARY KEY AUTOINCREMENT,
+                    account_id integer NOT NULL,
+                    date text NOT NULL,
+                    time text NOT NULL,
+                    amount integer NOT NULL,
+                    new_balance integer NOT NULL,
+                    FOREIGN KEY (account_id)
+                        REFERENCES accounts (account_id)
+                );""",
+            """CREATE TABLE IF NOT EXISTS errors (
+                    id integer PRIMARY KEY AUTOINCREMENT,
+                    account_id integer,
+                    timestamp text,
+                    error text
+                );""",
+            """CREATE TABLE IF NOT EXISTS atm_balance (
+                    Id INTEGER NOT NULL,
+                    Balance INTEGER NOT NULL,
+                    PRIMARY KEY(Id AUTOINCREMENT)
+                );""",
+            "INSERT INTO atm_balance(Id, Balance) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM atm_balance);",
+        ],
+        # 2: index used by history lookups and keyset pagination
+        [
+            "CREATE INDEX IF NOT EXISTS history_account_date_time ON history(account_id, date, time);",
+        ],
+        # 3: row versions for optimistic concurrency and cache invalidation
+        [
+            "ALTER TABLE accounts ADD COLUMN version integer NOT NULL DEFAULT 0;",
+            "ALTER TABLE atm_balance ADD COLUMN version integer NOT NULL DEFAULT 0;",
+        ],
+        # 4: covering index for fleet wide cash queries
+        [
+            "CREATE INDEX IF NOT EXISTS atm_balance_balance ON atm_balance(Balance);",
+        ],
+        # 5: salted pin hashes, plaintext pins are hashed on first login or by hashPinsCmd
+        # and then cleared
+        [
+            "ALTER TABLE accounts ADD COLUMN pin_hash text;",
+        ],
+        # 6: one unix timestamp instead of local date and time text, and monthly archive tables
+        # history_all is every partition, hot and archived, rebuilt when a month is archived
+        [
+            "ALTER TABLE history ADD COLUMN ts integer NOT NULL DEFAULT 0;",
+            "UPDATE history SET ts = CAST(strftime('%s', date || ' ' || time, 'utc') AS integer);",
+            "DROP INDEX IF EXISTS history_account_date_time;",
+            "ALTER TABLE history DROP COLUMN date;",
+            "ALTER TABLE history DROP COLUMN time;",
+            "CREATE INDEX IF NOT EXISTS history_account_ts ON history(account_id, ts);",
+            "CREATE INDEX IF NOT EXISTS history_ts ON history(ts);",
+            """CREATE TABLE IF NOT EXISTS history_archive (
+                    month text PRIMARY KEY,
+                    table_name text NOT NULL,
+                    rows integer NOT NULL DEFAULT 0
+                );""",
+            "CREATE VIEW IF NOT EXISTS history_all AS SELECT id, account_id, amount, new_balance, ts FROM history;",
+        ],
+        # 7: notes loaded in each terminal's cassettes, a terminal without any dispenses from its balance alone
+        [
+            """CREATE TABLE IF NOT EXISTS atm_cassettes (
+                    terminal_id integer NOT NULL,
+                    denomination integer NOT NULL,
+                    count integer NOT NULL,
+                    PRIMARY KEY (terminal_id, denomination)
+                ) WITHOUT ROWID;""",
+        ],
+        # 8: ledger mode, history is the source of truth and balances are the latest snapshot
+        # plus the history rows after it, ledger_balances derives them for every account
+        [
+            """CREATE TABLE IF NOT EXISTS ledger_state (
+                    id integer PRIMARY KEY CHECK (id = 1),
+                    enabled integer NOT NULL DEFAULT 0,
+                    snapshot_every integer NOT NULL DEFAULT 100
+                );""",
+            "INSERT OR IGNORE INTO ledger_state(id) VALUES(1);",
+            """CREATE TABLE IF NOT EXISTS balance_snapshots (
+                    account_id text NOT NULL,
+                    history_id integer NOT NULL,
+                    balance integer NOT NULL,
+                    ts integer NOT NULL,
+                    PRIMARY KEY (account_id, history_id)
+                ) WITHOUT ROWID;""",
+            "CREATE INDEX IF NOT EXISTS history_account_id ON history(account_id, id);",
+            """CREATE VIEW IF NOT EXISTS ledger_balances AS
+                    SELECT a.account_id AS account_id,
+                           coalesce(s.balance, a.balance) + coalesce(sum(h.amount), 0) AS balance,
+                           coalesce(max(h.id), s.history_id, 0) AS version,
+                           count(h.id) AS pending,
+                           max(h.ts) AS ts
+                    FROM accounts a
+                    LEFT JOIN balance_snapshots s ON s.account_id = a.account_id
+                        AND s.history_id = (SELECT max(history_id) FROM balance_snapshots WHERE account_id = a.account_id)
+                    LEFT JOIN history h ON h.account_id = a.account_id AND h.id > coalesce(s.history_id, 0)
+                    GROUP BY a.account_id;""",
+        ],
+        # 9: per account daily withdrawal limits, NULL for none, and each account's debits per local day
+        [
+            "ALTER TABLE accounts ADD COLUMN daily_limit integer;",
+            """CREATE TABLE IF NOT EXISTS daily_withdrawals (
+                    account_id text NOT NULL,
+                    day text NOT NULL,
+                    total integer NOT NULL,
+                    PRIMARY KEY (account_id, day)
+                ) WITHOUT ROWID;""",
+        ],
+        # 10: the pin lookup is served by the account_id unique index, dbs migrated
+        # before 5 stopped creating accounts_pin still carry it
+        [
+            "DROP INDEX IF EXISTS accounts_pin;",
+        ],
+    ]
+
+    # cachedStatements is the size of the prepared statement cache per connection
+    # it should be at least the number of registered statements
+    # connections come from the shared pool for dbFile and profile unless a pool is given
+    # with writeBehind, history rows outside a transaction and error rows are
+    # group committed by the pool's WriteBehindQueue, in memory dbs always write inline
+    # with cache, account rows and atm balances are read through the pool's AccountCache
+    # history and error rows are timestamped from clock, the real clock unless one is given
+    def __init__(self, dbFile: str, cachedStatements: int = 128, pool: ConnectionPool = None,
+                 profile: str = "default", writeBehind: bool = True, cache: bool = True,
+                 clock: Clock = None) -> None:
+        self.cachedStatements = cachedStatements
+        self.clock = clock if clock is not None else Clock.shared()
+        self.pool = pool if pool is not None else ConnectionPool.get(dbFile, cachedStatements, profile)
+        self.writeBehind = writeBehind and not self.pool.profile.memory
+        self.cache = AccountCache.forPool(self.pool) if cache else None
+        self.metrics = Metrics.shared()
+        self.cursor = self.connect()
+        self.conn = self.cursor.connection
+        self.migrate()
+        if self.pool.ledger is None:
+            self.pool.ledger = self.execute("ledgerSettings").fetchone()
+
+    # True once history is the source of truth for balances, see enableLedgerCmd
+    @property
+    def ledger(self) -> bool:
+        return bool(self.pool.ledger[0])
+
+    # lease a connection to the helper's data base from its pool,
+    # return db cursor to execute commands
+    def connect(self) -> sqlite3.Cursor:
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         return cursor
 
+    # writes any queued rows then gives the connection back to the pool,
+    # the helper can't be used afterwards
+    def close(self) -> None:
+        if self.conn is not None:
+            self.flush()
+            self.pool.release(self.conn)
+            self.conn = None
+            self.cursor = None
+
+    def __enter__(self) -> SQLHelper:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    # applies any migrations the db hasn't seen yet
+    # the version is re-read inside the write lock so concurrent connections
+    # don't apply the same migration twice
+    def migrate(self) -> None:
+        if self.pool.migrated:
+            return
+        if self.cursor.execute("PRAGMA user_version;").fetchone()[0] >= len(self.migrations):
+            self.pool.migrated = True
+            return
+
+        with self.transaction():
+            version = self.cursor.execute("PRAGMA user_version;").fetchone()[0]
+            for migration in self.migrations[version:]:
+                for statement in migration:
+                    self.cursor.execute(statement)
+            self.cursor.execute("PRAGMA user_version = {};".format(len(self.migrations)))
+        self.pool.migrated = True
+
+    # runs a registered statement with the given parameters
+    # table fills in the partition of a history template
+    # timed per statement name when metrics are enabled, rows fetched afterwards aren't included
+    def execute(self, name: str, params: Tuple[object] = (), table: str = None) -> sqlite3.Cursor:
+        statement = self.statements[name] if table is None else self.statements[name].format(table = table)
+        return self.timed(name, self.cursor.execute, statement, params)
+
+    # runs a registered statement once per row of parameters, timed as one call
+    def executeMany(self, name: str, rows: Iterable[Tuple[object]]) -> sqlite3.Cursor:
+        return self.timed(name, self.cursor.executemany, self.statements[name], rows)
+
+    # runs a registered statement on its own cursor so the rows can be streamed
+    # while other statements run through the helper
+    def stream(self, name: str, params: Tuple[object] = (), table: str = None) -> sqlite3.Cursor:
+        statement = self.statements[name] if table is None else self.statements[name].format(table = table)
+        return self.timed(name, self.conn.cursor().execute, statement, params)
+
+    # calls run with args, recorded as the statement name when metrics are enabled
+    def timed(self, name: str, run: Callable[..., sqlite3.Cursor], *args: object) -> sqlite3.Cursor:
+        if not self.metrics.enabled:
+            return run(*args)
+
+        start = time.perf_counter()
+        try:
+            return run(*args)
+        finally:
+            self.metrics.recordStatement(name, time.perf_counter() - start)
+
+    # runs a registered insert nobody reads straight back
+    # queued for the background writer unless it's part of an open transaction,
+    # which keeps postings atomic
+    def queueWrite(self, name: str, params: Tuple[object]) -> None:
+        if self.writeBehind and not self.conn.in_transaction:
+            WriteBehindQueue.forPool(self.pool).add(name, params)
+        else:
+            self.execute(name, params)
+
+    # waits for queued rows to be written so reads see them
+    # skipped inside a transaction, the writer would be waiting on our lock
+    def flush(self) -> None:
+        if not self.writeBehind or self.conn.in_transaction:
+            return
+        writer = WriteBehindQueue.forPool(self.pool, create = False)
+        if writer is not None:
+            writer.flush()
+
+    # wraps the statements run inside the block in a single BEGIN IMMEDIATE/COMMIT
+    # the write lock is taken up front so the transaction can't fail half way on a busy db
+    # rolls back if anything raises, nested blocks become savepoints inside the
+    # outer transaction so a failed inner block only undoes its own statements
+    @contextmanager
+    def transaction(self) -> Iterator[SQLHelper]:
+        if self.conn.in_transaction:
+            self.execute("savepoint")
+            try:
+                yield self
+            except BaseException:
+                self.execute("rollbackSavepoint")
+                self.execute("releaseSavepoint")
+                self.clearCache()
+                raise
+            self.execute("releaseSavepoint")
+            return
+
+        self.execute("begin")
+        try:
+            yield self
+        except BaseException:
+            self.execute("rollback")
+            self.clearCache()
+            raise
+        self.execute("commit")
+
+    # holds one read transaction open for the block so every statement in it
+    # sees the same snapshot of the db, nothing written inside is kept
+    @contextmanager
+    def snapshot(self) -> Iterator[SQLHelper]:
+        self.execute("beginRead")
+        try:
+            yield self
+        finally:
+            self.execute("rollback")
+
+    # cached rows may hold writes that were just rolled back
+    def clearCache(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+
+    # calls fn, retrying up to attempts times while it raises StaleDataError
+    # onConflict runs before each retry, typically to reload the balances fn decides on
+    # the last StaleDataError is raised if every attempt conflicts
+    def retryOnConflict(self, fn: Callable[[], object], attempts: int = 3,
+                        onConflict: Callable[[StaleDataError], None] = None) -> object:
+        for attempt in range(attempts):
+            try:
+                return fn()
+            except StaleDataError as e:
+                if attempt == attempts - 1:
+                    raise
+                if onConflict is not None:
+                    onConflict(e)
+
+    # applies a withdrawal or deposit as one atomic posting
+    # atm cash, account balance and the history row are all committed together
+    # both balances change relative to what's in the db, never to a copy read earlier
+    # the account must hold at least minBalance and less than maxBalance, and the atm
+    # at least minATMBalance, before the posting (None for no bound), otherwise
+    # nothing is written and StaleDataError is raised
+    # notes, {denomination: count}, are taken out of the terminal's cassettes in the same transaction
+    # and StaleDataError is raised if a cassette no longer holds them
+    # returns (balance, version, atm balance, atm version) after the posting
+    def postTransactionCmd(self, accountId: str, amount: int, atmAmount: int, id: int = 1,
+                           minBalance: int = None, maxBalance: int = None,
+                           minATMBalance: int = None, notes: Dict[int, int] = None) -> Tuple[int, int, int, int]:
+        with self.transaction():
+            if notes:
+                self.dispenseNotesCmd(id, notes)
+            atmBalance, atmVersion = self.adjustATMBalanceCmd(atmAmount, id, minATMBalance)
+            balance, version = self.adjustBalanceCmd(accountId, amount, minBalance, maxBalance)
+        return balance, version, atmBalance, atmVersion
+
+    # adds amount to the account balance in the db and records it in history
+    # guarded by minBalance/maxBalance as in postTransactionCmd
+    # the balance, its history row and a debit's daily total are committed together
+    # returns the new (balance, version)
+    def adjustBalanceCmd(self, accountId: str, amount: int, minBalance: int = None,
+                         maxBalance: int = None) -> Tuple[int, int]:
+        if self.ledger:
+            return self.appendPostingCmd(accountId, amount, minBalance, maxBalance)
+        if not self.conn.in_transaction:
+            with self.transaction():
+                return self.adjustBalanceCmd(accountId, amount, minBalance, maxBalance)
+        key = ("account", str(accountId))
+        data = self.execute("adjustBalance", (amount, accountId, minBalance, maxBalance)).fetchall()
+
+        if not data:
+            if self.cache is not None:
+                self.cache.invalidate(key, True)
+            raise StaleDataError("account {} balance is outside [{}, {}).".format(accountId, minBalance, maxBalance))
+
+        balance, version = data[0]
+        if amount < 0:
+            self.addDailyDebitsCmd({accountId: -amount})
+        if self.cache is not None:
+            self.cache.update(key, {3: balance, 4: version})
+        self.updateHistoryCmd(accountId, amount, balance)
+        return balance, version
+
+    # ledger mode posting, a pure append to history
+    # the balance is read from the latest snapshot and the rows after it, checked against
+    # minBalance/maxBalance and the expected version, then the row is appended and a snapshot
+    # taken once snapshotEvery rows have built up since the last one
+    # returns the new (balance, version), the version is the id of the account's latest history row
+    def appendPostingCmd(self, accountId: str, amount: int, minBalance: int = None, maxBalance: int = None,
+                         version: int = None) -> Tuple[int, int]:
+        key = ("account", str(accountId))
+        with self.transaction():
+            state = self.execute("ledgerState", (accountId,)).fetchone()
+            if state is None:
+                raise Exception("No row exists for account {}.".format(accountId))
+            balance, current, pending = state
+            if ((minBalance is not None and balance < minBalance) or (maxBalance is not None and balance >= maxBalance)
+                    or (version is not None and current != version)):
+                if self.cache is not None:
+                    self.cache.invalidate(key, True)
+                raise StaleDataError("account {} balance {} at version {} is outside [{}, {}) or not version {}.".format(
+                    accountId, balance, current, minBalance, maxBalance, version))
+
+            balance += amount
+            ts = Timestamps.now(self.clock)
+            if amount < 0:
+                self.addDailyDebitsCmd({accountId: -amount}, ts)
+            current = self.execute("appendHistory", (accountId, amount, balance, ts)).fetchone()[0]
+            if pending + 1 >= self.pool.ledger[1]:
+                self.execute("takeSnapshot", (str(accountId), current, balance, ts))
+
+        if self.cache is not None:
+            self.cache.update(key, {3: balance, 4: current})
+        return balance, current
+
+    # switches the db to ledger mode, every account is snapshotted at its balance and from then on
+    # postings only append to history, accounts.balance keeps the opening balance of accounts
+    # created afterwards, snapshotEvery is how many rows an account builds up between snapshots
+    # run it while no terminals are posting, sessions already open keep their old mode
+    def enableLedgerCmd(self, snapshotEvery: int = 100) -> None:
+        self.flush()
+        with self.transaction():
+            self.execute("snapshotAccounts")
+            self.execute("enableLedger", (snapshotEvery,))
+        self.pool.ledger = (1, snapshotEvery)
+        self.clearCache()
+
+    # snapshots every account with history after its latest snapshot
+    def snapshotLedgerCmd(self) -> int:
+        with self.transaction():
+            return self.execute("snapshotLedger").rowcount
+
+    # the account's balance after every posting before ts, None if it has no history that early
+    # in ledger mode it's the latest snapshot before ts plus the rows after it,
+    # before that (or without ledger mode) it's the new_balance of the last row before ts
+    def balanceAsOfCmd(self, accountId: str, ts: int) -> int:
+        self.flush()
+        if self.ledger:
+            balance = self.execute("ledgerBalanceAsOf", (str(accountId), ts)).fetchone()[0]
+            if balance is not None:
+                return balance
+        data = self.execute("balanceAsOf", (accountId, ts)).fetchone()
+        return data[0] if data else None
+
+    # adds debits, {account id: amount}, to each account's total for the local day of ts
+    # every debit counts, withdrawals with their overdraft fee and transfers alike, so the totals
+    # can be rebuilt from history, an account that would pass its daily limit raises StaleDataError
+    # runs inside the posting's transaction
+    def addDailyDebitsCmd(self, debits: Dict[str, int], ts: int = None) -> None:
+        day = Timestamps.dayOf(ts if ts is not None else Timestamps.now(self.clock))
+        rows = [(str(accountId), day, amount) for accountId, amount in sorted(debits.items())]
+        if self.executeMany("addDailyDebit", rows).rowcount != len(rows):
+            raise StaleDataError("a debit would pass the daily limit of one of {}.".format(
+                ", ".join(row[0] for row in rows)))
+
+    # the account's debits so far on the local day of ts, one primary key lookup
+    def dailyDebitsCmd(self, accountId: str, ts: int = None) -> int:
+        day = Timestamps.dayOf(ts if ts is not None else Timestamps.now(self.clock))
+        data = self.execute("dailyDebits", (str(accountId), day)).fetchone()
+        return data[0] if data else 0
+
+    # sets the account's daily withdrawal limit, None removes it
+    def setDailyLimitCmd(self, accountId: str, limit: int = None) -> None:
+        if self.execute("setDailyLimit", (limit, accountId)).rowcount == 0:
+            raise Exception("No row exists for account {}.".format(accountId))
+        if self.cache is not None:
+            self.cache.invalidate(("account", str(accountId)))
+
+    # recomputes the daily totals from history in one pass, for every day from the
+    # yyyy-mm-dd date startDate on, or every day when it's None
+    # returns the number of (account, day) totals written
+    def rebuildDailyTotalsCmd(self, startDate: str = None) -> int:
+        self.flush()
+        start = Timestamps.dayStart(startDate) if startDate else 0
+        with self.transaction():
+            self.execute("clearDailyTotals", (Timestamps.dayOf(start),))
+            return self.execute("rebuildDailyTotals", (start,)).rowcount
+
+    # adds amount to the atm cash balance, guarded by minATMBalance as in postTransactionCmd
+    # returns the new (balance, version)
+    def adjustATMBalanceCmd(self, amount: int, id: int = 1, minATMBalance: int = None) -> Tuple[int, int]:
+        key = ("atm", id)
+        data = self.execute("adjustATMBalance", (amount, id, minATMBalance)).fetchall()
+
+        if not data:
+            if self.cache is not None:
+                self.cache.invalidate(key, True)
+            raise StaleDataError("atm {} holds less than {}.".format(id, minATMBalance))
+
+        if self.cache is not None:
+            self.cache.update(key, {0: data[0][0], 1: data[0][1]})
+        return data[0]
+
+    # applies a batch of multi leg postings in one transaction
+    # a posting is a list of (account id, amount) legs, [(a, -50), (b, 50)] moves 50 from a to b
+    # and a single positive leg is a deposit
+    # each account's balance moves once by its net amount across the batch, in account id order
+    # so concurrent batches always take rows in the same order, then every leg's history row
+    # is written, both with one executemany
+    # an account with a debit leg may not end the batch below zero, if one would nothing is written
+    # and StaleDataError is raised, an unknown account raises Exception
+    # debit legs count towards each account's daily limit, a batch that would pass one raises StaleDataError
+    # in ledger mode only the history rows are written, plus snapshots for accounts that are due one
+    # returns {account id: (balance, version)} after the batch
+    def postBatchCmd(self, postings: Iterable[Iterable[Tuple[str, int]]]) -> Dict[str, Tuple[int, int]]:
+        legs = [(str(accountId), amount) for posting in postings for accountId, amount in posting]
+        net: Dict[str, int] = dict()
+        legCounts: Dict[str, int] = dict()
+        # debit legs per account, for the daily totals
+        debits: Dict[str, int] = dict()
+        for accountId, amount in legs:
+            net[accountId] = net.get(accountId, 0) + amount
+            legCounts[accountId] = legCounts.get(accountId, 0) + 1
+            if amount < 0:
+                debits[accountId] = debits.get(accountId, 0) - amount
+        if not legs:
+            return dict()
+
+        accountIds = sorted(net)
+        ts = Timestamps.now(self.clock)
+        with self.transaction():
+            if self.ledger:
+                opening = {a: self.execute("ledgerState", (a,)).fetchone() for a in accountIds}
+                missing = [a for a in accountIds if opening[a] is None]
+                overdrawn = sum(1 for a in debits if opening[a] is not None and opening[a][0] + net[a] < 0)
+            else:
+                updated = self.executeMany("postNet", [(net[a], a, a in debits) for a in accountIds]).rowcount
+                state = {row[0]: (row[1], row[2]) for row in self.execute("batchAccounts", (json.dumps(accountIds),))}
+                missing = [a for a in accountIds if a not in state]
+                overdrawn = len(accountIds) - updated
+            if missing:
+                raise Exception("No account exists for {}.".format(", ".join(missing)))
+            if overdrawn:
+                raise StaleDataError("{} of {} accounts would be overdrawn.".format(overdrawn, len(accountIds)))
+            self.addDailyDebitsCmd(debits, ts)
+
+            # replay the legs from each balance before the batch to get every row's new balance
+            if self.ledger:
+                running = {a: opening[a][0] for a in accountIds}
+            else:
+                running = {a: state[a][0] - net[a] for a in accountIds}
+            rows = list()
+            for accountId, amount in legs:
+                running[accountId] += amount
+                rows.append((accountId, amount, running[accountId], ts))
+            self.executeMany("insertHistory", rows)
+
+            if self.ledger:
+                versions = {str(a): version for a, version in self.execute("batchVersions", (json.dumps(accountIds),))}
+                state = {a: (running[a], versions[a]) for a in accountIds}
+                self.executeMany("takeSnapshot", [(a, versions[a], running[a], ts) for a in accountIds
+                                                  if opening[a][2] + legCounts[a] >= self.pool.ledger[1]])
+
+        if self.cache is not None:
+            for accountId, (balance, version) in state.items():
+                self.cache.update(("account", accountId), {3: balance, 4: version})
+        return state
+
+    # takes notes out of a terminal's cassettes, guarded so no cassette goes below zero
+    def dispenseNotesCmd(self, id: int, notes: Dict[int, int]) -> None:
+        for denomination, count in notes.items():
+            if not self.execute("dispenseNotes", (count, id, denomination)).fetchall():
+                raise StaleDataError("atm {} holds fewer than {} ${} notes.".format(id, count, denomination))
+
     # returns account data bas
+    # (id, account_id, pin, balance, version), served from the cache when possible
     def accountSelectCmd(self, accountId: str) -> List[Tuple[object]]:
-        self.cursor.execute("SELECT * FROM accounts WHERE account_id = '{}';".format(accountId))
+        # in ledger mode the version is derived from history, so the row is always read
+        if not self.ledger:
+            data = self.checkedCache(("account", str(accountId)), "accountVersion", (accountId,), 4)
+            if data is not None:
+                return data
+
+        return self.refreshAccountCmd(accountId)
+
+    # a cached row, if its version still matches the one in the db
+    # another process may have written the row since it was cached, the version lookup is one
+    # primary key read, a row that moved on is dropped as stale and None returned
+    def checkedCache(self, key: Hashable, statement: str, params: Tuple[object], versionIndex: int) -> Tuple[object]:
+        if self.cache is None:
+            return None
+        data = self.cache.get(key)
+        if data is None:
+            return None
+        current = self.execute(statement, params).fetchone()
+        if current is not None and current[0] == data[versionIndex]:
+            return data
+        self.cache.invalidate(key, True)
+        return None
+
+    # reads the account row from the db, skipping and then refreshing the cache
+    def refreshAccountCmd(self, accountId: str) -> List[Tuple[object]]:
+        self.execute("accountSelect", (accountId,))
         data = self.cursor.fetchone()
+        # in ledger mode the balance and version come from history
+        if data is not None and self.ledger:
+            balance, version, pending = self.execute("ledgerState", (accountId,)).fetchone()
+            data = data[:3] + (balance, version) + data[5:]
+
+        if data is not None and self.cache is not None:
+            self.cache.put(("account", str(accountId)), data)
         return data
-    
+
+    # runs a balance update that returns the new row version
+    # with an expected version nothing is written if the row has moved on,
+    # the cached row is dropped and StaleDataError raised
+    def versionedUpdate(self, key: Tuple[str, object], name: str, params: Tuple[object],
+                        version: int) -> int:
+        if version is None:
+            data = self.execute(name, params).fetchall()
+        else:
+            data = self.execute(name + "Versioned", params + (version,)).fetchall()
+
+        if not data:
+            if self.cache is not None:
+                self.cache.invalidate(key, version is not None)
+            if version is None:
+                raise Exception("No row exists for {} {}.".format(*key))
+            raise StaleDataError("{} {} changed since version {}.".format(key[0], key[1], version))
+
+        return data[0][0]
+
     # update account balance
-    # add transaction to history table
-    def updateBalanceCmd(self, accountId: str, amount: int, updatedAmount: int) -> None:
-        self.cursor.execute("UPDATE accounts SET balance = {} WHERE account_id = '{}';".format(updatedAmount, accountId))
+    # add transaction to history table, in the same transaction as the balance
+    # version is the row version the balance was read at, None writes unconditionally
+    # returns the new row version
+    def updateBalanceCmd(self, accountId: str, amount: int, updatedAmount: int, version: int = None) -> int:
+        # in ledger mode the change is appended, so the row must already hold updatedAmount - amount
+        if self.ledger:
+            return self.appendPostingCmd(accountId, amount, updatedAmount - amount, updatedAmount - amount + 1,
+                                         version)[1]
+        if not self.conn.in_transaction:
+            with self.transaction():
+                return self.updateBalanceCmd(accountId, amount, updatedAmount, version)
+        key = ("account", str(accountId))
+        newVersion = self.versionedUpdate(key, "updateBalance", (updatedAmount, accountId), version)
+        if amount < 0:
+            self.addDailyDebitsCmd({accountId: -amount})
+        if self.cache is not None:
+            self.cache.update(key, {3: updatedAmount, 4: newVersion})
         self.updateHistoryCmd(accountId, amount, updatedAmount)
+        return newVersion
 
     # returns transaction history for account
     def getHistoryCmd(self, accountId: str) -> List[Tuple[object]]:
-        self.cursor.execute("""SELECT date, time, amount, new_balance FROM history WHERE account_id = '{}' 
-                                ORDER BY date, time desc;""".format(accountId))
+        self.flush()
+        self.execute("getHistory", (accountId,))
         data = self.cursor.fetchall()
         return data
 
+    # returns up to limit history rows for the account, newest first
+    # after is the cursor returned with the previous page, None for the first page
+    # the returned cursor is None once there are no more rows
+    def getHistoryPage(self, accountId: str, after: Tuple[object] = None,
+                       limit: int = 20) -> Tuple[List[Tuple[object]], Tuple[object]]:
+        self.flush()
+
+        # fetch one extra row to know if another page exists
+        if after is None:
+            self.execute("getHistoryFirstPage", (accountId, limit + 1))
+        else:
+            self.execute("getHistoryNextPage", (accountId, *after, limit + 1))
+        data = self.cursor.fetchall()
+
+        cursor = None
+        if len(data) > limit:
+            data = data[:limit]
+            last = data[-1]
+            cursor = (last[5], last[4])
+
+        return [row[:4] for row in data], cursor
+
     # inserts row into history table with necessary transaction data
     def updateHistoryCmd(self, accountId: str, amount: int, updatedAmount: int) -> None:
-        date = datetime.today().strftime("%Y-%m-%d")
-        time = datetime.now().strftime("%H:%M:%S")
-        self.cursor.execute(
-            """INSERT INTO history(account_id, date, time, amount, new_balance) 
-                VALUES('{}','{}','{}',{},{});""".format(accountId, date, time, amount, updatedAmount))
+        self.queueWrite("insertHistory", (accountId, amount, updatedAmount, Timestamps.now(self.clock)))
+
+    # the account's history for one yyyy-mm month, oldest first, as (date, time, amount, new balance)
+    # reads the month's archive table once it's been archived, plus the hot
+    # table for anything written into the month since
+    def getStatementCmd(self, accountId: str, month: str) -> List[Tuple[object]]:
+        self.flush()
+        start, end = Timestamps.monthBounds(month)
+        archived = self.execute("archivedMonth", (month,)).fetchone()
+
+        rows = list()
+        for table in ([archived[0]] if archived else []) + ["history"]:
+            rows.extend(self.execute("statementPartition", (accountId, start, end), table).fetchall())
+        rows.sort(key = lambda row: (row[4], row[5]))
+        return [row[:4] for row in rows]
+
+    # moves every month older than the newest keepMonths out of the hot history table
+    # each month is copied into its own archive table and deleted from history in one
+    # transaction, so readers see its rows in exactly one place
+    # returns the number of rows archived per month
+    def archiveHistoryCmd(self, keepMonths: int = 3, now: int = None) -> Dict[str, int]:
+        self.flush()
+        cutoff = Timestamps.monthBounds(Timestamps.monthsBefore(Timestamps.monthOf(now or Timestamps.now(self.clock)),
+                                                                keepMonths - 1))[0]
+        archived = dict()
+        # ledger balances only replay the hot table, so no row after a snapshot may be archived
+        if self.ledger:
+            self.snapshotLedgerCmd()
+
+        while True:
+            oldest = self.execute("oldestHotHistory", (cutoff,)).fetchone()[0]
+            if oldest is None:
+                break
+
+            month = Timestamps.monthOf(oldest)
+            table = Timestamps.archiveTable(month)
+            start, end = Timestamps.monthBounds(month)
+            with self.transaction():
+                self.execute("createArchive", (), table)
+                self.execute("indexArchive", (), table)
+                rows = self.execute("copyToArchive", (start, end), table).rowcount
+                self.execute("deleteArchived", (start, end))
+                self.execute("recordArchive", (month, table, rows))
+                self.rebuildHistoryView()
+            archived[month] = rows
+
+        return archived
+
+    # points history_all at the hot table and every archive table
+    def rebuildHistoryView(self) -> None:
+        selects = ["SELECT id, account_id, amount, new_balance, ts FROM {}".format(table)
+                   for table in ["history"] + [row[1] for row in self.execute("archivedMonths").fetchall()]]
+        self.cursor.execute("DROP VIEW IF EXISTS history_all;")
+        self.cursor.execute("CREATE VIEW history_all AS {};".format(" UNION ALL ".join(selects)))
 
     # updates atm balance to updatedAmount
-    def updateATMBalance(self, updatedAmount: int, id: int = 1) -> None:
-        self.cursor.execute("UPDATE atm_balance SET balance = {} WHERE Id = {};".format(updatedAmount, id))
+    # version is the row version the balance was read at, None writes unconditionally
+    # returns the new row version
+    def updateATMBalance(self, updatedAmount: int, id: int = 1, version: int = None) -> int:
+        key = ("atm", id)
+        newVersion = self.versionedUpdate(key, "updateATMBalance", (updatedAmount, id), version)
+        if self.cache is not None:
+            self.cache.update(key, {0: updatedAmount, 1: newVersion})
+        return newVersion
 
     # get the balance of the atm given an id
     def getATMBalanceCmd(self, id: int = 1) -> int:
-        self.cursor.execute("SELECT balance FROM atm_balance WHERE Id = {};".format(id))
+        return self.getATMStateCmd(id)[0]
+
+    # get the (balance, version) of the atm given an id, served from the cache when possible
+    # refresh skips the cache
+    def getATMStateCmd(self, id: int = 1, refresh: bool = False) -> Tuple[int, int]:
+        key = ("atm", id)
+        if not refresh:
+            data = self.checkedCache(key, "atmVersion", (id,), 1)
+            if data is not None:
+                return data
+
+        self.execute("getATMBalance", (id,))
         data = self.cursor.fetchone()
 
         # validate that atm data exists, raise exception if it doesn't
-        if len(data) > 0:
-            balance = data[0]
-        else:
+        if not data:
             raise Exception("No data exists for atm with id {}.".format(id))
 
-        return balance
+        if self.cache is not None:
+            self.cache.put(key, data)
+        return data
+
+    # {denomination: count} loaded in a terminal's cassettes, empty if it has none
+    def getCassettesCmd(self, id: int = 1) -> Dict[int, int]:
+        return dict(self.execute("getCassettes", (id,)).fetchall())
+
+    # replaces the notes in a terminal's cassettes, its balance becomes their total
+    # an empty notes clears the cassettes and leaves the balance as it is
+    # returns the new (balance, version)
+    def loadCassettesCmd(self, id: int, notes: Dict[int, int]) -> Tuple[int, int]:
+        with self.transaction():
+            self.execute("clearCassettes", (id,))
+            for denomination, count in notes.items():
+                if denomination <= 0 or count < 0:
+                    raise Exception("Invalid cassette {} x ${}.".format(count, denomination))
+                self.execute("loadCassette", (id, denomination, count))
+            if notes:
+                self.updateATMBalance(sum(d * count for d, count in notes.items()), id)
+        return self.getATMStateCmd(id, True)
+
+    # adds a terminal to the fleet with the given cash balance, returns its id
+    def addTerminalCmd(self, balance: int = 0) -> int:
+        return self.execute("addTerminal", (balance,)).fetchall()[0][0]
+
+    # cash position across every terminal in one read of the balance index
+    def getFleetCashCmd(self) -> Dict[str, int]:
+        terminals, total, lowest, highest = self.execute("getFleetCash").fetchone()
+        return {"terminals": terminals, "total": total, "lowest": lowest, "highest": highest}
+
+    # terminals holding less than threshold in cash, emptiest first
+    def getLowCashTerminalsCmd(self, threshold: int) -> List[Tuple[int, int]]:
+        return self.execute("getLowCashTerminals", (threshold,)).fetchall()
 
     # inserts line to errors table
     def logErrorCmd(self, accountId: str, error: str) -> None:
         try:
-            timestamp = datetime.now()
+            timestamp = str(datetime.fromtimestamp(self.clock.time()))
 
             # if there is no account id then don't insert
             # otherwise insert
             if not accountId:
-                self.cursor.execute("""INSERT INTO errors(timestamp, error) 
-                                        VALUES('{}', '{}');""".format(timestamp, error))
+                self.queueWrite("logError", (timestamp, error))
             else:
-                self.cursor.execute("""INSERT INTO errors(account_id, timestamp, error) 
-                                        VALUES('{}', '{}', '{}');""".format(accountId, timestamp, error))
+                self.queueWrite("logAccountError", (accountId, timestamp, error))
         # as this is being called from exception block in the controller
         # we need to just aborb the error, most likely a bad sql connection
         except Exception:
             pass
-    
+
+    # the account's (pin_hash, pin) columns, a dummy hash for unknown accounts
+    # so checking a pin against them costs the same either way
+    def pinRecordCmd(self, accountId: str) -> Tuple[str, str]:
+        data = self.execute("pinLookup", (accountId,)).fetchone()
+        return tuple(data) if data is not None else (Pins.dummyHash(), None)
+
+    # checks pin for the account with only the pin columns read
+    # an account still holding a plaintext pin is upgraded to a hash when it matches
+    # checked is the result of Pins.checkPin when the caller already ran it off this thread
+    # returns False for unknown accounts
+    def verifyPinCmd(self, accountId: str, pin: str, checked: Tuple[bool, str] = None) -> bool:
+        if checked is None:
+            checked = Pins.checkPin(pin, *self.pinRecordCmd(accountId))
+        matched, pinHash = checked
+        if pinHash is not None:
+            self.storePinHashCmd(accountId, pinHash)
+        return matched
+
+    # stores a new salted hash for the account's pin and clears any plaintext pin
+    def setPinCmd(self, accountId: str, pin: str, iterations: int = None) -> None:
+        self.storePinHashCmd(accountId, Pins.hashPin(pin, iterations))
+
+    # stores an already computed pin hash and clears any plaintext pin
+    def storePinHashCmd(self, accountId: str, pinHash: str) -> None:
+        self.execute("setPinHash", (pinHash, accountId))
+        if self.cache is not None:
+            self.cache.invalidate(("account", str(accountId)))
+
+    # hashes every plaintext pin left in the db, batchSize accounts per transaction
+    # returns the number of pins hashed
+    def hashPinsCmd(self, batchSize: int = 1000, iterations: int = None) -> int:
+        count = 0
+        while True:
+            with self.transaction():
+                batch = self.execute("plaintextPins", (batchSize,)).fetchall()
+                for accountId, pin in batch:
+                    self.setPinCmd(accountId, pin, iterations)
+            if not batch:
+                return count
+            count += len(batch)
+
+    # inserts accounts from rows of (account id, pin, balance) in chunks of chunkSize
+    # rows can be any iterable (e.g. a generator reading a file) and are consumed a chunk at a time
+    # the whole import is one transaction, a bad row or existing account id imports nothing
+    # pins are hashed before they're written, so no plaintext pin is ever stored
+    # returns the number of accounts imported
+    def importAccountsCmd(self, rows: Iterable[Tuple[str, str, int]], chunkSize: int = 10000,
+                          iterations: int = None) -> int:
+        rows = ((accountId, Pins.hashPin(pin, iterations), balance) for accountId, pin, balance in rows)
+        count = 0
+        try:
+            with self.transaction():
+                while True:
+                    chunk = list(itertools.islice(rows, chunkSize))
+                    if not chunk:
+                        break
+                    self.executeMany("importAccount", chunk)
+                    count += len(chunk)
+        except sqlite3.IntegrityError as e:
+            raise Exception("Account import failed, nothing was imported: {}".format(e))
+        return count
+
+    # streams history rows as (id, account id, date, time, amount, new balance) in time order,
+    # for one account or every account when accountId is None
+    # start and end are inclusive yyyy-mm-dd dates, None for no bound
+    # archived months are read oldest first and then the hot table, skipping months outside the range
+    def exportHistoryCmd(self, accountId: str = None, start: str = None,
+                         end: str = None) -> Iterator[Tuple[object, ...]]:
+        self.flush()
+        low = Timestamps.dayStart(start) if start else 0
+        high = Timestamps.dayEnd(end) if end else 2 ** 62
+
+        partitions = list()
+        for month, table in self.execute("archivedMonths").fetchall():
+            monthStart, monthEnd = Timestamps.monthBounds(month)
+            if monthStart < high and monthEnd > low:
+                partitions.append(table)
+        partitions.append("history")
+
+        for table in partitions:
+            if accountId is None:
+                yield from self.stream("exportPartition", (low, high), table)
+            else:
+                yield from self.stream("exportAccountPartition", (accountId, low, high), table)
+
     # below methods are just used for testing...
 
-    # get first account
+    # pin a test fixture gives the first account with setPinCmd, pins are only stored hashed
+    testPin = "7386"
+
+    # get first account and testPin, never changes the account
     def getSingleAccountCmd(self) -> Tuple[object]:
-        self.cursor.execute("SELECT account_id, pin FROM accounts LIMIT 1;")
-        return self.cursor.fetchone()
+        return self.execute("getSingleAccount").fetchone()[0], self.testPin
 
     # clear account history
     def clearAccountHistoryCmd(self, accountId: str) -> None:
-        self.cursor.execute("DELETE FROM history WHERE account_id = '{}';".format(accountId))
+        self.flush()
+        self.execute("clearAccountHistory", (accountId,))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+from typing import Dict, List
+from urllib.parse import quote
+import os, sqlite3
+
+class StorageProfile:
+    # durability / speed trade off applied to every connection as it's opened
+    # pragmas are run in order right after connect
+    # memory profiles keep the database in a shared cache in memory database,
+    # seeded from the file when it exists, so nothing is ever written to disk
+    def __init__(self, name: str, pragmas: List[str], memory: bool = False) -> StorageProfile:
+        self.name = name
+        self.pragmas = pragmas
+        self.memory = memory
+
+    # returns a registered profile by name
+    @classmethod
+    def get(cls, name: str) -> StorageProfile:
+        profile = profiles.get(name)
+        if profile is None:
+            raise Exception("Unknown storage profile {}. Expected one of: {}.".format(name, ", ".join(profiles)))
+        return profile
+
+    # opens a connection to dbFile with the profile applied
+    # seed copies the file into a memory database, only wanted for its first connection
+    def connect(self, dbFile: str, seed: bool = False, **kwargs) -> sqlite3.Connection:
+        if self.memory:
+            uri = "file:{}?mode=memory&cache=shared".format(quote(os.path.abspath(dbFile)))
+            conn = sqlite3.connect(uri, uri = True, **kwargs)
+            if seed and os.path.exists(dbFile):
+                source = sqlite3.connect(dbFile)
+                source.backup(conn)
+                source.close()
+        else:
+            conn = sqlite3.connect(dbFile, **kwargs)
+
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+profiles: Dict[str, StorageProfile] = {
+    # sqlite defaults, rollback journal with a full sync on every commit
+    "default": StorageProfile("default", []),
+    # readers don't block the writer, every commit is still synced
+    "strict": StorageProfile("strict", [
+        "PRAGMA journal_mode = WAL;",
+        "PRAGMA synchronous = FULL;",
+    ]),
+    # only checkpoints sync, a power loss can drop the last commits but never corrupts
+    "balanced": StorageProfile("balanced", [
+        "PRAGMA journal_mode = WAL;",
+        "PRAGMA synchronous = NORMAL;",
+        "PRAGMA mmap_size = 268435456;",
+        "PRAGMA cache_size = -65536;",
+        "PRAGMA temp_store = MEMORY;",
+    ]),
+    # throwaway in memory copy of the database for tests and simulations
+    "test": StorageProfile("test", [
+        "PRAGMA synchronous = OFF;",
+    ], memory = True),
+}
@@ -0,0 +1,52 @@
+from __future__ import annotations
+from Classes.SQLHelper import SQLHelper
+from Classes.Dispenser import Dispenser
+from Classes.Clock import Clock
+import typing
+
+class Terminal:
+    # state shared by every ATM session running against one physical terminal
+    # the cash balance and the db writer live here so concurrent sessions
+    # dispense from the same cash and post through the same connection
+    # profile is the storage profile used when the terminal opens its own connection,
+    # clock is the one it timestamps rows with
+    def __init__(self, db: str = "Data/atmdb.db", terminalId: int = 1, sql: SQLHelper = None,
+                 profile: str = "default", clock: Clock = None) -> Terminal:
+        self.db = db
+        self.terminalId = terminalId
+        # only close the connection if the terminal opened it
+        self.ownsSql = sql is None
+        self.sql = sql if sql is not None else SQLHelper(db, profile = profile, clock = clock)
+        # row version the balance was read at, writes fail if the db has moved on
+        self.balance, self.version = self.sql.getATMStateCmd(terminalId)
+        # notes in the terminal's cassettes, None for a terminal that only tracks its balance
+        self.dispenser = self.loadDispenser()
+
+    def loadDispenser(self) -> Dispenser:
+        notes = self.sql.getCassettesCmd(self.terminalId)
+        return Dispenser(notes) if notes else None
+
+    # replaces the notes in the cassettes, the balance becomes their total
+    def loadCassettes(self, notes: typing.Dict[int, int]) -> None:
+        self.balance, self.version = self.sql.loadCassettesCmd(self.terminalId, notes)
+        self.dispenser = self.loadDispenser()
+
+    # updates terminal cash balance in memory and in db
+    # to specified amount
+    def updateBalance(self, amount: int) -> None:
+        self.version = self.sql.updateATMBalance(amount, self.terminalId, self.version)
+        self.balance = amount
+
+    # reloads the balance and cassettes from the db after another process changed them
+    def refresh(self) -> None:
+        self.balance, self.version = self.sql.getATMStateCmd(self.terminalId, True)
+        notes = self.sql.getCassettesCmd(self.terminalId)
+        if self.dispenser is not None and notes:
+            self.dispenser.load(notes)
+        else:
+            self.dispenser = Dispenser(notes) if notes else None
+
+    # releases the terminal's connection back to the pool
+    def close(self) -> None:
+        if self.ownsSql:
+            self.sql.close()
@@ -0,0 +1,55 @@
+from __future__ import annotations
+from typing import Tuple
+from Classes.Clock import Clock
+import re, time
+
+# history timestamps are unix seconds, shown and grouped into days and months in local time
+# months are written yyyy-mm, archived months live in tables named history_yyyy_mm
+
+monthPattern = re.compile(r"([0-9]{4})-(0[1-9]|1[0-2])")
+
+# the current unix time on clock, the real clock when none is given
+def now(clock: Clock = None) -> int:
+    return int((clock or Clock.shared()).time())
+
+# unix time of local midnight at the start of a yyyy-mm-dd date
+def dayStart(date: str) -> int:
+    return int(time.mktime(time.strptime(date, "%Y-%m-%d")))
+
+# unix time of local midnight at the end of a yyyy-mm-dd date
+def dayEnd(date: str) -> int:
+    day = time.strptime(date, "%Y-%m-%d")
+    # mktime rolls the day past the end of the month over
+    return int(time.mktime((day.tm_year, day.tm_mon, day.tm_mday + 1, 0, 0, 0, 0, 0, -1)))
+
+# yyyy-mm-dd local date a unix time falls on
+def dayOf(ts: int) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+# [start, end) unix times of a yyyy-mm month
+def monthBounds(month: str) -> Tuple[int, int]:
+    match = monthPattern.fullmatch(month)
+    if match is None:
+        raise Exception("Invalid month {}. Expected yyyy-mm.".format(month))
+    year, number = int(match.group(1)), int(match.group(2))
+    nextYear, nextNumber = (year + 1, 1) if number == 12 else (year, number + 1)
+    # mktime picks daylight saving itself with isdst -1
+    start = time.mktime((year, number, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((nextYear, nextNumber, 1, 0, 0, 0, 0, 0, -1))
+    return int(start), int(end)
+
+# yyyy-mm month a unix time falls in
+def monthOf(ts: int) -> str:
+    return time.strftime("%Y-%m", time.localtime(ts))
+
+# the month count months before the given one
+def monthsBefore(month: str, count: int) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    index = year * 12 + number - 1 - count
+    return "{:04d}-{:02d}".format(index // 12, index % 12 + 1)
+
+# archive table holding a month's history
+def archiveTable(month: str) -> str:
+    if monthPattern.fullmatch(month) is None:
+        raise Exception("Invalid month {}. Expected yyyy-mm.".format(month))
+    return "history_{}".format(month.replace("-", "_"))
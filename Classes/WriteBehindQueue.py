@@ -0,0 +1,152 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from threading import Lock, Thread
+import atexit, queue, sqlite3, sys, time
+
+if TYPE_CHECKING:
+    from Classes.ConnectionPool import ConnectionPool
+
+class WriteBehindQueue:
+    # group commit writer for rows nobody waits on (history outside a posting, errors)
+    # rows are queued on the request path and a background thread writes them
+    # with executemany in one transaction per batch
+    # the queue is bounded, callers block once it's full (backpressure)
+    # a batch that can't be written is dropped, counted and reported on stderr,
+    # flush tells the caller how many rows were dropped since the last flush
+    writers: Dict[int, WriteBehindQueue] = dict()
+    writersLock = Lock()
+
+    def __init__(self, pool: ConnectionPool, maxRows: int = 10000, batchSize: int = 500,
+                 flushInterval: float = 0.05) -> WriteBehindQueue:
+        self.pool = pool
+        # most rows written in one transaction
+        self.batchSize = batchSize
+        # seconds a row may wait for more rows to join its batch
+        self.flushInterval = flushInterval
+        self.queue = queue.Queue(maxRows)
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        # rows dropped since the last flush, and why the last batch was
+        self.unreported = 0
+        self.lastError = None
+        self.lock = Lock()
+        self.isClosed = False
+        self.thread = Thread(target = self.run, name = "WriteBehindQueue", daemon = True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # returns the writer shared by every helper on a pool
+    # started on first use unless create is False, in which case None is returned
+    @classmethod
+    def forPool(cls, pool: ConnectionPool, create: bool = True) -> WriteBehindQueue:
+        with cls.writersLock:
+            writer = cls.writers.get(id(pool))
+            if writer is None or writer.pool is not pool or writer.isClosed:
+                if not create:
+                    return None
+                writer = WriteBehindQueue(pool)
+                cls.writers[id(pool)] = writer
+            return writer
+
+    # queues a registered statement, blocks while the queue is full
+    def add(self, name: str, params: Tuple[object]) -> None:
+        self.queue.put((name, params))
+
+    # number of rows waiting to be written
+    def pending(self) -> int:
+        return self.queue.unfinished_tasks
+
+    # waits until every row queued so far has been written or dropped
+    # returns the number of rows dropped since the last flush
+    def flush(self) -> int:
+        self.queue.join()
+        with self.lock:
+            dropped, self.unreported = self.unreported, 0
+        return dropped
+
+    # writes whatever is queued and stops the thread
+    def close(self) -> None:
+        self.isClosed = True
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    # writer thread, collects a batch then commits it
+    # every row taken off the queue is marked done whatever happens to its batch,
+    # so flush can't wait on a writer that has given up
+    def run(self) -> None:
+        # imported here as SQLHelper uses this class
+        from Classes.SQLHelper import SQLHelper
+        # opened on the first batch, and again after a batch that couldn't lease a connection
+        sql = None
+        stop = False
+
+        while not stop:
+            item = self.queue.get()
+            batch = list()
+            deadline = time.monotonic() + self.flushInterval
+
+            # keep collecting until the batch is full or the first row has waited long enough
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batchSize:
+                    break
+                try:
+                    item = self.queue.get(timeout = max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            stop = item is None
+
+            try:
+                if batch:
+                    if sql is None:
+                        sql = SQLHelper(self.pool.dbFile, pool = self.pool, writeBehind = False)
+                    self.write(sql, batch)
+            except Exception as e:
+                self.drop(batch, e)
+            finally:
+                for i in range(len(batch) + (1 if stop else 0)):
+                    self.queue.task_done()
+
+        if sql is not None:
+            sql.close()
+
+    # commits a batch, statements grouped so each runs once through executemany
+    # retried a few times if the db stays locked, then dropped
+    def write(self, sql: SQLHelper, batch: List[Tuple[str, Tuple[object]]]) -> None:
+        grouped: Dict[str, List[Tuple[object]]] = dict()
+        for name, params in batch:
+            grouped.setdefault(name, list()).append(params)
+
+        for attempt in range(3):
+            try:
+                with sql.transaction():
+                    for name, rows in grouped.items():
+                        sql.executeMany(name, rows)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except sqlite3.OperationalError as e:
+                error = e
+                time.sleep(0.05 * (attempt + 1))
+
+        self.drop(batch, error)
+
+    # counts a batch that couldn't be written and reports it
+    def drop(self, batch: List[Tuple[str, Tuple[object]]], error: Exception) -> None:
+        with self.lock:
+            self.failed += len(batch)
+            self.unreported += len(batch)
+            self.lastError = str(error)
+        sys.stderr.write("write behind queue for {} dropped {} rows: {}\n".format(self.pool.dbFile, len(batch), error))
+
+    # queue counters for monitoring
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending(),
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "lastError": self.lastError,
+        }
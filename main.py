@@ -1,8 +1,17 @@
 from Classes.ATM import ATM
+from Classes.ATMServer import ATMServer
+from Classes.BatchRunner import BatchRunner
 from Classes.ControllerResponse import ControllerResponse
+from Classes.Reconciler import Reconciler
+from Classes.Metrics import Metrics
+from Classes.SQLHelper import SQLHelper
+from Classes.Clock import VirtualClock
+from Classes import BulkIO, Pins, Timestamps
+import argparse, asyncio, sys, time
 
-if __name__ == "__main__":
-    atmObj = ATM()
+# reads commands from the terminal until end is given
+def runInteractive(inactiveTime: int, db: str, profile: str, terminalId: int) -> None:
+    atmObj = ATM(inactiveTime, db, profile = profile, terminalId = terminalId)
     end = False
     print("Welcome to ATM-Bot 2000. Please enter a command!\n")
 
@@ -14,6 +23,194 @@ if __name__ == "__main__":
         # print message if it exists
         if response.message:
             print("{}\n".format(response.message))
-        
+
         # update end flag base on response
-        end = response.end
\ No newline at end of file
+        end = response.end
+
+    atmObj.close()
+
+# replays a command file (or stdin for -) and reports throughput on stderr
+# with a start date the session runs on a virtual clock from midnight that day, moved on by @advance lines
+def runScript(script: str, db: str, profile: str, terminalId: int, singleTransaction: bool,
+              startDate: str = None) -> None:
+    clock = VirtualClock(Timestamps.dayStart(startDate)) if startDate else None
+    atmObj = ATM(None, db, profile = profile, terminalId = terminalId, clock = clock)
+    runner = BatchRunner(atmObj, singleTransaction)
+
+    if script == "-":
+        stats = runner.run(sys.stdin, sys.stdout)
+    else:
+        with open(script, buffering = 1 << 20) as lines:
+            stats = runner.run(lines, sys.stdout)
+
+    atmObj.close()
+    sys.stderr.write("{} commands in {:.2f}s ({:.0f} commands/sec), {} errors\n".format(
+        stats["commands"], stats["seconds"], stats["commandsPerSecond"], stats["errors"]))
+
+# checks balances against history and prints a discrepancy report
+# exits non zero when anything doesn't reconcile
+def runReconcile(db: str, profile: str, workers: int) -> None:
+    reconciler = Reconciler(db, workers, profile = profile)
+    discrepancies = reconciler.run()
+
+    for discrepancy in discrepancies:
+        print(discrepancy)
+
+    stats = reconciler.stats()
+    sys.stderr.write("{} accounts, {} history rows in {:.2f}s ({:.0f} rows/sec), {} discrepancies\n".format(
+        stats["accounts"], stats["rows"], stats["seconds"], stats["rowsPerSecond"], len(discrepancies)))
+    sys.exit(1 if discrepancies else 0)
+
+# imports accounts from a csv or jsonl file (- for stdin) in one transaction
+def runImport(path: str, db: str, profile: str, format: str) -> None:
+    format = format or BulkIO.formatFor(path)
+    start = time.perf_counter()
+
+    with SQLHelper(db, profile = profile) as sql:
+        if path == "-":
+            count = sql.importAccountsCmd(BulkIO.readAccounts(sys.stdin, format))
+        else:
+            with open(path, newline = "", buffering = 1 << 20) as lines:
+                count = sql.importAccountsCmd(BulkIO.readAccounts(lines, format))
+
+    sys.stderr.write("{} accounts imported in {:.2f}s\n".format(count, time.perf_counter() - start))
+
+# exports history for one account or all of them, optionally between two dates, to a file (- for stdout)
+def runExport(path: str, db: str, profile: str, format: str, accountId: str, startDate: str, endDate: str) -> None:
+    format = format or BulkIO.formatFor(path)
+    start = time.perf_counter()
+
+    with SQLHelper(db, profile = profile) as sql:
+        rows = sql.exportHistoryCmd(accountId, startDate, endDate)
+        if path == "-":
+            count = BulkIO.writeHistory(rows, sys.stdout, format)
+        else:
+            with open(path, "w", newline = "", buffering = 1 << 20) as out:
+                count = BulkIO.writeHistory(rows, out, format)
+
+    sys.stderr.write("{} history rows exported in {:.2f}s\n".format(count, time.perf_counter() - start))
+
+# hashes every plaintext pin left in the db
+def runHashPins(db: str, profile: str) -> None:
+    start = time.perf_counter()
+    with SQLHelper(db, profile = profile) as sql:
+        count = sql.hashPinsCmd()
+    sys.stderr.write("{} pins hashed in {:.2f}s\n".format(count, time.perf_counter() - start))
+
+# moves months older than keepMonths out of the hot history table
+def runArchive(db: str, profile: str, keepMonths: int) -> None:
+    start = time.perf_counter()
+    with SQLHelper(db, profile = profile) as sql:
+        archived = sql.archiveHistoryCmd(keepMonths)
+    for month, rows in archived.items():
+        print("{} {} rows".format(month, rows))
+    sys.stderr.write("{} months archived in {:.2f}s\n".format(len(archived), time.perf_counter() - start))
+
+# switches the db to the append only ledger
+def runEnableLedger(db: str, profile: str, snapshotEvery: int) -> None:
+    start = time.perf_counter()
+    with SQLHelper(db, profile = profile) as sql:
+        sql.enableLedgerCmd(snapshotEvery)
+    sys.stderr.write("ledger enabled in {:.2f}s, snapshots every {} postings\n".format(
+        time.perf_counter() - start, snapshotEvery))
+
+# sets an account's daily withdrawal limit, none removes it
+def runDailyLimit(limit: str, db: str, profile: str, accountId: str) -> None:
+    if accountId is None:
+        sys.exit("--daily-limit needs --account.")
+    try:
+        amount = None if limit.lower() == "none" else int(limit)
+    except ValueError:
+        sys.exit("Invalid daily limit {}. Expected an amount or none.".format(limit))
+    with SQLHelper(db, profile = profile) as sql:
+        sql.setDailyLimitCmd(accountId, amount)
+    print("account {} daily limit {}".format(accountId, "none" if amount is None else "${}".format(amount)))
+
+# recomputes the daily withdrawal totals from history, from startDate on when given
+def runRebuildDailyTotals(db: str, profile: str, startDate: str) -> None:
+    start = time.perf_counter()
+    with SQLHelper(db, profile = profile) as sql:
+        count = sql.rebuildDailyTotalsCmd(startDate)
+    sys.stderr.write("{} daily totals rebuilt in {:.2f}s\n".format(count, time.perf_counter() - start))
+
+# loads a terminal's cassettes from denomination=count pairs, e.g. 20=500,50=200,100=100
+def runLoadCassettes(spec: str, db: str, profile: str, terminalId: int) -> None:
+    try:
+        notes = {int(d): int(count) for d, count in (pair.split("=") for pair in spec.split(","))}
+    except ValueError:
+        sys.exit("Invalid cassettes {}. Expected denomination=count pairs.".format(spec))
+    with SQLHelper(db, profile = profile) as sql:
+        balance, version = sql.loadCassettesCmd(terminalId, notes)
+    print("terminal {} holds ${} in {}".format(terminalId, balance,
+          ", ".join("{} x ${}".format(count, d) for d, count in sorted(notes.items()))))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "ATM-Bot 2000")
+    parser.add_argument("--serve", action = "store_true", help = "serve many sessions over TCP instead of the terminal")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8888)
+    parser.add_argument("--db", default = "Data/atmdb.db")
+    parser.add_argument("--terminal", type = int, default = 1, help = "id of the terminal (atm_balance row) to run as")
+    parser.add_argument("--inactive", type = int, default = 120, help = "inactivity logout in seconds")
+    parser.add_argument("--script", help = "run commands from a file (- for stdin) instead of the terminal")
+    parser.add_argument("--transaction", action = "store_true", help = "run the whole script in one db transaction")
+    parser.add_argument("--clock", metavar = "DATE",
+                        help = "run the script on a virtual clock starting at this yyyy-mm-dd date")
+    parser.add_argument("--reconcile", action = "store_true", help = "check balances against history and exit")
+    parser.add_argument("--workers", type = int, help = "reconcile worker processes, defaults to the cpu count")
+    parser.add_argument("--import-accounts", metavar = "FILE", help = "import accounts from csv or jsonl and exit")
+    parser.add_argument("--export-history", metavar = "FILE", help = "export history as csv or jsonl and exit")
+    parser.add_argument("--account", help = "only export this account's history, or the account to set a limit for")
+    parser.add_argument("--from", dest = "startDate", help = "export history, or rebuild daily totals, from this yyyy-mm-dd date")
+    parser.add_argument("--to", dest = "endDate", help = "export history up to this yyyy-mm-dd date")
+    parser.add_argument("--format", choices = BulkIO.formats, help = "import/export format, picked from the file name by default")
+    parser.add_argument("--archive-history", action = "store_true",
+                        help = "move cold months of history into monthly archive tables and exit")
+    parser.add_argument("--keep-months", type = int, default = 3, help = "months of history kept in the hot table")
+    parser.add_argument("--enable-ledger", action = "store_true",
+                        help = "make history the source of truth for balances and exit")
+    parser.add_argument("--snapshot-every", type = int, default = 100, help = "postings per account between ledger snapshots")
+    parser.add_argument("--daily-limit", metavar = "AMOUNT",
+                        help = "set the --account's daily withdrawal limit (none to remove it) and exit")
+    parser.add_argument("--rebuild-daily-totals", action = "store_true",
+                        help = "recompute daily withdrawal totals from history and exit")
+    parser.add_argument("--load-cassettes", metavar = "NOTES",
+                        help = "load the terminal's cassettes from denomination=count pairs and exit")
+    parser.add_argument("--hash-pins", action = "store_true", help = "hash any plaintext pins and exit")
+    parser.add_argument("--pin-iterations", type = int, default = Pins.defaultIterations,
+                        help = "pbkdf2 rounds for newly hashed pins")
+    parser.add_argument("--metrics", action = "store_true", help = "record command and statement timings for the stats command")
+    parser.add_argument("--profile", default = "default", choices = ["default", "strict", "balanced", "test"],
+                        help = "storage durability profile")
+    args = parser.parse_args()
+
+    if args.metrics:
+        Metrics.shared().enable()
+    Pins.defaultIterations = args.pin_iterations
+
+    if args.serve:
+        server = ATMServer(args.host, args.port, args.inactive, args.db, args.profile, args.terminal)
+        print("Serving on {}:{}".format(args.host, args.port))
+        asyncio.run(server.serveForever())
+    elif args.import_accounts:
+        runImport(args.import_accounts, args.db, args.profile, args.format)
+    elif args.export_history:
+        runExport(args.export_history, args.db, args.profile, args.format, args.account, args.startDate, args.endDate)
+    elif args.archive_history:
+        runArchive(args.db, args.profile, args.keep_months)
+    elif args.enable_ledger:
+        runEnableLedger(args.db, args.profile, args.snapshot_every)
+    elif args.daily_limit:
+        runDailyLimit(args.daily_limit, args.db, args.profile, args.account)
+    elif args.rebuild_daily_totals:
+        runRebuildDailyTotals(args.db, args.profile, args.startDate)
+    elif args.load_cassettes:
+        runLoadCassettes(args.load_cassettes, args.db, args.profile, args.terminal)
+    elif args.hash_pins:
+        runHashPins(args.db, args.profile)
+    elif args.reconcile:
+        runReconcile(args.db, args.profile, args.workers)
+    elif args.script:
+        runScript(args.script, args.db, args.profile, args.terminal, args.transaction, args.clock)
+    else:
+        runInteractive(args.inactive, args.db, args.profile, args.terminal)